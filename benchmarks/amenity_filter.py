@@ -0,0 +1,104 @@
+"""Amenity filtering: one join per amenity vs the amenity bitmask.
+
+Seeds listings with amenity mappings (common amenities such as parking on
+most listings, rare ones on few) and times counting the matches and
+fetching the first page for 1-5 required amenities, once with a join
+against the mapping table per amenity and once with the
+``amenity_mask`` predicate::
+
+    python -m benchmarks.amenity_filter --sizes 10000,100000
+"""
+import argparse
+import random
+
+from benchmarks.harness import (
+    bench_owner, measure, parse_sizes, print_table, setup_django, synthetic_property,
+    test_database,
+)
+
+# (name, share of listings having it)
+AMENITIES = [
+    ('Parking', 0.7), ('Power Backup', 0.6), ('Lift', 0.55), ('Security', 0.5),
+    ('Gym', 0.35), ('Pool', 0.2), ('Clubhouse', 0.2), ('Garden', 0.3),
+    ('Play Area', 0.25), ('CCTV', 0.4), ('Intercom', 0.3), ('Rainwater Harvesting', 0.15),
+    ('Jogging Track', 0.1), ('Tennis Court', 0.05), ('Spa', 0.04), ('Home Theatre', 0.03),
+]
+COMBINATIONS = [
+    ('Parking',),
+    ('Parking', 'Lift'),
+    ('Gym', 'Pool', 'Parking'),
+    ('Gym', 'Pool', 'Parking', 'Security', 'Lift'),
+    ('Tennis Court', 'Spa'),
+]
+PAGE_SIZE = 20
+
+
+def seed(owner, start, stop, amenities, seed=0, batch_size=5000):
+    from nal_backend.apps.properties.amenities import mask_for
+    from nal_backend.apps.properties.models import Property, PropertyAmenityMapping
+
+    rng = random.Random(seed + start)
+    for batch_start in range(start, stop, batch_size):
+        properties = []
+        chosen = []
+        for index in range(batch_start, min(batch_start + batch_size, stop)):
+            property_obj = synthetic_property(rng, owner, index)
+            picked = [amenity for amenity, (_, share) in zip(amenities, AMENITIES) if rng.random() < share]
+            property_obj.amenity_mask = mask_for(amenity.bit for amenity in picked)
+            properties.append(property_obj)
+            chosen.append(picked)
+        Property.objects.bulk_create(properties)
+        # MySQL does not return the primary keys of bulk inserted rows
+        ids = dict(Property.objects.filter(uuid__in=[property_obj.uuid for property_obj in properties]).values_list(
+            'uuid', 'id'
+        ))
+        PropertyAmenityMapping.objects.bulk_create([
+            PropertyAmenityMapping(property_id=ids[property_obj.uuid], amenity=amenity)
+            for property_obj, picked in zip(properties, chosen)
+            for amenity in picked
+        ], batch_size=batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from nal_backend.apps.properties.amenities import filter_by_amenities
+    from nal_backend.apps.properties.models import Property, PropertyAmenity
+
+    rows = []
+    with test_database():
+        owner = bench_owner()
+        amenities = {name: PropertyAmenity.objects.create(name=name) for name, _ in AMENITIES}
+        ordered = [amenities[name] for name, _ in AMENITIES]
+        seeded = 0
+        for size in parse_sizes(args.sizes):
+            seed(owner, seeded, size, ordered)
+            seeded = size
+            published = Property.objects.filter(status='PUBLISHED')
+            for names in COMBINATIONS:
+                wanted = [amenities[name] for name in names]
+                joined = published
+                for amenity in wanted:
+                    joined = joined.filter(amenities__amenity=amenity)
+                masked = filter_by_amenities(published, wanted)
+
+                page = lambda queryset: list(queryset.order_by('-created_at', '-id').values_list('id', flat=True)[:PAGE_SIZE])
+                assert joined.count() == masked.count() and page(joined) == page(masked)
+                timings = [
+                    measure(lambda: queryset.count(), repeat=args.repeat)['p50']
+                    for queryset in (joined, masked)
+                ] + [
+                    measure(lambda: page(queryset), repeat=args.repeat)['p50']
+                    for queryset in (joined, masked)
+                ]
+                rows.append([size, ' + '.join(names), masked.count(), *[f'{timing:.2f}' for timing in timings]])
+    print_table(['listings', 'amenities', 'matches', 'join count ms', 'mask count ms',
+                 'join page ms', 'mask page ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
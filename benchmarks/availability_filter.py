@@ -0,0 +1,86 @@
+"""Cross-property availability search: per-property slot logic vs the index.
+
+Seeds listings and bookings for one weekday (a share of listings with a
+morning booked solid, others with a few bookings) and compares answering
+"which listings have a free slot between 9 and 12" by computing every
+listing's day from its slots and bookings (two set-based queries plus the
+slot logic in Python) against the ``available_on`` filter, which reads the
+precomputed ``PropertyAvailability`` rows::
+
+    python -m benchmarks.availability_filter --sizes 10000,100000
+"""
+import argparse
+import random
+from datetime import date, time, timedelta
+
+from benchmarks.harness import bench_owner, measure, parse_sizes, print_table, seed_properties, setup_django, test_database
+
+PAGE_SIZE = 20
+
+
+def seed_bookings(property_ids, day, rng, batch_size=5000):
+    from django.contrib.auth import get_user_model
+    from nal_backend.apps.bookings.models import Booking
+
+    buyer, _ = get_user_model().objects.get_or_create(email='bench-buyer@example.com', defaults={'username': 'bench-buyer'})
+    bookings = []
+    for property_id in property_ids:
+        share = rng.random()
+        # A fifth booked solid in the morning, the rest a few random hours
+        hours = range(9, 12) if share < 0.2 else rng.sample(range(9, 18), rng.randint(0, 3))
+        for seat_hour in hours:
+            bookings.append(Booking(
+                user=buyer, property_id=property_id, booking_date=day, booking_time=time(seat_hour), seat=1,
+                contact_name='Bench Buyer', contact_phone='9876543210', contact_email=buyer.email,
+            ))
+    Booking.objects.bulk_create(bookings, batch_size=batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from nal_backend.apps.bookings import availability, availability_index, occupancy
+    from nal_backend.apps.properties.models import Property
+
+    rows = []
+    rng = random.Random(0)
+    day = date.today() + timedelta(days=7 - date.today().weekday() + 7)
+    with test_database():
+        owner = bench_owner()
+        seeded = 0
+        for size in parse_sizes(args.sizes):
+            seed_properties(owner, seeded, size)
+            new_ids = list(Property.objects.order_by('id').values_list('id', flat=True)[seeded:size])
+            seed_bookings(new_ids, day, rng)
+            for start in range(0, len(new_ids), 1000):
+                occupancy.rebuild(new_ids[start:start + 1000], day, day)
+            seeded = size
+            published = Property.objects.filter(status='PUBLISHED')
+            window = availability_index.hour_mask(9, 12)
+
+            def compute():
+                ids = list(published.values_list('id', flat=True))
+                days = availability.load_days(ids, day, day + timedelta(days=1))
+                return sorted(
+                    property_id for property_id in ids
+                    if availability.free_hours(days[property_id, day], days[property_id, day + timedelta(days=1)]) & window
+                )
+
+            indexed = availability_index.filter_available(published, day, 9, 12)
+            expected = compute()
+            assert sorted(indexed.values_list('id', flat=True)) == expected
+            timings = [
+                measure(compute, repeat=args.repeat, warmup=1)['p50'],
+                measure(lambda: indexed.count(), repeat=args.repeat)['p50'],
+                measure(lambda: list(indexed.order_by('-created_at', '-id')[:PAGE_SIZE]), repeat=args.repeat)['p50'],
+            ]
+            rows.append([size, len(expected), *[f'{timing:.1f}' for timing in timings]])
+    print_table(['listings', 'free 9-12', 'slot logic ms', 'index count ms', 'index page ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Concurrent slot reservation: many threads racing for the same slots.
+
+For each slot ``--threads`` buyers are released at once (one database
+connection per thread) and every buyer tries to book it; the slot has
+``--capacity`` seats. Three strategies are compared:
+
+* ``naive``: the old ``count()`` check followed by ``create()``,
+* ``locked``: the same under one process-wide lock (what a serializing
+  global lock would give, at best),
+* ``seats``: ``reservations.reserve`` with the unique seat constraint.
+
+The run fails if the seat strategy ever books a slot past its capacity::
+
+    python -m benchmarks.booking_contention --threads 16 --slots 200 --capacity 2
+"""
+import argparse
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta, time as clock
+
+from benchmarks.harness import bench_owner, print_table, seed_properties, setup_django, test_database
+
+
+def contact(user):
+    return {
+        'user': user,
+        'contact_name': 'Bench Buyer',
+        'contact_phone': '9876543210',
+        'contact_email': user.email,
+        'virtual_tour_token': '',
+    }
+
+
+def naive_book(capacity, **fields):
+    from nal_backend.apps.bookings.models import Booking
+    from nal_backend.apps.bookings.reservations import SlotUnavailable
+
+    taken = Booking.objects.filter(
+        property_id=fields['property_id'], booking_date=fields['booking_date'],
+        booking_time=fields['booking_time'], status__in=['PENDING', 'CONFIRMED'],
+    ).count()
+    if taken >= capacity:
+        raise SlotUnavailable()
+    return Booking.objects.create(**fields)
+
+
+GLOBAL_LOCK = threading.Lock()
+
+
+def locked_book(capacity, **fields):
+    with GLOBAL_LOCK:
+        return naive_book(capacity, **fields)
+
+
+def run(strategy, slots, threads, capacity, property_id, buyers):
+    """Race ``threads`` buyers for every slot; returns (bookings, seconds)"""
+    from django.db import connection
+    from nal_backend.apps.bookings.reservations import SlotUnavailable, reserve
+
+    book = {'naive': naive_book, 'locked': locked_book, 'seats': reserve}[strategy]
+    barrier = threading.Barrier(threads)
+    booked = Counter()
+
+    def buyer(index):
+        try:
+            for booking_date, booking_time in slots:
+                barrier.wait()
+                try:
+                    book(capacity, property_id=property_id, booking_date=booking_date,
+                         booking_time=booking_time, duration_minutes=60, **contact(buyers[index]))
+                    booked[index] += 1
+                except SlotUnavailable:
+                    pass
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=buyer, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(booked.values()), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--slots', type=int, default=200)
+    parser.add_argument('--capacity', type=int, default=2)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth import get_user_model
+    from django.db.models import Count
+    from nal_backend.apps.bookings.models import Booking
+    from nal_backend.apps.properties.models import Property
+
+    rows = []
+    with test_database():
+        owner = bench_owner()
+        seed_properties(owner, 0, 3)
+        buyers = [
+            get_user_model().objects.create_user(email=f'buyer{index}@example.com', username=f'buyer{index}', password='x')
+            for index in range(args.threads)
+        ]
+        first_day = date.today() + timedelta(days=7)
+        slots = [(first_day + timedelta(days=index // 9), clock(9 + index % 9)) for index in range(args.slots)]
+
+        for strategy, property_id in zip(('naive', 'locked', 'seats'), Property.objects.order_by('id').values_list('id', flat=True)):
+            bookings, seconds = run(strategy, slots, args.threads, args.capacity, property_id, buyers)
+            overbooked = Booking.objects.filter(property_id=property_id).values('booking_date', 'booking_time').annotate(
+                taken=Count('id')
+            ).filter(taken__gt=args.capacity).count()
+            rows.append([strategy, args.threads, bookings, overbooked, f'{bookings / seconds:,.0f}',
+                         f'{args.slots * args.threads / seconds:,.0f}'])
+            if strategy == 'seats':
+                assert overbooked == 0, f'{overbooked} slots booked past capacity'
+                assert bookings == args.slots * min(args.capacity, args.threads)
+    print_table(['strategy', 'threads', 'bookings', 'overbooked slots', 'bookings/s', 'attempts/s'], rows)
+
+
+if __name__ == '__main__':
+    main()
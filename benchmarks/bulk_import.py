@@ -0,0 +1,81 @@
+"""Bulk import throughput: streaming importer versus one create per row.
+
+Generates a synthetic CSV portfolio of each size and imports it with the
+batched importer. The per-row baseline (``PropertyCreateSerializer.save()``
+per listing, as the create endpoint does) is timed on a sample of
+``--baseline-rows`` rows and extrapolated::
+
+    python -m benchmarks.bulk_import --sizes 10000,100000
+"""
+import argparse
+import csv
+import io
+import random
+import time
+
+from benchmarks.harness import bench_owner, parse_sizes, print_table, setup_django, synthetic_property, test_database
+
+COLUMNS = [
+    'title', 'description', 'price', 'property_type', 'address', 'city', 'state', 'pincode',
+    'latitude', 'longitude', 'bedrooms', 'bathrooms', 'area_sqft', 'parking_spaces', 'amenities',
+]
+AMENITIES = ['Gym', 'Pool', 'Lift', 'Power Backup', 'Security', 'Clubhouse']
+
+
+def portfolio_csv(owner, size, seed=0):
+    rng = random.Random(seed)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for index in range(size):
+        property_obj = synthetic_property(rng, owner, index)
+        row = [getattr(property_obj, column) for column in COLUMNS[:-1]]
+        writer.writerow(row + ['|'.join(rng.sample(AMENITIES, rng.randint(0, 3)))])
+    return buffer.getvalue().encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--baseline-rows', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+    from nal_backend.apps.properties.importer import import_file, iter_rows
+    from nal_backend.apps.properties.models import PropertyAmenity
+    from nal_backend.apps.properties.serializers import PropertyCreateSerializer
+
+    class OwnerRequest:
+        def __init__(self, user):
+            self.user = user
+
+    rows = []
+    with test_database():
+        owner = bench_owner()
+        PropertyAmenity.objects.bulk_create([PropertyAmenity(name=name) for name in AMENITIES])
+
+        baseline = portfolio_csv(owner, args.baseline_rows, seed=1)
+        started = time.perf_counter()
+        for _, row, _ in iter_rows(io.BytesIO(baseline), 'CSV'):
+            row.pop('amenities', None)
+            serializer = PropertyCreateSerializer(data=row, context={'request': OwnerRequest(owner)})
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        per_row = (time.perf_counter() - started) / args.baseline_rows
+
+        for size in parse_sizes(args.sizes):
+            data = portfolio_csv(owner, size, seed=size)
+            started = time.perf_counter()
+            result = import_file(owner, io.BytesIO(data), 'CSV', batch_size=args.batch_size)
+            elapsed = time.perf_counter() - started
+            rows.append([
+                size, result.created_rows, f'{elapsed:.1f}', f'{size / elapsed:.0f}',
+                f'{per_row * size:.1f}', f'{per_row * size / elapsed:.1f}x',
+            ])
+
+    print_table(['rows', 'created', 'import s', 'rows/s', 'per-row create s (est.)', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    main()
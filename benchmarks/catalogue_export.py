@@ -0,0 +1,54 @@
+"""Catalogue export: throughput and peak memory against catalogue size.
+
+Seeds listings and streams the NDJSON and CSV exports into a byte counter,
+tracking the peak Python heap with ``tracemalloc``. Peak memory should stay
+flat as the catalogue grows::
+
+    python -m benchmarks.catalogue_export --sizes 10000,100000
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.harness import bench_owner, parse_sizes, print_table, seed_properties, setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    from nal_backend.apps.properties import export
+
+    rows = []
+    with test_database():
+        owner = bench_owner()
+        seeded = 0
+        for size in parse_sizes(args.sizes):
+            seed_properties(owner, seeded, size)
+            seeded = size
+            for export_format in export.FORMATS:
+                stream = lambda: export.stream_export(export.export_queryset(), export_format, args.chunk_size)
+                written = 0
+                started = time.perf_counter()
+                for chunk in stream():
+                    written += len(chunk.encode())
+                seconds = time.perf_counter() - started
+
+                # Separate pass: tracemalloc slows everything down
+                tracemalloc.start()
+                for chunk in stream():
+                    pass
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                rows.append([
+                    size, export_format, f'{written / 2 ** 20:.1f}', f'{seconds:.2f}',
+                    f'{export.export_queryset().count() / seconds:.0f}', f'{peak / 2 ** 20:.1f}',
+                ])
+    print_table(['listings', 'format', 'output MB', 'seconds', 'rows/s', 'peak heap MB'], rows)
+
+
+if __name__ == '__main__':
+    main()
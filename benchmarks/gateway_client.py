@@ -0,0 +1,109 @@
+"""Payment gateway client latency against the local fake gateway.
+
+``--threads`` callers each make ``--calls`` capture calls against
+``fake_gateway.FakeGateway`` with every ``--latencies`` value (ms) injected
+per response. Two clients are compared:
+
+* ``naive``: ``requests.post`` per call, a new connection each time and no
+  timeout,
+* ``pooled``: one shared ``gateway.GatewayClient`` (keep-alive pool,
+  timeouts, retries, circuit breaker).
+
+A brownout run then makes the gateway hang for ``--brownout`` ms per call:
+the naive client waits it out every time, the pooled client times out after
+``--timeout`` ms and, once its circuit opens, fails fast::
+
+    python -m benchmarks.gateway_client --threads 8 --calls 200 --latencies 0,20,100
+
+The fake gateway speaks plain HTTP, so the TLS handshakes a real gateway
+adds to every new connection are not part of the naive numbers.
+"""
+import argparse
+import itertools
+import threading
+import time
+
+import requests
+
+from benchmarks.harness import parse_sizes, percentile, print_table
+
+
+# Every call captures a new payment: the gateway refuses a second capture
+capture_ids = itertools.count()
+
+
+def naive_call(url):
+    response = requests.post(f'{url}/payments/pay_bench_{next(capture_ids)}/capture',
+                             json={'amount': 50000, 'currency': 'INR'}, auth=('rzp_bench', 'secret'))
+    response.raise_for_status()
+    return response.json()
+
+
+def run(call, threads, calls):
+    """Run ``call`` from every thread; returns (latencies in ms, failures, seconds)"""
+    latencies = []
+    failures = []
+    barrier = threading.Barrier(threads)
+
+    def caller():
+        mine, failed = [], 0
+        barrier.wait()
+        for _ in range(calls):
+            started = time.perf_counter()
+            try:
+                call()
+            except Exception:
+                failed += 1
+            mine.append((time.perf_counter() - started) * 1000)
+        latencies.extend(mine)
+        failures.append(failed)
+
+    workers = [threading.Thread(target=caller) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, sum(failures), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--latencies', type=parse_sizes, default=parse_sizes('0,20,100'))
+    parser.add_argument('--brownout', type=int, default=2000)
+    parser.add_argument('--timeout', type=int, default=250)
+    args = parser.parse_args()
+
+    from nal_backend.apps.payments.fake_gateway import FakeGateway
+    from nal_backend.apps.payments.gateway import CircuitBreaker, GatewayClient
+
+    rows = []
+    for latency in args.latencies:
+        for name in ('naive', 'pooled'):
+            with FakeGateway(latency=latency / 1000) as fake:
+                client = GatewayClient(fake.url, 'rzp_bench', 'secret', pool_size=args.threads)
+                call = (lambda: naive_call(fake.url)) if name == 'naive' else (
+                    lambda: client.capture_payment(f'pay_bench_{next(capture_ids)}', 50000, 'INR'))
+                latencies, failures, seconds = run(call, args.threads, args.calls)
+                rows.append([name, latency, f'{percentile(latencies, 50):.1f}', f'{percentile(latencies, 99):.1f}',
+                             f'{len(latencies) / seconds:,.0f}', failures, fake.connections])
+
+    # A few calls per thread are enough to show the difference
+    calls = max(1, min(args.calls, 5))
+    for name in ('naive', 'pooled'):
+        with FakeGateway(latency=args.brownout / 1000) as fake:
+            client = GatewayClient(fake.url, 'rzp_bench', 'secret', read_timeout=args.timeout / 1000,
+                                   max_retries=1, pool_size=args.threads, breaker=CircuitBreaker())
+            call = (lambda: naive_call(fake.url)) if name == 'naive' else (
+                lambda: client.capture_payment(f'pay_bench_{next(capture_ids)}', 50000, 'INR'))
+            latencies, failures, seconds = run(call, args.threads, calls)
+            rows.append([f'{name} (brownout)', args.brownout, f'{percentile(latencies, 50):.1f}',
+                         f'{percentile(latencies, 99):.1f}', f'{len(latencies) / seconds:,.0f}', failures,
+                         fake.connections])
+    print_table(['client', 'latency ms', 'p50 ms', 'p99 ms', 'calls/s', 'failed', 'connections'], rows)
+
+
+if __name__ == '__main__':
+    main()
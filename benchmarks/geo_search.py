@@ -0,0 +1,78 @@
+"""Radius search latency as the catalogue grows.
+
+Compares the geohash-pruned haversine search used by ``list_properties``
+against the previous unindexed latitude/longitude bounding box. The search
+radius shrinks with the square root of the catalogue size so every size
+returns roughly the same number of matches; what is left is the cost of
+finding them, which the geohash index should keep flat::
+
+    python -m benchmarks.geo_search --sizes 10000,100000,1000000
+"""
+import argparse
+import random
+
+from benchmarks.harness import (
+    CITIES, bench_owner, measure, parse_sizes, print_table, seed_properties,
+    setup_django, test_database,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--radius', type=float, default=5.0,
+                        help='radius in km at the smallest size')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from nal_backend.apps.properties import geo
+    from nal_backend.apps.properties.models import Property
+
+    rng = random.Random(42)
+    points = [
+        (lat + rng.uniform(-0.2, 0.2), lng + rng.uniform(-0.2, 0.2))
+        for _, _, lat, lng in CITIES for _ in range(5)
+    ]
+
+    sizes = parse_sizes(args.sizes)
+    radius = args.radius
+
+    def geohash_search():
+        lat, lng = rng.choice(points)
+        queryset = Property.objects.filter(status='PUBLISHED')
+        list(geo.within_radius(queryset, lat, lng, radius).order_by('distance_km', 'id')[:20])
+
+    def bounding_box_search():
+        lat, lng = rng.choice(points)
+        min_lat, max_lat, min_lng, max_lng = geo.bounding_box(lat, lng, radius)
+        list(Property.objects.filter(
+            status='PUBLISHED',
+            latitude__range=[min_lat, max_lat],
+            longitude__range=[min_lng, max_lng],
+        )[:20])
+
+    rows = []
+    with test_database():
+        owner = bench_owner()
+        seeded = 0
+        for size in sizes:
+            seed_properties(owner, seeded, size)
+            seeded = size
+            radius = args.radius * (sizes[0] / size) ** 0.5
+            indexed = measure(geohash_search, repeat=args.repeat)
+            scanned = measure(bounding_box_search, repeat=args.repeat)
+            rows.append([
+                size, f'{radius:.2f}',
+                f"{indexed['p50']:.2f}", f"{indexed['p99']:.2f}",
+                f"{scanned['p50']:.2f}", f"{scanned['p99']:.2f}",
+            ])
+
+    print_table(
+        ['listings', 'radius km', 'geohash p50 ms', 'geohash p99 ms', 'bbox p50 ms', 'bbox p99 ms'],
+        rows,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks create a throwaway test database from the configured
+``DJANGO_SETTINGS_MODULE`` (MySQL by default), seed it with synthetic
+listings and destroy it afterwards, so they never touch real data::
+
+    python -m benchmarks.geo_search --sizes 10000,100000,1000000
+"""
+import os
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+CITIES = [
+    ('Mumbai', 'Maharashtra', 19.0760, 72.8777),
+    ('Delhi', 'Delhi', 28.7041, 77.1025),
+    ('Bengaluru', 'Karnataka', 12.9716, 77.5946),
+    ('Hyderabad', 'Telangana', 17.3850, 78.4867),
+    ('Chennai', 'Tamil Nadu', 13.0827, 80.2707),
+    ('Kolkata', 'West Bengal', 22.5726, 88.3639),
+    ('Pune', 'Maharashtra', 18.5204, 73.8567),
+    ('Ahmedabad', 'Gujarat', 23.0225, 72.5714),
+    ('Jaipur', 'Rajasthan', 26.9124, 75.7873),
+    ('Kochi', 'Kerala', 9.9312, 76.2673),
+]
+
+PROPERTY_TYPES = ['APARTMENT', 'HOUSE', 'VILLA', 'PLOT', 'COMMERCIAL', 'WAREHOUSE']
+
+WORDS = [
+    'spacious', 'sunny', 'modern', 'renovated', 'garden', 'sea', 'view', 'corner',
+    'duplex', 'penthouse', 'gated', 'community', 'metro', 'school', 'park', 'lake',
+    'furnished', 'balcony', 'terrace', 'quiet', 'family', 'luxury', 'budget', 'new',
+]
+
+# Description vocabulary with a Zipf-like frequency distribution, so a few
+# words are very common and most are rare, as in real listing text.
+_SYLLABLES = ['ka', 'ra', 'mi', 'no', 'shi', 'ta', 've', 'lo', 'pu', 'dha', 'ne', 'ji']
+VOCABULARY = WORDS + [a + b + c for a in _SYLLABLES for b in _SYLLABLES for c in _SYLLABLES]
+_VOCABULARY_WEIGHTS = []
+_total = 0.0
+for _rank in range(1, len(VOCABULARY) + 1):
+    _total += 1.0 / _rank
+    _VOCABULARY_WEIGHTS.append(_total)
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nal_backend.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Create a fresh test database for the duration of the block"""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def parse_sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def measure(fn, repeat=50, warmup=3):
+    """Call ``fn`` repeatedly and return latency statistics in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'p50': percentile(samples, 50),
+        'p99': percentile(samples, 99),
+        'mean': statistics.mean(samples),
+    }
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    line = '  '.join(str(header).ljust(width) for header, width in zip(headers, widths))
+    print(line)
+    print('-' * len(line))
+    for row in rows:
+        print('  '.join(str(cell).ljust(width) for cell, width in zip(row, widths)))
+
+
+def bench_owner():
+    from django.contrib.auth import get_user_model
+    from nal_backend.apps.users.models import Profile
+
+    User = get_user_model()
+    owner, created = User.objects.get_or_create(
+        email='bench-owner@example.com',
+        defaults={'username': 'bench-owner', 'role': 'SELLER'},
+    )
+    if created:
+        Profile.objects.create(user=owner, full_name='Bench Owner')
+    return owner
+
+
+def synthetic_property(rng, owner, index):
+    """Build an unsaved synthetic Property"""
+    from nal_backend.apps.properties.models import Property
+
+    city, state, lat, lng = rng.choice(CITIES)
+    property_type = rng.choice(PROPERTY_TYPES)
+    bedrooms = rng.randint(0, 5)
+    area = rng.randint(350, 5000)
+    property_obj = Property(
+        owner=owner,
+        title=f'{rng.choice(WORDS).title()} {property_type.lower()} in {city} #{index}',
+        description=' '.join(rng.choices(VOCABULARY, cum_weights=_VOCABULARY_WEIGHTS, k=30)),
+        price=Decimal(area * rng.randint(3000, 25000)).quantize(Decimal('0.01')),
+        property_type=property_type,
+        status='PUBLISHED' if rng.random() < 0.9 else 'DRAFT',
+        address=f'{rng.randint(1, 999)} {rng.choice(WORDS).title()} Road, {city}',
+        city=city,
+        state=state,
+        pincode=str(rng.randint(100000, 999999)),
+        latitude=lat + rng.uniform(-0.3, 0.3),
+        longitude=lng + rng.uniform(-0.3, 0.3),
+        bedrooms=bedrooms,
+        bathrooms=max(1, bedrooms - rng.randint(0, 1)),
+        area_sqft=area,
+        parking_spaces=rng.randint(0, 2),
+    )
+    property_obj.refresh_geohash()
+    return property_obj
+
+
+def seed_properties(owner, start, stop, seed=0, batch_size=5000):
+    """Bulk insert synthetic properties numbered ``start`` to ``stop``"""
+    from nal_backend.apps.properties.models import Property
+
+    rng = random.Random(seed + start)
+    batch = []
+    for index in range(start, stop):
+        batch.append(synthetic_property(rng, owner, index))
+        if len(batch) >= batch_size:
+            Property.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Property.objects.bulk_create(batch)
@@ -0,0 +1,60 @@
+"""Listing serialization: DRF ``PropertyListSerializer`` vs the values() fast path.
+
+Seeds listings with primary images and, for each page size, times turning
+a page into JSON bytes: once from already fetched rows (serializer and
+renderer only) and once end to end (queries included). Both paths are
+checked to render identical bytes::
+
+    python -m benchmarks.list_serializer --page-sizes 20,100,1000
+"""
+import argparse
+
+from benchmarks.harness import bench_owner, measure, parse_sizes, print_table, seed_properties, setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--page-sizes', default='20,100,1000')
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.renderers import JSONRenderer
+    from nal_backend.apps.properties.models import Property, PropertyMedia
+    from nal_backend.apps.properties.serializers import FastPropertyListSerializer, PropertyListSerializer
+
+    page_sizes = parse_sizes(args.page_sizes)
+    renderer = JSONRenderer()
+    context = {'image_size': None, 'image_format': 'webp'}
+    rows = []
+    with test_database():
+        owner = bench_owner()
+        seed_properties(owner, 0, max(page_sizes))
+        PropertyMedia.objects.bulk_create([
+            PropertyMedia(property_id=property_id, media_url=f'https://cdn.example.com/{property_id}.jpg', is_primary=True)
+            for property_id in Property.objects.values_list('id', flat=True)
+        ])
+        published = Property.objects.filter(status='PUBLISHED').order_by('-created_at', '-id')
+
+        for page_size in page_sizes:
+            slow_page = lambda: list(PropertyListSerializer.setup_eager_loading(published)[:page_size])
+            fast_page = lambda: list(FastPropertyListSerializer.setup_values(published)[:page_size])
+            slow_render = lambda page: renderer.render(PropertyListSerializer(page, many=True, context=context).data)
+            fast_render = lambda page: renderer.render(FastPropertyListSerializer(page, context=context).data)
+
+            slow_rows, fast_rows = slow_page(), fast_page()
+            assert slow_render(slow_rows) == fast_render(fast_rows)
+            timings = [
+                measure(lambda: slow_render(slow_rows), repeat=args.repeat)['p50'],
+                measure(lambda: fast_render(fast_rows), repeat=args.repeat)['p50'],
+                measure(lambda: slow_render(slow_page()), repeat=args.repeat)['p50'],
+                measure(lambda: fast_render(fast_page()), repeat=args.repeat)['p50'],
+            ]
+            rows.append([page_size] + [f'{len(slow_rows) / (timing / 1000):,.0f}' for timing in timings]
+                        + [f'{timings[2] / timings[3]:.1f}x'])
+    print_table(['page size', 'DRF rows/s', 'fast rows/s', 'DRF end-to-end rows/s',
+                 'fast end-to-end rows/s', 'end-to-end speedup'], rows)
+
+
+if __name__ == '__main__':
+    main()
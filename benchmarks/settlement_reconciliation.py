@@ -0,0 +1,89 @@
+"""Settlement reconciliation throughput and memory.
+
+For every size a settlement CSV with that many rows is written to a
+temporary file, against as many seeded transactions, with a small share of
+rows disagreeing with their transaction (amount, status or unknown payment
+id). The file is reconciled with ``reconciliation.reconcile_file`` and
+rows/s and the peak traced memory of a second run are reported; the peak
+should stay flat as the file grows::
+
+    python -m benchmarks.settlement_reconciliation --sizes 100000,1000000
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import tempfile
+import tracemalloc
+
+from benchmarks.harness import bench_owner, parse_sizes, print_table, setup_django, test_database
+
+
+def seed_transactions(owner, start, stop, batch_size=5000):
+    from nal_backend.apps.payments.models import Transaction
+
+    for offset in range(start, stop, batch_size):
+        Transaction.objects.bulk_create([
+            Transaction(user=owner, amount='500.00', transaction_type='BOOKING_FEE', status='COMPLETED',
+                        payment_intent_id=f'pi_bench_{index}', gateway_transaction_id=f'txn_bench_{index}')
+            for index in range(offset, min(offset + batch_size, stop))
+        ])
+
+
+def write_settlement(path, size, mismatch_share, seed=0):
+    """Write the settlement file; returns the number of rows made to disagree"""
+    rng = random.Random(seed)
+    mismatched = 0
+    with open(path, 'w', newline='') as target:
+        writer = csv.writer(target)
+        writer.writerow(['payment_id', 'amount', 'status', 'settlement_id'])
+        for index in range(size):
+            payment_id, amount, status = f'txn_bench_{index}', '500.00', 'captured'
+            if rng.random() < mismatch_share:
+                mismatched += 1
+                payment_id, amount, status = rng.choice([
+                    (payment_id, '499.00', status), (payment_id, amount, 'refunded'), (f'txn_ghost_{index}', amount, status),
+                ])
+            writer.writerow([payment_id, amount, status, f'setl_{index // 10000}'])
+    return mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=parse_sizes, default=parse_sizes('10000,100000'))
+    parser.add_argument('--mismatches', type=float, default=0.01)
+    parser.add_argument('--batch-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test.utils import override_settings
+    from nal_backend.apps.payments.reconciliation import reconcile_file
+
+    rows = []
+    # With DEBUG on, Django keeps the last queries and their SQL in memory
+    with test_database(), override_settings(DEBUG=False), tempfile.TemporaryDirectory() as directory:
+        owner = bench_owner()
+        seeded = 0
+        for size in args.sizes:
+            seed_transactions(owner, seeded, max(seeded, size))
+            seeded = max(seeded, size)
+            path = os.path.join(directory, f'settlement-{size}.csv')
+            mismatched = write_settlement(path, size, args.mismatches)
+
+            with open(path, 'rb') as source:
+                result = reconcile_file(source, io.StringIO(), batch_size=args.batch_size)
+            # Traced separately: tracing slows the run down about twofold
+            tracemalloc.start()
+            with open(path, 'rb') as source:
+                reconcile_file(source, io.StringIO(), batch_size=args.batch_size)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            assert result.discrepancy_count == mismatched, (result.discrepancy_count, mismatched)
+            rows.append([size, f'{os.path.getsize(path) / 2 ** 20:.1f}', result.discrepancy_count,
+                         f'{result.seconds:.2f}', f'{result.rows_per_second:,.0f}', f'{peak / 2 ** 20:.1f}'])
+    print_table(['rows', 'file MiB', 'discrepancies', 'seconds', 'rows/s', 'peak MiB'], rows)
+
+
+if __name__ == '__main__':
+    main()
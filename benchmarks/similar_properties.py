@@ -0,0 +1,84 @@
+"""Similar-properties index: memory footprint and k-NN latency.
+
+Loads synthetic listings straight into the in-memory index (no database
+needed for large sizes) and times single and batched k-NN queries. With
+``--db-sizes`` it also seeds a test database and times a full build from
+``Property`` rows::
+
+    python -m benchmarks.similar_properties --sizes 100000,1000000 --db-sizes 100000
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from benchmarks.harness import (
+    CITIES, PROPERTY_TYPES, bench_owner, measure, parse_sizes, print_table,
+    seed_properties, setup_django, test_database,
+)
+
+
+def synthetic_columns(size, seed=0):
+    rng = np.random.default_rng(seed)
+    cities = rng.integers(0, len(CITIES), size)
+    area = rng.integers(350, 5000, size).astype(float)
+    return {
+        'id': np.arange(1, size + 1, dtype=np.int64),
+        'price': area * rng.integers(3000, 25000, size),
+        'area_sqft': area,
+        'bedrooms': rng.integers(0, 6, size).astype(float),
+        'bathrooms': rng.integers(1, 5, size).astype(float),
+        'latitude': np.array([CITIES[city][2] for city in cities]) + rng.uniform(-0.3, 0.3, size),
+        'longitude': np.array([CITIES[city][3] for city in cities]) + rng.uniform(-0.3, 0.3, size),
+        'property_type': rng.integers(0, len(PROPERTY_TYPES), size),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100000,1000000')
+    parser.add_argument('--db-sizes', default='')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--batch', type=int, default=64)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from nal_backend.apps.properties.similarity import SimilarityIndex
+
+    rows = []
+    for size in parse_sizes(args.sizes):
+        index = SimilarityIndex()
+        started = time.perf_counter()
+        index.load(synthetic_columns(size))
+        load_seconds = time.perf_counter() - started
+
+        rng = random.Random(size)
+        sample = lambda count: index.matrix[[rng.randrange(size) for _ in range(count)]]
+        single = measure(lambda: index.nearest(sample(1), args.k), repeat=args.repeat)
+        batched = measure(lambda: index.nearest(sample(args.batch), args.k), repeat=max(args.repeat // 5, 3))
+        rows.append([
+            size, f'{index.nbytes / 2 ** 20:.1f}', f'{load_seconds:.2f}',
+            f"{single['p50']:.2f}", f"{single['p99']:.2f}", f"{batched['p50'] / args.batch:.2f}",
+        ])
+    print_table(['listings', 'index MB', 'load s', 'query p50 ms', 'query p99 ms', f'per query in batch of {args.batch} ms'], rows)
+
+    if args.db_sizes:
+        build_rows = []
+        with test_database():
+            owner = bench_owner()
+            seeded = 0
+            for size in parse_sizes(args.db_sizes):
+                seed_properties(owner, seeded, size)
+                seeded = size
+                index = SimilarityIndex()
+                started = time.perf_counter()
+                index.build()
+                build_rows.append([size, len(index), f'{time.perf_counter() - started:.2f}'])
+        print()
+        print_table(['rows', 'published indexed', 'build from DB s'], build_rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Keyword search latency: search backend versus the old icontains scan.
+
+Seeds synthetic listings, builds the configured search index and times a
+mix of full-word and type-ahead (prefix) queries through both paths. Each
+sample is what a listing page costs: the match count plus the first page::
+
+    python -m benchmarks.text_search --sizes 10000,100000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.harness import (
+    bench_owner, measure, parse_sizes, print_table, seed_properties,
+    setup_django, test_database,
+)
+
+QUERIES = ['garden', 'sea view', 'luxury penthouse', 'gated comm', 'metro', 'mumbai terr', 'budg', 'kamino', 'shitave', 'dhapu']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db.models import Max, Q
+    from nal_backend.apps.properties.models import Property
+    from nal_backend.apps.properties.search import get_search_backend
+
+    backend = get_search_backend()
+    rng = random.Random(7)
+    published = Property.objects.filter(status='PUBLISHED')
+
+    def indexed_search():
+        queryset = backend.filter_queryset(published, rng.choice(QUERIES))
+        queryset.count()
+        list(queryset.order_by('-relevance', '-id')[:20])
+
+    def icontains_search():
+        query = rng.choice(QUERIES)
+        queryset = published.filter(
+            Q(title__icontains=query) | Q(description__icontains=query) | Q(city__icontains=query)
+        )
+        queryset.count()
+        list(queryset.order_by('-id')[:20])
+
+    rows = []
+    with test_database():
+        owner = bench_owner()
+        seeded = 0
+        for size in parse_sizes(args.sizes):
+            last_id = Property.objects.aggregate(last=Max('id'))['last'] or 0
+            seed_properties(owner, seeded, size)
+            started = time.perf_counter()
+            backend.rebuild(published.filter(id__gt=last_id))
+            index_seconds = time.perf_counter() - started
+            seeded = size
+
+            indexed = measure(indexed_search, repeat=args.repeat)
+            scanned = measure(icontains_search, repeat=args.repeat)
+            rows.append([
+                size, f'{index_seconds:.1f}',
+                f"{indexed['p50']:.2f}", f"{indexed['p99']:.2f}",
+                f"{scanned['p50']:.2f}", f"{scanned['p99']:.2f}",
+            ])
+
+    print_table(
+        ['listings', 'index build s', 'index p50 ms', 'index p99 ms', 'icontains p50 ms', 'icontains p99 ms'],
+        rows,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Batch valuation: fitting comparable statistics and valuing the catalogue.
+
+Builds synthetic valuation columns in memory (no database needed for large
+sizes) and times fitting the group statistics and valuing every row. With
+``--db-sizes`` it also seeds a test database and times a full run including
+the chunked write-back, then an incremental run after editing 1% of rows::
+
+    python -m benchmarks.valuation --sizes 100000,1000000 --db-sizes 100000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.harness import (
+    CITIES, PROPERTY_TYPES, bench_owner, parse_sizes, print_table,
+    seed_properties, setup_django, test_database,
+)
+
+
+def synthetic_columns(size, seed=0):
+    from nal_backend.apps.properties import geo
+
+    rng = np.random.default_rng(seed)
+    cities = rng.integers(0, len(CITIES), size)
+    latitude = np.array([CITIES[city][2] for city in cities]) + rng.uniform(-0.3, 0.3, size)
+    longitude = np.array([CITIES[city][3] for city in cities]) + rng.uniform(-0.3, 0.3, size)
+    area = rng.integers(350, 5000, size).astype(float)
+    statuses = np.array(['PUBLISHED', 'SOLD', 'DRAFT', 'ARCHIVED'], dtype=object)
+    return {
+        'id': np.arange(1, size + 1, dtype=np.int64),
+        'price': area * rng.integers(3000, 25000, size),
+        'area_sqft': area,
+        'geohash': np.array([geo.encode(lat, lng) for lat, lng in zip(latitude, longitude)], dtype=object),
+        'city': np.array([CITIES[city][0].lower() for city in cities], dtype=object),
+        'property_type': np.array(PROPERTY_TYPES, dtype=object)[rng.integers(0, len(PROPERTY_TYPES), size)],
+        'status': statuses[rng.choice(len(statuses), size, p=[0.6, 0.3, 0.05, 0.05])],
+        'ribl_score': np.full(size, np.nan),
+        'urgent_sale_value': np.full(size, np.nan),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100000,1000000')
+    parser.add_argument('--db-sizes', default='')
+    args = parser.parse_args()
+
+    setup_django()
+    from nal_backend.apps.properties.models import Property
+    from nal_backend.apps.properties.valuation import ComparableStats, group_codes, run_valuation, value_columns
+
+    rows = []
+    for size in parse_sizes(args.sizes):
+        columns = synthetic_columns(size)
+        started = time.perf_counter()
+        groups = group_codes(columns)
+        grouped = time.perf_counter()
+        stats = ComparableStats.fit(columns, groups)
+        fitted = time.perf_counter()
+        ribl, _ = value_columns(columns, stats, groups)
+        valued = time.perf_counter()
+        rows.append([
+            size, len(stats), int(np.isfinite(ribl).sum()), f'{grouped - started:.2f}',
+            f'{fitted - grouped:.2f}', f'{valued - fitted:.2f}', f'{valued - started:.2f}',
+        ])
+    print_table(['rows', 'groups', 'valued', 'group s', 'fit s', 'value s', 'total s'], rows)
+
+    if args.db_sizes:
+        run_rows = []
+        with test_database():
+            owner = bench_owner()
+            seeded = 0
+            for size in parse_sizes(args.db_sizes):
+                seed_properties(owner, seeded, size)
+                seeded = size
+                started = time.perf_counter()
+                full = run_valuation(full=True)
+                full_seconds = time.perf_counter() - started
+
+                # Edit 1% of the catalogue the way the API would (one save each)
+                for obj in Property.objects.order_by('?')[:max(size // 100, 1)]:
+                    obj.price = obj.price * 95 / 100
+                    obj.save()
+                started = time.perf_counter()
+                incremental = run_valuation()
+                run_rows.append([
+                    size, full.updated_rows, f'{full_seconds:.2f}',
+                    incremental.valued_rows, f'{time.perf_counter() - started:.2f}',
+                ])
+        print()
+        print_table(['rows', 'full updated', 'full run s', 'incremental valued', 'incremental run s'], run_rows)
+
+
+if __name__ == '__main__':
+    main()
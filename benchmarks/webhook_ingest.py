@@ -0,0 +1,139 @@
+"""Webhook ingestion: replay a burst of gateway deliveries with duplicates.
+
+``--events`` deliveries are replayed, ``--duplicates`` of them redeliveries
+of an earlier event, against ``--transactions`` payments. Two handlers are
+compared:
+
+* ``inline``: the old handler, which creates the event and updates its
+  transaction within the request (a duplicate fails on the unique
+  ``event_id`` and would be answered with a 500),
+* ``fast-ack``: signature check and insert-or-ignore in the request, then
+  ``webhooks.process_pending`` applying the stored events in batches.
+
+The run fails if the fast-ack path errors on a delivery or leaves a
+transaction in the wrong state::
+
+    python -m benchmarks.webhook_ingest --events 10000 --duplicates 0.2
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.harness import bench_owner, percentile, print_table, setup_django, test_database
+
+SECRET = 'whsec_bench'
+
+
+def deliveries(count, duplicate_share, transactions, seed=0):
+    """Signed ``(body, signature)`` deliveries, shuffled, with redeliveries mixed in"""
+    from nal_backend.apps.payments.webhooks import sign
+
+    rng = random.Random(seed)
+    unique = int(count * (1 - duplicate_share))
+    bodies = [
+        json.dumps({
+            'id': f'evt_{index}',
+            'event': rng.choice(['payment.captured', 'payment.captured', 'payment.failed']),
+            'payload': {'payment': {'entity': {'id': f'pi_bench_{index % transactions}'}}},
+        }).encode()
+        for index in range(unique)
+    ]
+    replay = bodies + rng.choices(bodies, k=count - unique)
+    rng.shuffle(replay)
+    return [(body, sign(body, SECRET)) for body in replay]
+
+
+def inline_handler(body, signature):
+    from django.utils import timezone
+    from nal_backend.apps.payments.models import Transaction, WebhookEvent
+    from nal_backend.apps.payments.webhooks import EVENT_STATUSES, payment_refs
+
+    event = json.loads(body)
+    webhook_event = WebhookEvent.objects.create(
+        provider='razorpay', event_type=event['event'], event_id=event['id'], payload=event
+    )
+    try:
+        transaction = Transaction.objects.get(payment_intent_id=payment_refs(event)[1])
+    except Transaction.DoesNotExist:
+        return
+    transaction.status = EVENT_STATUSES[event['event']]
+    transaction.completed_at = timezone.now()
+    transaction.save()
+    webhook_event.transaction = transaction
+    webhook_event.processed = True
+    webhook_event.processed_at = timezone.now()
+    webhook_event.save()
+
+
+def fast_ack_handler(body, signature):
+    from nal_backend.apps.payments.webhooks import record_event, verify_signature
+
+    if not verify_signature(body, signature):
+        raise ValueError('Invalid signature')
+    record_event(body)
+
+
+def replay(handler, replayed):
+    """Deliver every body; returns (latencies in ms, failed deliveries, seconds)"""
+    latencies = []
+    failed = 0
+    started = time.perf_counter()
+    for body, signature in replayed:
+        call_started = time.perf_counter()
+        try:
+            handler(body, signature)
+        except Exception:
+            failed += 1
+        latencies.append((time.perf_counter() - call_started) * 1000)
+    return latencies, failed, time.perf_counter() - started
+
+
+def seed_transactions(owner, count):
+    from nal_backend.apps.payments.models import Transaction, WebhookEvent
+
+    WebhookEvent.objects.all().delete()
+    Transaction.objects.all().delete()
+    Transaction.objects.bulk_create([
+        Transaction(user=owner, amount='500.00', transaction_type='BOOKING_FEE', status='PROCESSING',
+                    payment_intent_id=f'pi_bench_{index}')
+        for index in range(count)
+    ], batch_size=5000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--duplicates', type=float, default=0.2)
+    parser.add_argument('--transactions', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test.utils import override_settings
+    from nal_backend.apps.payments.models import Transaction, WebhookEvent
+    from nal_backend.apps.payments.webhooks import process_pending
+
+    rows = []
+    with test_database(), override_settings(RAZORPAY_WEBHOOK_SECRET=SECRET):
+        owner = bench_owner()
+        replayed = deliveries(args.events, args.duplicates, args.transactions)
+        for strategy, handler in (('inline', inline_handler), ('fast-ack', fast_ack_handler)):
+            seed_transactions(owner, args.transactions)
+            latencies, failed, seconds = replay(handler, replayed)
+            drain = ''
+            if strategy == 'fast-ack':
+                assert failed == 0, f'{failed} deliveries failed'
+                started = time.perf_counter()
+                processed = process_pending()
+                drain = f'{processed / (time.perf_counter() - started):,.0f}'
+                assert processed == WebhookEvent.objects.count()
+                assert not Transaction.objects.filter(status='PROCESSING').exists()
+            rows.append([strategy, len(replayed), failed, WebhookEvent.objects.count(),
+                         f'{percentile(latencies, 50):.2f}', f'{percentile(latencies, 99):.2f}',
+                         f'{len(replayed) / seconds:,.0f}', drain])
+    print_table(['handler', 'deliveries', 'errors', 'events stored', 'ack p50 ms', 'ack p99 ms',
+                 'acks/s', 'drain events/s'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,4 @@
-# NAL Backend Package
\ No newline at end of file
+# NAL Backend Package
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from nal_backend.apps.analytics.rollups import DEFAULT_CHUNK_SIZE, backfill, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Add completed and refunded transactions missing from the revenue rollups, in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Drop the rollups first and count every transaction again',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def report_progress(last_id, added):
+            self.stdout.write(f'Up to transaction {last_id}: {added} entries added')
+
+        run = rebuild if options['rebuild'] else backfill
+        added = run(options['chunk_size'], on_chunk=report_progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Added {added} transaction statuses to the revenue rollups in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,52 @@
+from django.db import models
+
+class DailyRevenue(models.Model):
+    """Transactions that reached a status on a day, per transaction type"""
+    date = models.DateField()
+    transaction_type = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    currency = models.CharField(max_length=5)
+    count = models.PositiveBigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'revenue_daily'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'transaction_type', 'status', 'currency'], name='revenue_daily_unique_key'),
+        ]
+
+class PropertyRevenue(models.Model):
+    """Transactions of a property that reached a status, all time"""
+    property = models.ForeignKey('properties.Property', on_delete=models.CASCADE, related_name='revenue_rollups')
+    status = models.CharField(max_length=20)
+    currency = models.CharField(max_length=5)
+    count = models.PositiveBigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'revenue_by_property'
+        constraints = [
+            models.UniqueConstraint(fields=['property', 'status', 'currency'], name='revenue_property_unique_key'),
+        ]
+
+class RevenueRollupEntry(models.Model):
+    """A transaction status already counted in the rollups, so it is counted once"""
+    transaction = models.ForeignKey('payments.Transaction', on_delete=models.CASCADE, related_name='rollup_entries')
+    status = models.CharField(max_length=20)
+    # Identifies the rollup run that inserted the entry
+    run = models.UUIDField()
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'revenue_rollup_entries'
+        constraints = [
+            models.UniqueConstraint(fields=['transaction', 'status'], name='revenue_entry_unique_transaction'),
+        ]
+        indexes = [
+            models.Index(fields=['run']),
+        ]
@@ -0,0 +1,139 @@
+"""Incremental revenue rollups.
+
+``DailyRevenue`` holds, per day, transaction type, status and currency, the
+count and amount of transactions that reached ``COMPLETED`` or ``REFUNDED``
+that day; ``PropertyRevenue`` holds the same per property, all time. Net
+revenue is the completed amount minus the refunded amount. Dashboards read
+these rows only, so their cost depends on the date range asked for, not on
+the size of the ``transactions`` table.
+
+``record`` adds transactions to the rollups when they reach one of those
+statuses: ``confirm_payment`` and the webhook processor call it with the
+transactions they changed. Every (transaction, status) is counted once,
+whichever path reports it first: entries are inserted into
+``RevenueRollupEntry`` with insert-or-ignore, and only the entries this call
+inserted, found by its run id, are added. ``backfill`` runs ``record`` over
+the existing transactions in chunks, so it can be interrupted and resumed.
+"""
+import logging
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from nal_backend.apps.payments.models import Transaction
+
+from .models import DailyRevenue, PropertyRevenue, RevenueRollupEntry
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_STATUSES = ('COMPLETED', 'REFUNDED')
+DEFAULT_CHUNK_SIZE = 2000
+
+TRANSACTION_FIELDS = [
+    'id', 'status', 'amount', 'currency', 'transaction_type', 'property_id', 'completed_at', 'updated_at',
+]
+
+
+def transitions(row):
+    """``(status, date)`` of the rollup statuses a transaction row has reached"""
+    reached = []
+    if row['completed_at'] is not None or row['status'] == 'COMPLETED':
+        # A refunded payment was completed first
+        reached.append(('COMPLETED', timezone.localdate(row['completed_at'] or row['updated_at'])))
+    if row['status'] == 'REFUNDED':
+        reached.append(('REFUNDED', timezone.localdate(row['updated_at'])))
+    return reached
+
+
+def _increment(model, fields, totals):
+    """Add ``{key values: [count, amount]}`` to the rollup rows with those ``fields`` values"""
+    for values, (count, amount) in totals.items():
+        key = dict(zip(fields, values))
+        changes = {'count': F('count') + count, 'amount': F('amount') + amount, 'updated_at': timezone.now()}
+        if model.objects.filter(**key).update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(count=count, amount=amount, **key)
+        except IntegrityError:
+            # Created concurrently since the update
+            model.objects.filter(**key).update(**changes)
+
+
+def record(transaction_ids):
+    """Add the rollup statuses the transactions reached and that are not counted yet.
+
+    Returns the number of (transaction, status) entries added.
+    """
+    rows = list(Transaction.objects.filter(id__in=list(transaction_ids), status__in=ROLLUP_STATUSES).values(*TRANSACTION_FIELDS))
+    entries = [(row, status, date) for row in rows for status, date in transitions(row)]
+    if not entries:
+        return 0
+
+    run = uuid.uuid4()
+    with transaction.atomic():
+        RevenueRollupEntry.objects.bulk_create([
+            RevenueRollupEntry(transaction_id=row['id'], status=status, run=run) for row, status, _ in entries
+        ], ignore_conflicts=True)
+        inserted = set(RevenueRollupEntry.objects.filter(run=run).values_list('transaction_id', 'status'))
+
+        daily = defaultdict(lambda: [0, Decimal(0)])
+        by_property = defaultdict(lambda: [0, Decimal(0)])
+        for row, status, date in entries:
+            if (row['id'], status) not in inserted:
+                continue
+            keys = [(daily, (date, row['transaction_type'], status, row['currency']))]
+            if row['property_id'] is not None:
+                keys.append((by_property, (row['property_id'], status, row['currency'])))
+            for totals, key in keys:
+                totals[key][0] += 1
+                totals[key][1] += row['amount']
+
+        _increment(DailyRevenue, ('date', 'transaction_type', 'status', 'currency'), daily)
+        _increment(PropertyRevenue, ('property_id', 'status', 'currency'), by_property)
+    return len(inserted)
+
+
+def transactions_changed(transaction_ids):
+    """``record`` for payment flows: a rollup failure is logged, never raised.
+
+    Runs in a savepoint, so a failure leaves the caller's transaction
+    usable; ``backfill`` adds what was missed.
+    """
+    if not transaction_ids:
+        return 0
+    try:
+        with transaction.atomic():
+            return record(transaction_ids)
+    except Exception:
+        logger.exception('Could not update revenue rollups for %d transactions', len(transaction_ids))
+        return 0
+
+
+def backfill(chunk_size=DEFAULT_CHUNK_SIZE, on_chunk=None):
+    """Record every completed or refunded transaction, ``chunk_size`` at a time; returns entries added"""
+    added = 0
+    last_id = 0
+    while True:
+        ids = list(Transaction.objects.filter(id__gt=last_id, status__in=ROLLUP_STATUSES).order_by('id').values_list(
+            'id', flat=True
+        )[:chunk_size])
+        if not ids:
+            return added
+        added += record(ids)
+        last_id = ids[-1]
+        if on_chunk is not None:
+            on_chunk(last_id, added)
+
+
+def rebuild(chunk_size=DEFAULT_CHUNK_SIZE, on_chunk=None):
+    """Drop the rollups and count every transaction again"""
+    with transaction.atomic():
+        RevenueRollupEntry.objects.all().delete()
+        DailyRevenue.objects.all().delete()
+        PropertyRevenue.objects.all().delete()
+    return backfill(chunk_size, on_chunk)
@@ -0,0 +1,126 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+from nal_backend.apps.authentication.models import User
+from nal_backend.apps.payments import webhooks
+from nal_backend.apps.payments.models import Transaction
+from nal_backend.apps.properties.models import Property
+from . import rollups
+from .models import DailyRevenue, PropertyRevenue
+
+
+class RevenueRollupTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(email='admin@example.com', username='admin', password='testpass123', role='ADMIN')
+        self.owner = User.objects.create_user(email='seller@example.com', username='seller', password='testpass123', role='SELLER')
+        self.buyer = User.objects.create_user(email='buyer@example.com', username='buyer', password='testpass123', role='BUYER')
+        self.property = Property.objects.create(
+            owner=self.owner, title='Sea view apartment', description='Two bedroom apartment',
+            price='7500000.00', property_type='APARTMENT', status='PUBLISHED', address='12 Marine Drive',
+            city='Mumbai', state='Maharashtra', pincode='400002'
+        )
+        self.today = timezone.localdate()
+    
+    def transaction(self, amount, txn_status='COMPLETED', days_ago=0, transaction_type='BOOKING_FEE', **fields):
+        completed_at = timezone.now() - timedelta(days=days_ago) if txn_status in rollups.ROLLUP_STATUSES else None
+        return Transaction.objects.create(
+            user=self.buyer, property=self.property, amount=amount, transaction_type=transaction_type,
+            status=txn_status, completed_at=completed_at, **fields
+        )
+    
+    def summary(self, **params):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(reverse('revenue-summary'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['data']
+    
+    def test_confirm_and_webhook_count_payment_once(self):
+        """Test a payment confirmed by the API and by a webhook is counted once"""
+        txn = self.transaction('500.00', 'PROCESSING', payment_intent_id='pi_1')
+        self.client.force_authenticate(user=self.buyer)
+        response = self.client.post(reverse('confirm-payment', args=[txn.uuid]), {'payment_method_id': 'pm_card'}, format='json')
+        self.assertEqual(response.data['data']['status'], 'COMPLETED')
+        
+        with override_settings(RAZORPAY_WEBHOOK_SECRET='whsec_test'):
+            body = json.dumps({'id': 'evt_1', 'event': 'payment.captured', 'payload': {'payment': {'entity': {'id': 'pi_1'}}}}).encode()
+            self.client.post(reverse('razorpay-webhook'), body, content_type='application/json',
+                             HTTP_X_RAZORPAY_SIGNATURE=webhooks.sign(body))
+            webhooks.process_pending()
+        
+        daily = DailyRevenue.objects.get()
+        self.assertEqual((daily.date, daily.status, daily.count, daily.amount), (self.today, 'COMPLETED', 1, Decimal('500.00')))
+        self.assertEqual(PropertyRevenue.objects.get(property=self.property).count, 1)
+    
+    def test_summary_totals_and_series(self):
+        """Test the summary reads totals, per-type totals and a zero-filled series from the rollups"""
+        self.transaction('500.00')
+        self.transaction('250.00', days_ago=2, transaction_type='COMMISSION')
+        refunded = self.transaction('100.00', days_ago=2)
+        rollups.backfill()
+        Transaction.objects.filter(id=refunded.id).update(status='REFUNDED')
+        rollups.record([refunded.id])
+        
+        data = self.summary(**{'from': (self.today - timedelta(days=2)).isoformat(), 'to': self.today.isoformat()})
+        self.assertEqual(data['totals']['completed'], {'count': 3, 'amount': Decimal('850.00')})
+        self.assertEqual(data['totals']['refunded'], {'count': 1, 'amount': Decimal('100.00')})
+        self.assertEqual(data['totals']['net_amount'], Decimal('750.00'))
+        self.assertEqual(data['by_type']['COMMISSION']['completed']['amount'], Decimal('250.00'))
+        self.assertEqual([day['completed']['count'] for day in data['series']], [2, 0, 1])
+        
+        monthly = self.summary(granularity='month', transaction_type='COMMISSION')
+        self.assertEqual(monthly['totals']['net_amount'], Decimal('250.00'))
+        self.assertEqual(monthly['series'][-1]['date'], self.today.replace(day=1))
+    
+    def test_summary_queries_independent_of_history(self):
+        """Test the summary costs the same queries however many transactions there are"""
+        self.transaction('500.00')
+        rollups.backfill()
+        with CaptureQueriesContext(connection) as few:
+            self.summary()
+        for index in range(40):
+            self.transaction('10.00', days_ago=index % 20)
+        rollups.backfill()
+        with CaptureQueriesContext(connection) as many:
+            data = self.summary()
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(data['totals']['completed']['count'], 41)
+    
+    def test_backfill_command_is_resumable(self):
+        """Test the backfill counts existing transactions once, however often it runs"""
+        for index in range(5):
+            self.transaction('100.00', days_ago=index)
+        self.transaction('100.00', 'FAILED')
+        rollups.record(Transaction.objects.order_by('id').values_list('id', flat=True)[:2])
+        
+        call_command('backfill_revenue_rollups', '--chunk-size', '2', stdout=StringIO())
+        call_command('backfill_revenue_rollups', stdout=StringIO())
+        self.assertEqual(sum(DailyRevenue.objects.values_list('count', flat=True)), 5)
+        call_command('backfill_revenue_rollups', '--rebuild', stdout=StringIO())
+        self.assertEqual(PropertyRevenue.objects.get().amount, Decimal('500.00'))
+    
+    def test_access_control(self):
+        """Test only admins see the summary and only admins and the owner see a property"""
+        self.client.force_authenticate(user=self.buyer)
+        self.assertEqual(self.client.get(reverse('revenue-summary')).status_code, status.HTTP_403_FORBIDDEN)
+        url = reverse('property-revenue', args=[self.property.uuid])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        
+        self.transaction('500.00')
+        rollups.backfill()
+        self.client.force_authenticate(user=self.owner)
+        response = self.client.get(url)
+        self.assertEqual(response.data['data']['totals']['INR']['completed']['amount'], Decimal('500.00'))
+        
+        self.client.force_authenticate(user=self.admin)
+        self.assertEqual(self.client.get(reverse('revenue-summary'), {'granularity': 'week'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
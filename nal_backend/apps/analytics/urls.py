@@ -1,5 +1,7 @@
 from django.urls import path
+from . import views
 
 urlpatterns = [
-    # Analytics endpoints will be added here
-]
\ No newline at end of file
+    path('revenue/', views.revenue_summary, name='revenue-summary'),
+    path('revenue/properties/<uuid:property_id>/', views.property_revenue, name='property-revenue'),
+]
@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from nal_backend.apps.payments.models import Transaction
+from nal_backend.apps.properties.models import Property
+from .models import DailyRevenue, PropertyRevenue
+
+REVENUE_ROLES = ('ADMIN', 'SYSTEM')
+# Longest range per granularity, so a response stays bounded
+MAX_DAYS = {'day': 366, 'month': 3660}
+DEFAULT_DAYS = 30
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def revenue_summary(request):
+    """Revenue totals and time series, read from the daily rollups"""
+    if request.user.role not in REVENUE_ROLES:
+        return Response({
+            'success': False,
+            'errors': ['Only admins can view revenue analytics']
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    granularity = request.GET.get('granularity', 'day')
+    transaction_type = request.GET.get('transaction_type')
+    currency = request.GET.get('currency', 'INR')
+    try:
+        end_date = _parse_date(request.GET.get('to')) or timezone.localdate()
+        start_date = _parse_date(request.GET.get('from')) or end_date - timedelta(days=DEFAULT_DAYS - 1)
+    except ValueError:
+        return Response({
+            'success': False,
+            'errors': ['from and to must be YYYY-MM-DD dates']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if granularity not in MAX_DAYS:
+        return Response({
+            'success': False,
+            'errors': [f'granularity must be one of: {", ".join(MAX_DAYS)}']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if transaction_type and transaction_type not in dict(Transaction.TRANSACTION_TYPE_CHOICES):
+        return Response({
+            'success': False,
+            'errors': ['Unknown transaction_type']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if end_date < start_date or (end_date - start_date).days >= MAX_DAYS[granularity]:
+        return Response({
+            'success': False,
+            'errors': [f'to must be on or after from and at most {MAX_DAYS[granularity]} days later']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    rollups = DailyRevenue.objects.filter(date__range=(start_date, end_date), currency=currency)
+    if transaction_type:
+        rollups = rollups.filter(transaction_type=transaction_type)
+    
+    if granularity == 'month':
+        periods = _months(start_date, end_date)
+        period = TruncMonth('date')
+    else:
+        periods = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+        period = F('date')
+    series = {day: _empty_totals() for day in periods}
+    by_type = {}
+    grouped = rollups.annotate(period=period).values('period', 'transaction_type', 'status').annotate(
+        total_count=Sum('count'), total_amount=Sum('amount')
+    )
+    for row in grouped:
+        for totals in (series[row['period']], by_type.setdefault(row['transaction_type'], _empty_totals())):
+            _add(totals, row['status'], row['total_count'], row['total_amount'])
+    
+    overall = _empty_totals()
+    for totals in series.values():
+        for key in ('completed', 'refunded'):
+            _add(overall, key.upper(), totals[key]['count'], totals[key]['amount'])
+    
+    return Response({
+        'success': True,
+        'data': {
+            'from': start_date,
+            'to': end_date,
+            'granularity': granularity,
+            'currency': currency,
+            'totals': overall,
+            'by_type': by_type,
+            'series': [{'date': day, **totals} for day, totals in series.items()]
+        }
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def property_revenue(request, property_id):
+    """All-time revenue of a property, for admins and its owner"""
+    try:
+        property_obj = Property.objects.only('id', 'owner_id').get(uuid=property_id)
+    except Property.DoesNotExist:
+        return Response({
+            'success': False,
+            'errors': ['Property not found']
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    if request.user.role not in REVENUE_ROLES and property_obj.owner_id != request.user.id:
+        return Response({
+            'success': False,
+            'errors': ['Only admins and the owner can view property revenue']
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    currencies = {}
+    for row in PropertyRevenue.objects.filter(property_id=property_obj.id).values('currency', 'status', 'count', 'amount'):
+        _add(currencies.setdefault(row['currency'], _empty_totals()), row['status'], row['count'], row['amount'])
+    
+    return Response({
+        'success': True,
+        'data': {
+            'property_id': property_id,
+            'totals': currencies
+        }
+    })
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+def _months(start_date, end_date):
+    months = []
+    month = start_date.replace(day=1)
+    while month <= end_date:
+        months.append(month)
+        month = (month + timedelta(days=32)).replace(day=1)
+    return months
+
+def _empty_totals():
+    return {
+        'completed': {'count': 0, 'amount': Decimal('0.00')},
+        'refunded': {'count': 0, 'amount': Decimal('0.00')},
+        'net_amount': Decimal('0.00'),
+    }
+
+def _add(totals, rollup_status, count, amount):
+    totals[rollup_status.lower()]['count'] += count
+    totals[rollup_status.lower()]['amount'] += amount
+    totals['net_amount'] += amount if rollup_status == 'COMPLETED' else -amount
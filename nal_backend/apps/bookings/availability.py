@@ -0,0 +1,183 @@
+"""Set-based slot availability for a property.
+
+Availability is worked out per property and day from two things:
+
+* the day's slots: the property's ``BookingSlot`` rows for that date
+  (``is_available`` and ``max_bookings`` respected) or, for dates without
+  rows, the default schedule of hourly slots from 9:00 to 18:00 on weekdays.
+  Properties with active ``AvailabilityRule`` rows have no default schedule:
+  their rules are materialized into slot rows (see ``rules``),
+* an occupancy map: the number of active bookings covering each
+  ``CELL_MINUTES`` cell of the day. Bookings cover every cell their
+  ``duration_minutes`` touch, running into the next day past midnight.
+
+A slot is free while the busiest cell it spans holds fewer bookings than
+its capacity. Days are loaded for many properties and dates with three
+queries (slots, properties with rules, then one range query for active
+bookings) and are what the occupancy cache stores, so answering a window
+never queries per slot.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import islice
+
+from django.utils import timezone
+
+from .models import AvailabilityRule, Booking, BookingSlot
+
+ACTIVE_STATUSES = ('PENDING', 'CONFIRMED')
+DEFAULT_HOURS = range(9, 18)
+DEFAULT_WEEKDAYS = range(0, 5)
+DEFAULT_SLOT_MINUTES = 60
+DEFAULT_WINDOW_DAYS = 30
+MAX_WINDOW_DAYS = 90
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+CELL_MINUTES = 15
+CELLS_PER_DAY = 24 * 60 // CELL_MINUTES
+# Bookings are assumed to last at most a day, so only the day before a
+# window can hold bookings running into it
+MAX_BOOKING_DAYS = 1
+
+
+def minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def dates_between(start_date, end_date):
+    return [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+
+def default_slots(date):
+    """``(start minute, end minute, capacity)`` of the default schedule"""
+    if date.weekday() not in DEFAULT_WEEKDAYS:
+        return ()
+    return tuple((hour * 60, hour * 60 + DEFAULT_SLOT_MINUTES, 1) for hour in DEFAULT_HOURS)
+
+
+def configured_slot(start, end, is_available, max_bookings):
+    """A ``BookingSlot`` row as ``(start minute, end minute, capacity)``"""
+    start_minute, end_minute = minutes(start), minutes(end)
+    if end_minute <= start_minute:
+        end_minute += 24 * 60
+    # Unavailable rows keep capacity 0 so they still claim their date,
+    # hiding the default schedule
+    return start_minute, end_minute, max_bookings if is_available else 0
+
+
+def day_slots(property_id, date):
+    """Slots of one property on one date"""
+    rows = BookingSlot.objects.filter(property_id=property_id, date=date).order_by('start_time').values_list(
+        'start_time', 'end_time', 'is_available', 'max_bookings'
+    )
+    slots = tuple(configured_slot(*row) for row in rows)
+    if slots or ruled_properties([property_id]):
+        return slots
+    return default_slots(date)
+
+
+def ruled_properties(property_ids):
+    """Those of ``property_ids`` whose schedule comes from availability rules only"""
+    return set(AvailabilityRule.objects.filter(property_id__in=property_ids, is_active=True).values_list(
+        'property_id', flat=True
+    ))
+
+
+def booking_cells(start_minute, duration):
+    """Cells covered by a booking, counted from the start of its day"""
+    end_minute = start_minute + (duration or DEFAULT_SLOT_MINUTES)
+    return range(start_minute // CELL_MINUTES, -(-end_minute // CELL_MINUTES))
+
+
+def load_days(property_ids, start_date, end_date):
+    """``{(property_id, date): (occupancy, slots)}`` for every property and date in the range.
+
+    ``occupancy`` is a ``bytes`` of ``CELLS_PER_DAY`` booking counts and
+    ``slots`` a tuple of ``(start minute, end minute, capacity)``; end
+    minutes past 1440 run into the next day.
+    """
+    property_ids = list(property_ids)
+    dates = dates_between(start_date, end_date)
+
+    configured = defaultdict(list)
+    rows = BookingSlot.objects.filter(
+        property_id__in=property_ids, date__range=(start_date, end_date)
+    ).order_by('start_time').values_list('property_id', 'date', 'start_time', 'end_time', 'is_available', 'max_bookings')
+    for property_id, date, *slot in rows:
+        configured[property_id, date].append(configured_slot(*slot))
+    ruled = ruled_properties(property_ids)
+
+    counts = {(property_id, date): bytearray(CELLS_PER_DAY) for property_id in property_ids for date in dates}
+    bookings = Booking.objects.filter(
+        property_id__in=property_ids,
+        booking_date__range=(start_date - timedelta(days=MAX_BOOKING_DAYS), end_date),
+        status__in=ACTIVE_STATUSES,
+    ).values_list('property_id', 'booking_date', 'booking_time', 'duration_minutes')
+    for property_id, date, start, duration in bookings:
+        for cell in booking_cells(minutes(start), duration):
+            day = counts.get((property_id, date + timedelta(days=cell // CELLS_PER_DAY)))
+            if day is not None:
+                day[cell % CELLS_PER_DAY] = min(day[cell % CELLS_PER_DAY] + 1, 255)
+
+    return {
+        key: (bytes(occupancy), tuple(configured[key]) if key in configured or key[0] in ruled else default_slots(key[1]))
+        for key, occupancy in counts.items()
+    }
+
+
+EMPTY_DAY = (bytes(CELLS_PER_DAY), ())
+
+
+def remaining(occupancy, following, start_minute, end_minute, capacity):
+    """Free places of a slot given its day's occupancy and the next day's"""
+    if capacity <= 0:
+        return 0
+    cells = range(start_minute // CELL_MINUTES, -(-end_minute // CELL_MINUTES))
+    return capacity - max(occupancy[cell] if cell < CELLS_PER_DAY else following[cell - CELLS_PER_DAY] for cell in cells)
+
+
+def free_hours(day, following=EMPTY_DAY):
+    """Bit mask of the hours of ``day`` in which a slot with a free place starts"""
+    occupancy, slots = day
+    mask = 0
+    for start_minute, end_minute, capacity in slots:
+        if remaining(occupancy, following[0], start_minute, end_minute, capacity) > 0:
+            mask |= 1 << start_minute // 60
+    return mask
+
+
+def iter_free_slots(days, start_date, end_date, now=None):
+    """Yield ``(date, start minute, end minute, remaining)`` for free slots in order.
+
+    ``days`` maps dates to ``(occupancy, slots)`` and must include the day
+    after ``end_date`` for slots running past midnight.
+    """
+    now = now or timezone.localtime().replace(tzinfo=None)
+    for date in dates_between(start_date, end_date):
+        occupancy, slots = days[date]
+        following = days.get(date + timedelta(days=1), EMPTY_DAY)[0]
+        for start_minute, end_minute, capacity in slots:
+            if datetime.combine(date, datetime.min.time()) + timedelta(minutes=start_minute) < now:
+                continue
+            free = remaining(occupancy, following, start_minute, end_minute, capacity)
+            if free > 0:
+                yield date, start_minute, end_minute, free
+
+
+def _clock(minute):
+    minute %= 24 * 60
+    return f'{minute // 60:02d}:{minute % 60:02d}'
+
+
+def free_slots(days, start_date, end_date, limit=DEFAULT_LIMIT, now=None):
+    """Up to ``limit`` free slots as response dicts"""
+    return [
+        {
+            'date': date.isoformat(),
+            'time': _clock(start_minute),
+            'end_time': _clock(end_minute),
+            'remaining': remaining,
+            'available': True,
+        }
+        for date, start_minute, end_minute, remaining in islice(iter_free_slots(days, start_date, end_date, now), limit)
+    ]
@@ -0,0 +1,80 @@
+"""Availability index behind the ``available_on`` listing filter.
+
+``PropertyAvailability`` keeps, per property and day, a 24 bit mask of the
+hours in which a slot with a free place starts. "Free on Saturday between 9
+and 12" is then one indexed semi-join for any number of listings:
+properties whose row for that date has a bit of the window set, plus, when
+the default schedule has slots in the window, properties without a row for
+that date and without availability rules (nothing was booked or configured,
+so the default schedule holds).
+
+Rows are written whenever the occupancy cache refreshes a day, i.e. after
+booking writes and ``BookingSlot`` changes commit, and by
+``rebuild_availability_cache``. Listing pages filtered on availability
+depend on the ``availability`` listing cache namespace, bumped on every
+index write.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from nal_backend.apps.properties.cache import bump_namespaces
+
+from . import availability
+from .models import AvailabilityRule, PropertyAvailability
+
+LISTING_NAMESPACE = 'availability'
+
+
+def hour_mask(from_hour, until_hour):
+    """Bits of the hours from ``from_hour`` up to, not including, ``until_hour``"""
+    return sum(1 << hour for hour in range(max(from_hour, 0), min(until_hour, 24)))
+
+
+def update(days):
+    """Write the free hours of ``{(property_id, date): day}`` to the index.
+
+    Days are indexed when the following day of the same property is also
+    given, so slots running past midnight are judged correctly.
+    """
+    rows = [
+        PropertyAvailability(
+            property_id=property_id, date=date,
+            free_hours=availability.free_hours(day, days[property_id, date + timedelta(days=1)])
+        )
+        for (property_id, date), day in days.items()
+        if (property_id, date + timedelta(days=1)) in days
+    ]
+    if not rows:
+        return 0
+    # MySQL upserts on any unique key and rejects an explicit target
+    unique_fields = ['property', 'date'] if connection.features.supports_update_conflicts_with_target else None
+    PropertyAvailability.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=unique_fields, update_fields=['free_hours', 'updated_at']
+    )
+    transaction.on_commit(lambda: bump_namespaces([LISTING_NAMESPACE]))
+    return len(rows)
+
+
+def prune(before):
+    """Drop index rows of days before ``before``"""
+    return PropertyAvailability.objects.filter(date__lt=before).delete()[0]
+
+
+def filter_available(queryset, date, from_hour=0, until_hour=24):
+    """Keep properties with a free slot starting on ``date`` within the hour window"""
+    window = hour_mask(from_hour, until_hour)
+    now = timezone.localtime()
+    if date == now.date():
+        # Slots of hours already under way are no longer offered
+        window &= ~hour_mask(0, now.hour + 1)
+
+    indexed = PropertyAvailability.objects.filter(date=date)
+    free = indexed.alias(open_hours=F('free_hours').bitand(window)).filter(open_hours__gt=0)
+    condition = Q(id__in=free.values('property_id'))
+    if availability.free_hours((bytes(availability.CELLS_PER_DAY), availability.default_slots(date))) & window:
+        ruled = AvailabilityRule.objects.filter(is_active=True).values('property_id')
+        condition |= ~Q(id__in=indexed.values('property_id')) & ~Q(id__in=ruled)
+    return queryset.filter(condition) if window else queryset.none()
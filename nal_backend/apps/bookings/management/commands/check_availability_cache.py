@@ -0,0 +1,40 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from nal_backend.apps.bookings import availability, occupancy
+from nal_backend.apps.properties.models import Property
+
+
+class Command(BaseCommand):
+    help = 'Compare the booking slot occupancy cache with the Booking rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=availability.DEFAULT_WINDOW_DAYS)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--fix', action='store_true', help='Overwrite stale entries with the database state')
+
+    def handle(self, *args, **options):
+        start_date = timezone.localdate()
+        end_date = start_date + timedelta(days=options['days'])
+
+        batch_size = options['batch_size']
+        property_ids = Property.objects.filter(status='PUBLISHED').order_by('id').values_list('id', flat=True)
+        stale = {}
+        batch = []
+        for property_id in property_ids.iterator(chunk_size=batch_size):
+            batch.append(property_id)
+            if len(batch) >= batch_size:
+                stale.update(occupancy.check(batch, start_date, end_date))
+                batch = []
+        if batch:
+            stale.update(occupancy.check(batch, start_date, end_date))
+
+        for property_id, date in sorted(stale):
+            self.stdout.write(f'Stale: property {property_id} on {date.isoformat()}')
+        if stale and options['fix']:
+            occupancy.store_days(stale)
+            self.stdout.write(self.style.SUCCESS(f'Fixed {len(stale)} stale property days'))
+        elif stale:
+            raise CommandError(f'{len(stale)} stale property days (rerun with --fix to repair)')
+        else:
+            self.stdout.write(self.style.SUCCESS('Availability cache matches the bookings'))
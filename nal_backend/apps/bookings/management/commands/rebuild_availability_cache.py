@@ -0,0 +1,32 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from nal_backend.apps.bookings import availability, availability_index, occupancy
+from nal_backend.apps.properties.models import Property
+
+
+class Command(BaseCommand):
+    help = 'Repopulate the booking slot occupancy cache and availability index of published properties'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=availability.DEFAULT_WINDOW_DAYS)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        start_date = timezone.localdate()
+        end_date = start_date + timedelta(days=options['days'])
+
+        batch_size = options['batch_size']
+        property_ids = Property.objects.filter(status='PUBLISHED').order_by('id').values_list('id', flat=True)
+        batch = []
+        entries = 0
+        for property_id in property_ids.iterator(chunk_size=batch_size):
+            batch.append(property_id)
+            if len(batch) >= batch_size:
+                entries += occupancy.rebuild(batch, start_date, end_date)
+                batch = []
+        if batch:
+            entries += occupancy.rebuild(batch, start_date, end_date)
+
+        pruned = availability_index.prune(start_date)
+        self.stdout.write(self.style.SUCCESS(f'Cached and indexed {entries} property days, pruned {pruned} past days'))
@@ -28,6 +28,9 @@ class Booking(models.Model):
     duration_minutes = models.IntegerField(default=60)
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    # Place taken in the slot (1..capacity) while the booking is active; the
+    # unique constraint below arbitrates concurrent reservations
+    seat = models.PositiveSmallIntegerField(null=True, blank=True)
     notes = models.TextField(blank=True)
     
     # Contact details
@@ -54,6 +57,12 @@ class Booking(models.Model):
             models.Index(fields=['booking_date', 'booking_time']),
             models.Index(fields=['status']),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['property', 'booking_date', 'booking_time', 'seat'],
+                name='booking_unique_slot_seat'
+            ),
+        ]
 
 class BookingSlot(models.Model):
     property = models.ForeignKey('properties.Property', on_delete=models.CASCADE, related_name='available_slots')
@@ -62,9 +71,52 @@ class BookingSlot(models.Model):
     end_time = models.TimeField()
     is_available = models.BooleanField(default=True)
     max_bookings = models.IntegerField(default=1)
+    # Materialized from an AvailabilityRule; rows added by hand are never rewritten
+    generated = models.BooleanField(default=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         db_table = 'booking_slots'
-        unique_together = ['property', 'date', 'start_time']
\ No newline at end of file
+        unique_together = ['property', 'date', 'start_time']
+
+class AvailabilityRule(models.Model):
+    """Weekly recurring visiting hours of a property, materialized into BookingSlot rows"""
+    property = models.ForeignKey('properties.Property', on_delete=models.CASCADE, related_name='availability_rules')
+    # Bit 0 is Monday, bit 6 Sunday
+    weekdays = models.PositiveSmallIntegerField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=60)
+    max_bookings = models.PositiveSmallIntegerField(default=1)
+    is_active = models.BooleanField(default=True)
+    # Slots exist up to this date; None until the rule's first sync
+    materialized_until = models.DateField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'availability_rules'
+        indexes = [
+            models.Index(fields=['is_active', 'materialized_until']),
+        ]
+    
+    def applies_on(self, date):
+        return bool(self.weekdays >> date.weekday() & 1)
+
+class PropertyAvailability(models.Model):
+    """Hours of a day in which a property has a free booking slot"""
+    property = models.ForeignKey('properties.Property', on_delete=models.CASCADE, related_name='availability_days')
+    date = models.DateField()
+    # Bit h is set when a slot with a free place starts in hour h
+    free_hours = models.IntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'property_availability'
+        unique_together = ['property', 'date']
+        indexes = [
+            models.Index(fields=['date', 'free_hours']),
+        ]
@@ -0,0 +1,123 @@
+"""Per-property, per-day occupancy cache behind the slot endpoint.
+
+Each property-day is cached under its own key as the ``(occupancy,
+slots)`` pair built by ``availability.load_days``: 96 bytes of booking
+counts (one per 15 minute cell; counts rather than bits so
+``max_bookings`` above one can be honoured) plus the day's slots. A window
+is read with one ``get_many``; only missing days touch the database, in
+two queries for all of them.
+
+The cache is the ``availability`` alias: Redis in production, local memory
+under the test suite. Booking writes, through any code path that saves or
+deletes ``Booking`` rows (see ``signals``), rebuild the days they touch once
+their transaction commits, so readers never see uncommitted bookings.
+Queryset ``update()`` and bulk writes bypass this and must call
+``booking_changed`` or ``refresh_days`` themselves. Entries
+expire after ``OCCUPANCY_TIMEOUT`` to bound staleness after missed updates
+(for instance while Redis was unreachable); when the cache itself fails,
+reads fall back to the database.
+
+Every refresh also rewrites the days in the availability index (see
+``availability_index``). ``rebuild_availability_cache`` repopulates both
+after a loss and ``check_availability_cache`` compares the cache with the
+``Booking`` rows.
+"""
+import logging
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.db import transaction
+
+from . import availability, availability_index
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'availability'
+OCCUPANCY_TIMEOUT = 60 * 60
+
+
+def occupancy_key(property_id, date):
+    return f'bookings:occupancy:{property_id}:{date.isoformat()}'
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def store_days(days):
+    """Write ``{(property_id, date): day}`` to the cache"""
+    try:
+        _cache().set_many({occupancy_key(*key): day for key, day in days.items()}, OCCUPANCY_TIMEOUT)
+    except Exception:
+        logger.warning('Could not write %d availability entries', len(days), exc_info=True)
+
+
+def cached_days(property_id, start_date, end_date):
+    """``{date: (occupancy, slots)}`` from ``start_date`` to ``end_date``, loading misses"""
+    dates = availability.dates_between(start_date, end_date)
+    keys = {occupancy_key(property_id, date): date for date in dates}
+    try:
+        found = _cache().get_many(list(keys))
+    except Exception:
+        logger.warning('Availability cache unavailable, reading bookings', exc_info=True)
+        found = None
+
+    days = {keys[key]: day for key, day in (found or {}).items()}
+    missing = [date for date in dates if date not in days]
+    if missing:
+        loaded = availability.load_days([property_id], min(missing), max(missing))
+        days.update({date: day for (_, date), day in loaded.items() if date not in days})
+        if found is not None:
+            store_days({(property_id, date): loaded[property_id, date] for date in missing})
+    return days
+
+
+def refresh_days(property_id, start_date, end_date):
+    """Rebuild the cached and indexed days of ``property_id`` from the database"""
+    # The following day decides slots running past midnight
+    days = availability.load_days([property_id], start_date, end_date + timedelta(days=1))
+    store_days(days)
+    availability_index.update(days)
+
+
+def booking_days(booking):
+    """``(property_id, first date, last date)`` of the cached days ``booking`` can change, or None"""
+    if booking.property_id is None or booking.booking_date is None or booking.booking_time is None:
+        return None
+    # Saving leaves values assigned as strings (admin, shell) unconverted on the instance
+    start_date = booking._meta.get_field('booking_date').to_python(booking.booking_date)
+    booking_time = booking._meta.get_field('booking_time').to_python(booking.booking_time)
+    duration = int(booking.duration_minutes)
+    last_cell = availability.booking_cells(availability.minutes(booking_time), duration)[-1]
+    end_date = start_date + timedelta(days=last_cell // availability.CELLS_PER_DAY)
+    # Slots of the day before that run past midnight overlap the booking too
+    return booking.property_id, start_date - timedelta(days=1), end_date
+
+
+def booking_changed(booking):
+    """Refresh the days ``booking`` covers once the current transaction commits"""
+    days = booking_days(booking)
+    if days is not None:
+        transaction.on_commit(lambda: refresh_days(*days))
+
+
+def rebuild(property_ids, start_date, end_date):
+    """Load, cache and index every day of ``property_ids`` in the range; returns the entry count"""
+    days = availability.load_days(property_ids, start_date, end_date + timedelta(days=1))
+    store_days(days)
+    availability_index.update(days)
+    return len(days)
+
+
+def check(property_ids, start_date, end_date):
+    """Cached entries that disagree with the database, as ``{(property_id, date): expected}``.
+
+    Entries missing from the cache are not reported; they are loaded on the
+    next read.
+    """
+    expected = availability.load_days(property_ids, start_date, end_date)
+    cached = _cache().get_many([occupancy_key(*key) for key in expected])
+    return {
+        key: day for key, day in expected.items()
+        if occupancy_key(*key) in cached and cached[occupancy_key(*key)] != day
+    }
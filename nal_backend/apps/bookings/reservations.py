@@ -0,0 +1,69 @@
+"""Contention-safe slot reservation.
+
+An active booking holds a numbered ``seat`` in its slot, from 1 to the
+slot's capacity, and the ``(property, booking_date, booking_time, seat)``
+unique constraint lets the database decide between concurrent buyers: a
+reservation reads the seats already taken, then inserts with the first free
+seat, moving on to the next one when a concurrent insert won it. There is no
+lock and no serialization between buyers of different slots; buyers of the
+same slot only retry an insert per seat lost.
+
+Released bookings (cancelled, completed, no-show) give their seat back by
+setting it to NULL, which the constraint ignores. Bookings must start on a
+slot and fit in it, so a seat covers the booking's whole duration.
+"""
+from django.db import IntegrityError, transaction
+
+from . import availability
+from .models import Booking
+
+RELEASED_STATUSES = ('CANCELLED', 'COMPLETED', 'NO_SHOW')
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def slot_capacity(property_id, booking_date, booking_time, duration_minutes=None):
+    """``(capacity, duration)`` of the slot starting at ``booking_time``.
+
+    Raises ``SlotUnavailable`` when no bookable slot starts then or the
+    requested duration overruns it.
+    """
+    start_minute = availability.minutes(booking_time)
+    for slot_start, slot_end, capacity in availability.day_slots(property_id, booking_date):
+        if slot_start == start_minute:
+            if capacity <= 0:
+                break
+            duration = duration_minutes or slot_end - slot_start
+            if duration > slot_end - slot_start:
+                raise SlotUnavailable(f'Bookings in this slot can last at most {slot_end - slot_start} minutes')
+            return capacity, duration
+    raise SlotUnavailable('This time slot is not available')
+
+
+def reserve(capacity, **fields):
+    """Create an active booking on the first free seat of its slot.
+
+    ``fields`` are the ``Booking`` fields. Raises ``SlotUnavailable`` once
+    every seat is taken.
+    """
+    active = list(Booking.objects.filter(
+        property_id=fields['property_id'],
+        booking_date=fields['booking_date'],
+        booking_time=fields['booking_time'],
+        status__in=availability.ACTIVE_STATUSES,
+    ).values_list('seat', flat=True))
+    taken = set(active)
+    # Active bookings made before seats existed hold capacity without a seat
+    seats = capacity - active.count(None)
+    for seat in range(1, seats + 1):
+        if seat in taken:
+            continue
+        try:
+            with transaction.atomic():
+                return Booking.objects.create(seat=seat, **fields)
+        except IntegrityError:
+            # A concurrent reservation got this seat first
+            continue
+    raise SlotUnavailable('This time slot is not available')
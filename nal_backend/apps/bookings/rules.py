@@ -0,0 +1,131 @@
+"""Materialize ``AvailabilityRule`` rows into ``BookingSlot`` rows.
+
+Rules describe a property's weekly visiting hours ("Mon-Fri 10:00-17:00,
+30 minute slots, 2 visitors per slot"). ``BookingSlot`` rows are kept for a
+rolling ``MATERIALIZE_DAYS`` window and every sync only writes the delta
+between the rows the rules call for and the generated rows already there:
+missing slots are bulk created (``ignore_conflicts`` leaves slots added by
+hand alone), changed ones updated and the ones no rule calls for deleted.
+
+* A rule change resyncs that property's whole window (one task per change).
+* The nightly roll-forward only creates the days that entered the window
+  since each property's last sync (``materialized_until``), in batches of
+  properties, so its cost depends on the number of new days, not on the
+  size of the window, and drops generated slots that are past.
+
+Changed days are then refreshed in bulk in the occupancy cache and the
+availability index.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from . import availability, occupancy
+from .models import AvailabilityRule, BookingSlot
+from .signals import bulk_slot_changes
+
+MATERIALIZE_DAYS = 60
+DEFAULT_BATCH_SIZE = 500
+
+
+def rule_slots(rule, date):
+    """``(start_time, end_time)`` of the slots ``rule`` opens on ``date``"""
+    if not rule.applies_on(date) or rule.slot_minutes <= 0:
+        return []
+    slots = []
+    start = datetime.combine(date, rule.start_time)
+    end = datetime.combine(date, rule.end_time)
+    step = timedelta(minutes=rule.slot_minutes)
+    while start + step <= end:
+        slots.append((start.time(), (start + step).time()))
+        start += step
+    return slots
+
+
+def desired_slots(rules, start_date, end_date):
+    """``{(property_id, date, start_time): (end_time, max_bookings)}`` the rules call for"""
+    desired = {}
+    for date in availability.dates_between(start_date, end_date):
+        for rule in rules:
+            for start_time, end_time in rule_slots(rule, date):
+                key = (rule.property_id, date, start_time)
+                # Overlapping rules: the larger capacity wins
+                if key not in desired or desired[key][1] < rule.max_bookings:
+                    desired[key] = (end_time, rule.max_bookings)
+    return desired
+
+
+def sync_properties(property_ids, start_date, end_date):
+    """Bring the generated slots of ``property_ids`` in the range in line with their rules.
+
+    Returns ``(created, updated, deleted)`` slot counts.
+    """
+    property_ids = list(property_ids)
+    rules = list(AvailabilityRule.objects.filter(property_id__in=property_ids, is_active=True))
+    desired = desired_slots(rules, start_date, end_date)
+
+    existing = BookingSlot.objects.filter(property_id__in=property_ids, date__range=(start_date, end_date))
+    stale = []
+    to_delete = []
+    for slot in existing.only('id', 'property_id', 'date', 'start_time', 'end_time', 'max_bookings', 'is_available', 'generated'):
+        wanted = desired.pop((slot.property_id, slot.date, slot.start_time), None)
+        if not slot.generated:
+            continue
+        if wanted is None:
+            to_delete.append(slot.id)
+        elif (slot.end_time, slot.max_bookings, slot.is_available) != (wanted[0], wanted[1], True):
+            slot.end_time, slot.max_bookings, slot.is_available = wanted[0], wanted[1], True
+            stale.append(slot)
+
+    with transaction.atomic(), bulk_slot_changes():
+        BookingSlot.objects.bulk_create([
+            BookingSlot(property_id=property_id, date=date, start_time=start_time, end_time=end_time,
+                        max_bookings=max_bookings, generated=True)
+            for (property_id, date, start_time), (end_time, max_bookings) in desired.items()
+        ], batch_size=2000, ignore_conflicts=True)
+        BookingSlot.objects.bulk_update(stale, ['end_time', 'max_bookings', 'is_available'], batch_size=2000)
+        deleted = BookingSlot.objects.filter(id__in=to_delete).delete()[0] if to_delete else 0
+        AvailabilityRule.objects.filter(property_id__in=property_ids, is_active=True).update(materialized_until=end_date)
+        transaction.on_commit(lambda: occupancy.rebuild(property_ids, start_date, end_date))
+    return len(desired), len(stale), deleted
+
+
+def sync_property(property_id, today=None):
+    """Resync a property's whole window after one of its rules changed"""
+    today = today or timezone.localdate()
+    return sync_properties([property_id], today, today + timedelta(days=MATERIALIZE_DAYS))
+
+
+def roll_forward(today=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Extend every property's slots to the end of the window; returns created slot and property counts"""
+    today = today or timezone.localdate()
+    end_date = today + timedelta(days=MATERIALIZE_DAYS)
+    with bulk_slot_changes():
+        BookingSlot.objects.filter(generated=True, date__lt=today).delete()
+
+    # Properties behind the window, grouped by where their slots stop
+    # Min() skips NULLs, so rules never materialized are counted separately
+    behind = AvailabilityRule.objects.filter(
+        Q(materialized_until__isnull=True) | Q(materialized_until__lt=end_date), is_active=True
+    ).values('property_id').annotate(
+        until=Min('materialized_until'),
+        unmaterialized=Count('id', filter=Q(materialized_until__isnull=True)),
+    ).order_by('property_id')
+    by_start = defaultdict(list)
+    for row in behind.iterator():
+        if row['unmaterialized'] or row['until'] is None:
+            start_date = today
+        else:
+            start_date = max(row['until'] + timedelta(days=1), today)
+        by_start[start_date].append(row['property_id'])
+
+    created = properties = 0
+    for start_date, property_ids in sorted(by_start.items()):
+        for index in range(0, len(property_ids), batch_size):
+            batch = property_ids[index:index + batch_size]
+            created += sync_properties(batch, start_date, end_date)[0]
+            properties += len(batch)
+    return created, properties
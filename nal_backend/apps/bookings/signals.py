@@ -0,0 +1,71 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from nal_backend.apps.properties.models import Property
+from . import occupancy
+from .models import AvailabilityRule, Booking, BookingSlot
+
+_bulk = threading.local()
+
+
+@contextmanager
+def bulk_slot_changes():
+    """Skip per-row day refreshes; the caller refreshes the days it changed"""
+    _bulk.active = True
+    try:
+        yield
+    finally:
+        _bulk.active = False
+
+
+def refresh_day(property_id, date):
+    # Deleting a property cascades to its slots; nothing left to refresh
+    if Property.objects.filter(id=property_id).exists():
+        occupancy.refresh_days(property_id, date, date)
+
+
+@receiver(post_save, sender=BookingSlot)
+@receiver(post_delete, sender=BookingSlot)
+def refresh_slot_day(sender, instance, **kwargs):
+    if getattr(_bulk, 'active', False):
+        return
+    # Slot rows replace the default schedule of their date
+    property_id, date = instance.property_id, instance.date
+    transaction.on_commit(lambda: refresh_day(property_id, date))
+
+
+def refresh_booking_days(property_id, start_date, end_date):
+    if Property.objects.filter(id=property_id).exists():
+        occupancy.refresh_days(property_id, start_date, end_date)
+
+
+@receiver(post_init, sender=Booking)
+def remember_booking_days(sender, instance, **kwargs):
+    # A booking moved to another day or time frees the days it covered
+    deferred = instance.get_deferred_fields()
+    if deferred & {'property_id', 'booking_date', 'booking_time', 'duration_minutes'}:
+        instance._occupancy_days = None
+    else:
+        instance._occupancy_days = occupancy.booking_days(instance)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def refresh_booking_occupancy(sender, instance, **kwargs):
+    spans = {getattr(instance, '_occupancy_days', None), occupancy.booking_days(instance)} - {None}
+    instance._occupancy_days = occupancy.booking_days(instance)
+    for span in spans:
+        transaction.on_commit(lambda span=span: refresh_booking_days(*span))
+
+
+@receiver(post_save, sender=AvailabilityRule)
+@receiver(post_delete, sender=AvailabilityRule)
+def resync_rule_slots(sender, instance, **kwargs):
+    from .tasks import sync_availability_rules
+
+    property_id = instance.property_id
+    transaction.on_commit(lambda: sync_availability_rules.delay(property_id))
@@ -0,0 +1,25 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def materialize_booking_slots():
+    """Roll every property's rule-generated booking slots forward to the end of the window"""
+    from .rules import roll_forward
+    
+    created, properties = roll_forward()
+    logger.info(f"Materialized {created} booking slots for {properties} properties")
+    return {'created': created, 'properties': properties}
+
+@shared_task
+def sync_availability_rules(property_id):
+    """Rewrite a property's generated booking slots after its rules changed"""
+    from nal_backend.apps.properties.models import Property
+    from .rules import sync_property
+    
+    # The rules go away with a deleted property, and so do its slots
+    if not Property.objects.filter(id=property_id).exists():
+        return None
+    created, updated, deleted = sync_property(property_id)
+    return {'created': created, 'updated': updated, 'deleted': deleted}
@@ -0,0 +1,401 @@
+from datetime import time, timedelta
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+from nal_backend.apps.authentication.models import User
+from nal_backend.apps.properties.models import Property
+from . import occupancy, rules
+from .models import AvailabilityRule, Booking, BookingSlot
+
+
+def create_booking(property_obj, user, booking_date, booking_time, **overrides):
+    data = {
+        'user': user,
+        'property': property_obj,
+        'booking_date': booking_date,
+        'booking_time': booking_time,
+        'contact_name': 'Ravi Buyer',
+        'contact_phone': '9876543210',
+        'contact_email': user.email,
+    }
+    data.update(overrides)
+    return Booking.objects.create(**data)
+
+
+class BookingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches[occupancy.CACHE_ALIAS].clear()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email='seller@example.com', username='seller', password='testpass123', role='SELLER'
+        )
+        self.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123', role='BUYER'
+        )
+        self.property = Property.objects.create(
+            owner=self.owner, title='Sea view apartment', description='Two bedroom apartment',
+            price='7500000.00', property_type='APARTMENT', status='PUBLISHED', address='12 Marine Drive',
+            city='Mumbai', state='Maharashtra', pincode='400002', latitude=19.0760, longitude=72.8777
+        )
+        self.client.force_authenticate(user=self.buyer)
+        # A Monday at least a week ahead, so no slot of the window has started
+        today = timezone.localdate()
+        self.monday = today + timedelta(days=7 + (7 - today.weekday()) % 7)
+
+
+class AvailableSlotsTestCase(BookingTestCase):
+    def slots(self, **params):
+        response = self.client.get(reverse('get-available-slots', args=[self.property.uuid]), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(slot['date'], slot['time'], slot['remaining']) for slot in response.data['data']['available_slots']]
+    
+    def test_constant_query_count(self):
+        """Test the slot endpoint runs the same queries however many bookings there are"""
+        params = {'from': self.monday.isoformat(), 'to': (self.monday + timedelta(days=30)).isoformat(), 'limit': 500}
+        with CaptureQueriesContext(connection) as empty:
+            self.slots(**params)
+        for day in range(30):
+            for hour in (9, 11, 14):
+                create_booking(self.property, self.buyer, self.monday + timedelta(days=day), time(hour))
+        caches[occupancy.CACHE_ALIAS].clear()
+        with CaptureQueriesContext(connection) as booked:
+            self.slots(**params)
+        
+        self.assertEqual(len(empty), 4)
+        self.assertEqual(len(booked), len(empty))
+    
+    def test_bookings_block_overlapping_slots(self):
+        """Test active bookings block every slot their duration overlaps"""
+        create_booking(self.property, self.buyer, self.monday, time(10), duration_minutes=90)
+        create_booking(self.property, self.buyer, self.monday, time(15, 30), duration_minutes=30)
+        create_booking(self.property, self.buyer, self.monday, time(13), status='CANCELLED')
+        
+        day = self.monday.isoformat()
+        hours = [slot_time for _, slot_time, _ in self.slots(**{'from': day, 'to': day})]
+        self.assertEqual(hours, ['09:00', '12:00', '13:00', '14:00', '16:00', '17:00'])
+    
+    def test_booking_slots_override_default_schedule(self):
+        """Test BookingSlot rows replace the default schedule for their date"""
+        saturday = self.monday + timedelta(days=5)
+        BookingSlot.objects.create(property=self.property, date=saturday, start_time=time(10), end_time=time(10, 30), max_bookings=2)
+        BookingSlot.objects.create(property=self.property, date=saturday, start_time=time(11), end_time=time(11, 30), is_available=False)
+        BookingSlot.objects.create(property=self.property, date=self.monday, start_time=time(9), end_time=time(10), is_available=False)
+        create_booking(self.property, self.buyer, saturday, time(10), duration_minutes=30)
+        
+        slots = self.slots(**{'from': self.monday.isoformat(), 'to': saturday.isoformat(), 'limit': 500})
+        self.assertFalse([slot for slot in slots if slot[0] == self.monday.isoformat()])
+        self.assertEqual([slot for slot in slots if slot[0] == saturday.isoformat()], [(saturday.isoformat(), '10:00', 1)])
+        # Tuesday to Friday keep the default hourly schedule
+        self.assertEqual(len(slots), 4 * 9 + 1)
+    
+    def test_window_and_limit_parameters(self):
+        """Test from/to/limit bound the result and are validated"""
+        slots = self.slots(**{'from': self.monday.isoformat(), 'limit': 3})
+        self.assertEqual([slot_time for _, slot_time, _ in slots], ['09:00', '10:00', '11:00'])
+        
+        url = reverse('get-available-slots', args=[self.property.uuid])
+        for params in ({'from': 'tomorrow'}, {'limit': 0}, {'from': self.monday.isoformat(), 'to': (self.monday - timedelta(days=1)).isoformat()},
+                       {'to': (self.monday + timedelta(days=365)).isoformat()}):
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_unknown_property_not_found(self):
+        """Test a missing property returns 404"""
+        response = self.client.get(reverse('get-available-slots', args=['00000000-0000-0000-0000-000000000000']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class OccupancyCacheTestCase(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('get-available-slots', args=[self.property.uuid])
+        self.params = {'from': self.monday.isoformat(), 'to': self.monday.isoformat()}
+    
+    def hours(self):
+        response = self.client.get(self.url, self.params)
+        return [slot['time'] for slot in response.data['data']['available_slots']]
+    
+    def test_warm_reads_only_look_up_the_property(self):
+        """Test a cached window is answered without reading slots or bookings"""
+        self.hours()
+        with CaptureQueriesContext(connection) as queries:
+            self.hours()
+        self.assertEqual(len(queries), 1)
+    
+    def test_booking_writes_update_cache(self):
+        """Test creating a booking takes its slot and cancelling frees it again"""
+        self.assertIn('10:00', self.hours())
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('create-booking'), {
+                'property_id': self.property.id, 'booking_date': self.monday.isoformat(), 'booking_time': '10:00',
+                'contact_name': 'Ravi Buyer', 'contact_phone': '9876543210'
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('10:00', self.hours())
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(reverse('update-booking-status', args=[response.data['data']['booking_id']]),
+                                       {'status': 'CANCELLED'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('10:00', self.hours())
+    
+    def test_model_writes_update_cache(self):
+        """Test bookings saved, moved or deleted outside the views refresh the cache"""
+        self.assertIn('10:00', self.hours())
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = create_booking(self.property, self.buyer, self.monday, time(10))
+        self.assertNotIn('10:00', self.hours())
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.get(id=booking.id)
+            booking.booking_time = '11:00'
+            booking.save()
+        self.assertEqual(('10:00' in self.hours(), '11:00' in self.hours()), (True, False))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        self.assertIn('11:00', self.hours())
+    
+    def test_rebuild_and_check_commands(self):
+        """Test the checker reports entries that disagree with bookings and the rebuild repairs them"""
+        self.hours()
+        # Written behind the cache's back
+        create_booking(self.property, self.buyer, self.monday, time(9))
+        self.assertIn('09:00', self.hours())
+        with self.assertRaises(CommandError):
+            call_command('check_availability_cache', days=14, stdout=StringIO())
+        
+        call_command('check_availability_cache', days=14, fix=True, stdout=StringIO())
+        self.assertNotIn('09:00', self.hours())
+        
+        caches[occupancy.CACHE_ALIAS].clear()
+        call_command('rebuild_availability_cache', days=14, stdout=StringIO())
+        with CaptureQueriesContext(connection) as queries:
+            self.assertNotIn('09:00', self.hours())
+        self.assertEqual(len(queries), 1)
+        call_command('check_availability_cache', days=14, stdout=StringIO())
+
+
+class ReservationTestCase(BookingTestCase):
+    def book(self, booking_time='10:00', **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('create-booking'), {
+                'property_id': self.property.id, 'booking_date': self.monday.isoformat(), 'booking_time': booking_time,
+                'contact_name': 'Ravi Buyer', 'contact_phone': '9876543210', **extra
+            }, format='json')
+    
+    def test_seats_fill_slot_capacity(self):
+        """Test a slot takes max_bookings bookings, each on its own seat, and cancelling frees a seat"""
+        BookingSlot.objects.create(property=self.property, date=self.monday, start_time=time(10), end_time=time(11), max_bookings=2)
+        first, second, third = self.book(), self.book(), self.book()
+        self.assertEqual([first.status_code, second.status_code], [status.HTTP_201_CREATED] * 2)
+        self.assertEqual(third.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(sorted(Booking.objects.values_list('seat', flat=True)), [1, 2])
+        
+        response = self.client.put(reverse('update-booking-status', args=[first.data['data']['booking_id']]),
+                                   {'status': 'CANCELLED'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(Booking.objects.get(uuid=first.data['data']['booking_id']).seat)
+        self.assertEqual(self.book().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(sorted(Booking.objects.exclude(seat=None).values_list('seat', flat=True)), [1, 2])
+    
+    def test_lost_race_moves_to_next_seat(self):
+        """Test a seat taken between the read and the insert is skipped, not double booked"""
+        BookingSlot.objects.create(property=self.property, date=self.monday, start_time=time(10), end_time=time(11), max_bookings=2)
+        # Invisible to the seat read, as a concurrent insert would be
+        create_booking(self.property, self.buyer, self.monday, time(10), seat=1, status='COMPLETED')
+        self.assertEqual(self.book().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Booking.objects.get(status='PENDING').seat, 2)
+        self.assertEqual(self.book().status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_bookings_must_fit_a_slot(self):
+        """Test bookings off the slot grid, overrunning their slot or on a missing property are rejected"""
+        self.assertEqual(self.book('10:30').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.book(duration_minutes=90).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.book(property_id=0).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.book(duration_minutes=30).status_code, status.HTTP_201_CREATED)
+    
+    def test_released_booking_cannot_be_reactivated(self):
+        """Test a cancelled booking keeps its released seat"""
+        booking_id = self.book().data['data']['booking_id']
+        url = reverse('update-booking-status', args=[booking_id])
+        self.client.put(url, {'status': 'CANCELLED'}, format='json')
+        response = self.client.put(url, {'status': 'CONFIRMED'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    
+    def test_status_update_conflict_is_409(self):
+        """Test a seat constraint violation on a status change is a conflict, not a server error"""
+        booking_id = self.book().data['data']['booking_id']
+        with mock.patch.object(Booking, 'save', side_effect=IntegrityError('booking_unique_slot_seat')):
+            response = self.client.put(reverse('update-booking-status', args=[booking_id]),
+                                       {'status': 'CONFIRMED'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Booking.objects.get(uuid=booking_id).status, 'PENDING')
+        
+        with mock.patch.object(Booking, 'save', autospec=True, side_effect=Booking.save) as save:
+            self.client.put(reverse('update-booking-status', args=[booking_id]), {'status': 'CONFIRMED'}, format='json')
+        # Only the changed columns are written back
+        self.assertEqual(set(save.call_args.kwargs['update_fields']), {'status', 'updated_at'})
+
+class AvailabilityFilterTestCase(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.booked = Property.objects.create(
+            owner=self.owner, title='Booked flat', description='', price='5000000.00', property_type='APARTMENT',
+            status='PUBLISHED', address='1 Hill Road', city='Mumbai', state='Maharashtra', pincode='400050'
+        )
+        self.custom = Property.objects.create(
+            owner=self.owner, title='Afternoon villa', description='', price='9000000.00', property_type='VILLA',
+            status='PUBLISHED', address='2 Hill Road', city='Pune', state='Maharashtra', pincode='411001'
+        )
+        self.saturday = self.monday + timedelta(days=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            for hour in (9, 10, 11):
+                self.book(self.booked, f'{hour}:00')
+            BookingSlot.objects.create(property=self.custom, date=self.monday, start_time=time(14), end_time=time(15))
+            BookingSlot.objects.create(property=self.custom, date=self.saturday, start_time=time(10), end_time=time(11))
+    
+    def book(self, property_obj, booking_time):
+        response = self.client.post(reverse('create-booking'), {
+            'property_id': property_obj.id, 'booking_date': self.monday.isoformat(), 'booking_time': booking_time,
+            'contact_name': 'Ravi Buyer', 'contact_phone': '9876543210'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    
+    def titles(self, **params):
+        response = self.client.get(reverse('list-properties'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(item['title'] for item in response.data['data']['properties'])
+    
+    def test_filters_listings_on_free_hours(self):
+        """Test available_on keeps listings with a free slot starting in the window"""
+        monday = self.monday.isoformat()
+        self.assertEqual(self.titles(available_on=monday, available_from='09:00', available_until='12:00'), ['Sea view apartment'])
+        self.assertEqual(self.titles(available_on=monday, available_from='14:00', available_until='15:00'),
+                         ['Afternoon villa', 'Booked flat', 'Sea view apartment'])
+        self.assertEqual(self.titles(available_on=self.saturday.isoformat()), ['Afternoon villa'])
+        self.assertEqual(self.titles(available_on=monday, city='pune', available_until='13:00'), [])
+    
+    def test_booking_invalidates_filtered_pages(self):
+        """Test a booking drops the listing from cached availability pages"""
+        params = {'available_on': self.monday.isoformat(), 'available_from': '12:00', 'available_until': '13:00'}
+        self.assertEqual(self.titles(**params), ['Booked flat', 'Sea view apartment'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(self.booked, '12:00')
+        self.assertEqual(self.titles(**params), ['Sea view apartment'])
+    
+    def test_booking_after_midnight_updates_previous_day(self):
+        """Test a booking refreshes the previous day's slots running past midnight"""
+        sunday = self.monday - timedelta(days=1)
+        params = {'available_on': sunday.isoformat(), 'available_from': '23:00', 'city': 'pune'}
+        with self.captureOnCommitCallbacks(execute=True):
+            BookingSlot.objects.create(property=self.custom, date=sunday, start_time=time(23), end_time=time(1))
+        self.assertEqual(self.titles(**params), ['Afternoon villa'])
+        
+        # Written outside the booking views, as from the admin or a shell
+        with self.captureOnCommitCallbacks(execute=True):
+            create_booking(self.custom, self.buyer, self.monday, time(0), duration_minutes=30)
+        self.assertEqual(self.titles(**params), [])
+    
+    def test_invalid_availability_filters_rejected(self):
+        """Test malformed or past availability filters are a 400"""
+        for params in ({'available_on': 'saturday'}, {'available_on': self.monday.isoformat(), 'available_from': '9am'},
+                       {'available_on': (timezone.localdate() - timedelta(days=1)).isoformat()}):
+            response = self.client.get(reverse('list-properties'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RuleMaterializationTestCase(BookingTestCase):
+    def add_rule(self, **fields):
+        data = {'property': self.property, 'weekdays': 0b11111, 'start_time': time(10), 'end_time': time(12)}
+        data.update(fields)
+        with self.captureOnCommitCallbacks(execute=True):
+            return AvailabilityRule.objects.create(**data)
+    
+    def slot_times(self, date):
+        return list(BookingSlot.objects.filter(property=self.property, date=date).order_by('start_time').values_list(
+            'start_time', 'max_bookings'
+        ))
+    
+    def test_rule_change_materializes_slots(self):
+        """Test saving a rule writes its slots for the window and replaces the default schedule"""
+        rule = self.add_rule(slot_minutes=30, max_bookings=2)
+        saturday = self.monday + timedelta(days=5)
+        self.assertEqual(self.slot_times(self.monday), [(time(10), 2), (time(10, 30), 2), (time(11), 2), (time(11, 30), 2)])
+        self.assertEqual(self.slot_times(saturday), [])
+        rule.refresh_from_db()
+        self.assertEqual(rule.materialized_until, timezone.localdate() + timedelta(days=rules.MATERIALIZE_DAYS))
+        
+        response = self.client.get(reverse('get-available-slots', args=[self.property.uuid]),
+                                   {'from': saturday.isoformat(), 'to': saturday.isoformat()})
+        self.assertEqual(response.data['data']['available_slots'], [])
+    
+    def test_resync_only_touches_delta(self):
+        """Test editing a rule keeps unchanged and hand-made slots and drops the ones no longer wanted"""
+        rule = self.add_rule()
+        kept = BookingSlot.objects.get(property=self.property, date=self.monday, start_time=time(10))
+        manual = BookingSlot.objects.get(property=self.property, date=self.monday, start_time=time(11))
+        BookingSlot.objects.filter(id=manual.id).update(end_time=time(11, 45), generated=False)
+        BookingSlot.objects.filter(property=self.property, date=self.monday + timedelta(days=1), start_time=time(11)).delete()
+        
+        rule.end_time = time(11)
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.save()
+        created, updated, deleted = rules.sync_property(self.property.id)
+        
+        self.assertEqual((created, updated, deleted), (0, 0, 0))
+        self.assertTrue(BookingSlot.objects.filter(id=kept.id).exists())
+        self.assertEqual(self.slot_times(self.monday), [(time(10), 1), (time(11), 1)])
+        self.assertEqual(BookingSlot.objects.get(id=manual.id).end_time, time(11, 45))
+    
+    def test_roll_forward_adds_new_days_only(self):
+        """Test the nightly job extends the window from where each property stopped and prunes past slots"""
+        self.add_rule(weekdays=0b1111111)
+        today = timezone.localdate()
+        BookingSlot.objects.create(property=self.property, date=today - timedelta(days=1), start_time=time(10),
+                                   end_time=time(11), generated=True)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            created, properties = rules.roll_forward(today + timedelta(days=2))
+        
+        self.assertEqual((created, properties), (2 * 2, 1))
+        self.assertFalse(BookingSlot.objects.filter(date__lt=today).exists())
+        last_day = today + timedelta(days=rules.MATERIALIZE_DAYS + 2)
+        self.assertEqual(self.slot_times(last_day), [(time(10), 1), (time(11), 1)])
+        self.assertEqual(rules.roll_forward(today + timedelta(days=2)), (0, 0))
+    
+    def test_roll_forward_picks_up_unmaterialized_rule(self):
+        """Test a rule that was never materialized is synced even when older rules are up to date"""
+        self.add_rule(weekdays=0b1111111)
+        AvailabilityRule.objects.bulk_create([AvailabilityRule(
+            property=self.property, weekdays=0b1111111, start_time=time(14), end_time=time(15)
+        )])
+        today = timezone.localdate()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            created, properties = rules.roll_forward(today)
+        
+        self.assertEqual(properties, 1)
+        self.assertEqual(created, rules.MATERIALIZE_DAYS + 1)
+        self.assertEqual(self.slot_times(today), [(time(10), 1), (time(11), 1), (time(14), 1)])
+        self.assertFalse(AvailabilityRule.objects.filter(materialized_until__isnull=True).exists())
+    
+    def test_deleted_rule_removes_generated_slots(self):
+        """Test deleting the last rule drops its slots and brings back the default schedule"""
+        rule = self.add_rule()
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.delete()
+        self.assertFalse(BookingSlot.objects.filter(property=self.property).exists())
+        
+        response = self.client.get(reverse('get-available-slots', args=[self.property.uuid]),
+                                   {'from': self.monday.isoformat(), 'to': self.monday.isoformat()})
+        self.assertEqual(len(response.data['data']['available_slots']), 9)
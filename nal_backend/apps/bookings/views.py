@@ -4,8 +4,12 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.db import IntegrityError, transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_time
+from . import availability, occupancy, reservations
 from .models import Booking, BookingSlot
+from .reservations import SlotUnavailable
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -29,22 +33,34 @@ def create_booking(request):
                 'errors': ['Booking date cannot be in the past']
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Check availability (simplified - in production, implement proper slot management)
-        existing_bookings = Booking.objects.filter(
-            property_id=data['property_id'],
-            booking_date=booking_date,
-            booking_time=data['booking_time'],
-            status__in=['PENDING', 'CONFIRMED']
-        ).count()
+        booking_time = parse_time(str(data['booking_time']))
+        if booking_time is None:
+            return Response({
+                'success': False,
+                'errors': ['Booking time must be HH:MM']
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        from nal_backend.apps.properties.models import Property
+        if not Property.objects.filter(id=data['property_id']).exists():
+            return Response({
+                'success': False,
+                'errors': ['Property not found']
+            }, status=status.HTTP_404_NOT_FOUND)
         
-        if existing_bookings >= 1:  # Assuming max 1 booking per slot
+        # Bookings start on a slot; the duration defaults to the slot's
+        duration_minutes = data.get('duration_minutes')
+        try:
+            capacity, duration_minutes = reservations.slot_capacity(
+                data['property_id'], booking_date, booking_time, int(duration_minutes) if duration_minutes else None
+            )
+        except SlotUnavailable as exc:
             return Response({
                 'success': False,
-                'errors': ['This time slot is not available']
+                'errors': [str(exc)]
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Generate virtual tour token if needed
-        virtual_tour_token = None
+        virtual_tour_token = ''
         virtual_tour_link = None
         booking_type = data.get('booking_type', 'SITE_VISIT')
         
@@ -52,20 +68,29 @@ def create_booking(request):
             virtual_tour_token = str(uuid.uuid4())
             virtual_tour_link = f"https://virtualtour.nalindia.com/join/{virtual_tour_token}"
         
-        booking = Booking.objects.create(
-            user=request.user,
-            property_id=data['property_id'],
-            booking_type=booking_type,
-            booking_date=booking_date,
-            booking_time=data['booking_time'],
-            duration_minutes=data.get('duration_minutes', 60),
-            contact_name=data['contact_name'],
-            contact_phone=data['contact_phone'],
-            contact_email=data.get('contact_email', request.user.email),
-            notes=data.get('notes', ''),
-            virtual_tour_link=virtual_tour_link,
-            virtual_tour_token=virtual_tour_token
-        )
+        # Takes a free seat in the slot; safe against concurrent buyers
+        try:
+            with transaction.atomic():
+                booking = reservations.reserve(
+                    capacity,
+                    user=request.user,
+                    property_id=data['property_id'],
+                    booking_type=booking_type,
+                    booking_date=booking_date,
+                    booking_time=booking_time,
+                    duration_minutes=duration_minutes,
+                    contact_name=data['contact_name'],
+                    contact_phone=data['contact_phone'],
+                    contact_email=data.get('contact_email', request.user.email),
+                    notes=data.get('notes', ''),
+                    virtual_tour_link=virtual_tour_link,
+                    virtual_tour_token=virtual_tour_token
+                )
+        except SlotUnavailable as exc:
+            return Response({
+                'success': False,
+                'errors': [str(exc)]
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         return Response({
             'success': True,
@@ -164,29 +189,50 @@ def get_booking(request, booking_id):
 def update_booking_status(request, booking_id):
     """Update booking status"""
     try:
-        booking = Booking.objects.get(uuid=booking_id)
-        
-        # Check permissions
-        if booking.user != request.user and booking.property.owner != request.user:
-            return Response({
-                'success': False,
-                'errors': ['Permission denied']
-            }, status=status.HTTP_403_FORBIDDEN)
-        
-        new_status = request.data.get('status')
-        if new_status not in ['CONFIRMED', 'CANCELLED', 'COMPLETED', 'NO_SHOW']:
-            return Response({
-                'success': False,
-                'errors': ['Invalid status']
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        booking.status = new_status
-        
-        if new_status == 'CANCELLED':
-            booking.cancelled_at = timezone.now()
-            booking.cancellation_reason = request.data.get('cancellation_reason', '')
-        
-        booking.save()
+        # Locked while it changes: a concurrent update cannot write back a released seat
+        with transaction.atomic():
+            booking = Booking.objects.select_for_update().get(uuid=booking_id)
+            
+            # Check permissions
+            if booking.user != request.user and booking.property.owner != request.user:
+                return Response({
+                    'success': False,
+                    'errors': ['Permission denied']
+                }, status=status.HTTP_403_FORBIDDEN)
+            
+            new_status = request.data.get('status')
+            if new_status not in ['CONFIRMED', 'CANCELLED', 'COMPLETED', 'NO_SHOW']:
+                return Response({
+                    'success': False,
+                    'errors': ['Invalid status']
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Released bookings gave their seat away; rebook instead
+            if booking.status in reservations.RELEASED_STATUSES:
+                return Response({
+                    'success': False,
+                    'errors': [f'Booking is already {booking.status.lower()}']
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            booking.status = new_status
+            changed = ['status', 'updated_at']
+            if new_status in reservations.RELEASED_STATUSES:
+                booking.seat = None
+                changed.append('seat')
+            
+            if new_status == 'CANCELLED':
+                booking.cancelled_at = timezone.now()
+                booking.cancellation_reason = request.data.get('cancellation_reason', '')
+                changed += ['cancelled_at', 'cancellation_reason']
+            
+            try:
+                with transaction.atomic():
+                    booking.save(update_fields=changed)
+            except IntegrityError:
+                return Response({
+                    'success': False,
+                    'errors': ['Booking conflicts with another booking of this slot']
+                }, status=status.HTTP_409_CONFLICT)
         
         return Response({
             'success': True,
@@ -207,52 +253,50 @@ def update_booking_status(request, booking_id):
 @permission_classes([IsAuthenticated])
 def get_available_slots(request, property_id):
     """Get available booking slots for a property"""
+    from nal_backend.apps.properties.models import Property
+    
+    # Window defaults to the next 30 days; ``from`` in the past starts today
+    today = timezone.localdate()
     try:
-        from nal_backend.apps.properties.models import Property
-        property_obj = Property.objects.get(uuid=property_id)
-        
-        # Get date range (next 30 days by default)
-        start_date = timezone.now().date()
-        end_date = start_date + timedelta(days=30)
-        
-        # Generate available slots (simplified - in production, use proper slot management)
-        available_slots = []
-        current_date = start_date
-        
-        while current_date <= end_date:
-            # Skip weekends for this example
-            if current_date.weekday() < 5:  # Monday = 0, Sunday = 6
-                # Generate time slots (9 AM to 6 PM)
-                for hour in range(9, 18):
-                    slot_time = f"{hour:02d}:00"
-                    
-                    # Check if slot is already booked
-                    existing_booking = Booking.objects.filter(
-                        property=property_obj,
-                        booking_date=current_date,
-                        booking_time=slot_time,
-                        status__in=['PENDING', 'CONFIRMED']
-                    ).exists()
-                    
-                    if not existing_booking:
-                        available_slots.append({
-                            'date': current_date.isoformat(),
-                            'time': slot_time,
-                            'available': True
-                        })
-            
-            current_date += timedelta(days=1)
-        
+        start_date = max(_parse_date(request.GET.get('from')) or today, today)
+        end_date = _parse_date(request.GET.get('to')) or start_date + timedelta(days=availability.DEFAULT_WINDOW_DAYS)
+        limit = int(request.GET.get('limit', availability.DEFAULT_LIMIT))
+    except ValueError:
         return Response({
-            'success': True,
-            'data': {
-                'property_id': property_id,
-                'available_slots': available_slots[:50]  # Limit to 50 slots
-            }
-        })
-        
-    except Property.DoesNotExist:
+            'success': False,
+            'errors': ['from and to must be YYYY-MM-DD dates and limit a number']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if end_date < start_date or (end_date - start_date).days > availability.MAX_WINDOW_DAYS:
+        return Response({
+            'success': False,
+            'errors': [f'to must be on or after from and at most {availability.MAX_WINDOW_DAYS} days later']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= limit <= availability.MAX_LIMIT:
+        return Response({
+            'success': False,
+            'errors': [f'limit must be between 1 and {availability.MAX_LIMIT}']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    property_pk = Property.objects.filter(uuid=property_id).values_list('id', flat=True).first()
+    if property_pk is None:
         return Response({
             'success': False,
             'errors': ['Property not found']
-        }, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    # Includes the next day for slots running past midnight
+    days = occupancy.cached_days(property_pk, start_date, end_date + timedelta(days=1))
+    
+    return Response({
+        'success': True,
+        'data': {
+            'property_id': property_id,
+            'from': start_date,
+            'to': end_date,
+            'available_slots': availability.free_slots(days, start_date, end_date, limit)
+        }
+    })
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
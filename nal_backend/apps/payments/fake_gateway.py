@@ -0,0 +1,150 @@
+"""Local stand-in for the Razorpay API, for tests and load benchmarks.
+
+Serves the calls ``gateway.GatewayClient`` makes (``POST /v1/orders``,
+``POST /v1/payments/<id>/capture`` and ``GET /v1/payments/<id>``) from a
+thread of the current process, with injectable latency and failures::
+
+    with FakeGateway(latency=0.05, error_rate=0.1) as fake:
+        client = GatewayClient(fake.url, 'key', 'secret')
+
+``latency`` delays every response, ``error_rate`` answers that share of
+requests with a 503, and ``fail_next`` answers the next requests with the
+given statuses. ``lose_next`` handles that many POSTs but answers them with
+a 503, as when a response is lost. Created ``orders`` and captured
+``payments`` are kept by id; a second capture of a payment is refused. ``connections`` counts accepted TCP connections and
+``requests`` handled requests, so tests can check keep-alive reuse.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, every
+    # keep-alive response would wait out the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.gateway.lock:
+            self.server.gateway.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def begin(self):
+        """Count the request; returns the status to answer with instead of handling it, if any"""
+        gateway = self.server.gateway
+        with gateway.lock:
+            gateway.requests += 1
+            forced = gateway.fail_next.pop(0) if gateway.fail_next else None
+        if gateway.latency:
+            time.sleep(gateway.latency)
+        if forced is None and gateway.error_rate and gateway.rng.random() < gateway.error_rate:
+            forced = 503
+        return forced
+
+    def fail(self, status_code):
+        return self.respond(status_code, {'error': {'code': 'SERVER_ERROR', 'description': 'Injected failure'}})
+
+    def do_GET(self):
+        gateway = self.server.gateway
+        forced = self.begin()
+        if forced is not None:
+            return self.fail(forced)
+
+        parts = self.path.strip('/').split('/')
+        if len(parts) == 3 and parts[:2] == ['v1', 'payments']:
+            with gateway.lock:
+                payment = gateway.payments.get(parts[2])
+            return self.respond(200, payment or {'id': parts[2], 'entity': 'payment', 'status': 'authorized'})
+        return self.respond(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Not found'}})
+
+    def do_POST(self):
+        gateway = self.server.gateway
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        forced = self.begin()
+        if forced is not None:
+            return self.fail(forced)
+        with gateway.lock:
+            lost = gateway.lose_next > 0
+            if lost:
+                gateway.lose_next -= 1
+
+        payload = json.loads(body or b'{}')
+        parts = self.path.strip('/').split('/')
+        if parts == ['v1', 'orders']:
+            status_code, data = 200, {
+                'id': f'order_{uuid.uuid4().hex[:14]}', 'entity': 'order', 'amount': payload.get('amount'),
+                'currency': payload.get('currency', 'INR'), 'receipt': payload.get('receipt'), 'status': 'created',
+            }
+            with gateway.lock:
+                gateway.orders[data['id']] = data
+        elif len(parts) == 4 and parts[:2] == ['v1', 'payments'] and parts[3] == 'capture':
+            payment = {
+                'id': parts[2], 'entity': 'payment', 'amount': payload.get('amount'),
+                'currency': payload.get('currency', 'INR'), 'status': 'captured',
+            }
+            with gateway.lock:
+                captured = gateway.payments.setdefault(parts[2], payment) is not payment
+            status_code, data = (400, {
+                'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'This payment has already been captured'}
+            }) if captured else (200, payment)
+        else:
+            status_code, data = 404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Not found'}}
+        if lost:
+            # Handled, but the caller never hears about it
+            return self.fail(503)
+        return self.respond(status_code, data)
+
+    def respond(self, status_code, data):
+        body = json.dumps(data).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeGateway:
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.fail_next = []
+        self.lose_next = 0
+        self.orders = {}
+        self.payments = {}
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def start(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.daemon_threads = True
+        self.server.gateway = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,223 @@
+"""HTTP client for the Razorpay API.
+
+One client per process (``get_client``) shares a ``requests`` session, so
+calls reuse pooled keep-alive connections instead of paying a TCP and TLS
+handshake each; the pool holds up to ``POOL_SIZE`` connections, one per
+concurrently calling thread. Every call is bounded:
+
+* connect and read timeouts, so a hung gateway cannot hold a worker,
+* up to ``MAX_RETRIES`` retries with full-jitter exponential backoff, for
+  connection failures, and for timeouts, 429 and 5xx answers only when the
+  call is safe to repeat (order creation is not: a retried create could
+  open a second order),
+* a circuit breaker: after ``FAILURE_THRESHOLD`` consecutive failed calls
+  it fails fast for ``RESET_TIMEOUT`` seconds, then lets one probe call
+  through and closes again when it succeeds, so a gateway brownout costs
+  callers an immediate ``GatewayUnavailable`` instead of a timeout each.
+
+A retried capture whose first attempt went through, with only the answer
+lost, is refused as already captured; so is a confirmation the client
+repeats. A refused capture is therefore checked against the payment's
+state and counts as captured when the gateway holds it captured for the
+same amount.
+
+``GatewayError`` is raised for answers the gateway gives on purpose (4xx),
+``GatewayUnavailable`` when it could not be reached or kept failing.
+Amounts are sent in paise, computed by ``to_paise``.
+``fake_gateway.FakeGateway`` serves the same API locally.
+"""
+import logging
+import random
+import threading
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.1
+BACKOFF_CAP = 2.0
+POOL_SIZE = 20
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GatewayError(Exception):
+    def __init__(self, message, status_code=None, response=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = response or {}
+
+
+class GatewayUnavailable(GatewayError):
+    pass
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker, shared by the threads of a process"""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if self.clock() - self.opened_at >= self.reset_timeout else 'open'
+
+    def allow(self):
+        """Whether a call may go out now"""
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.probing:
+                # One probe at a time; the others keep failing fast
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning('Payment gateway circuit opened after %d failures', self.failures)
+                self.opened_at = self.clock()
+            self.probing = False
+
+
+def to_paise(amount):
+    """Rupees (a ``Decimal``, or a number or string from a request) as integer paise"""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def backoff(attempt, rng=random):
+    """Full jitter: uniform between 0 and the capped exponential delay"""
+    return rng.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class GatewayClient:
+    def __init__(self, base_url, key_id, key_secret, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, pool_size=POOL_SIZE, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        self.session.auth = (key_id, key_secret)
+        # Retries are ours, with jitter and the breaker, not urllib3's
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, path, payload=None, safe_to_retry=True):
+        if not self.breaker.allow():
+            raise GatewayUnavailable('Payment gateway circuit is open')
+
+        for attempt in range(self.max_retries + 1):
+            retry = True
+            try:
+                response = self.session.request(method, f'{self.base_url}/{path.lstrip("/")}', json=payload, timeout=self.timeout)
+            except requests.ConnectionError as exc:
+                # Connect failures and timeouts, and stale keep-alive connections
+                error = exc
+            except requests.RequestException as exc:
+                error, retry = exc, safe_to_retry
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    data = _json(response)
+                    if response.status_code >= 400:
+                        description = data.get('error', {}).get('description') if isinstance(data.get('error'), dict) else None
+                        raise GatewayError(description or f'Gateway answered {response.status_code}',
+                                           response.status_code, data)
+                    return data
+                error, retry = f'status {response.status_code}', safe_to_retry
+
+            if not retry or attempt == self.max_retries:
+                break
+            time.sleep(backoff(attempt))
+
+        self.breaker.record_failure()
+        logger.warning('Payment gateway %s %s failed: %s', method, path, error)
+        raise GatewayUnavailable(f'Payment gateway unavailable: {error}')
+
+    def create_order(self, amount, currency, receipt):
+        """Create an order for ``amount`` in the currency's minor unit"""
+        return self.request('POST', 'orders', {'amount': amount, 'currency': currency, 'receipt': receipt},
+                            safe_to_retry=False)
+
+    def fetch_payment(self, payment_id):
+        return self.request('GET', f'payments/{payment_id}')
+
+    def capture_payment(self, payment_id, amount, currency):
+        # The gateway refuses a second capture rather than applying it, so retries are safe
+        try:
+            return self.request('POST', f'payments/{payment_id}/capture', {'amount': amount, 'currency': currency})
+        except GatewayUnavailable:
+            raise
+        except GatewayError as exc:
+            refused = exc
+        # An earlier attempt may have captured it already
+        try:
+            payment = self.fetch_payment(payment_id)
+        except GatewayUnavailable:
+            raise
+        except GatewayError:
+            raise refused
+        if payment.get('status') == 'captured' and payment.get('amount') == amount:
+            return payment
+        raise refused
+
+
+def _json(response):
+    try:
+        data = response.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def enabled():
+    return settings.PAYMENT_GATEWAY_ENABLED
+
+
+def get_client():
+    """The process-wide client for the configured gateway"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GatewayClient(settings.RAZORPAY_API_URL, settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
+        return _client
+
+
+def reset_client():
+    """Drop the shared client, e.g. after the settings changed"""
+    global _client
+    with _client_lock:
+        _client = None
@@ -0,0 +1,199 @@
+"""``Idempotency-Key`` support for payment endpoints.
+
+A client retrying a request sends the same ``Idempotency-Key`` header; the
+first response to a key is stored and later requests with that key get it
+back (with an ``Idempotent-Replayed`` header) instead of running the view
+again. Keys belong to the user and the endpoint, and a key reused with a
+different request (method, path or body) is rejected with a 422.
+
+Responses are kept in the default cache (Redis), where replays are read
+from, and in ``IdempotencyKey`` rows, read when the cache misses (evicted
+entries, Redis outages). Both expire after ``IDEMPOTENCY_TTL``; expired
+rows are removed by the ``prune_idempotency_keys`` task.
+
+Concurrent duplicates are serialized: the first request claims the key
+with an atomic cache ``add`` (an in-flight ``IdempotencyKey`` row when the
+cache is unreachable) and runs the view; the others wait for its response
+for up to ``WAIT_TIMEOUT`` and replay it, or get a 409 asking them to retry.
+Server errors are not stored, so a failed request can be retried with the
+same key.
+"""
+import hashlib
+import json
+import logging
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+IDEMPOTENCY_TTL = 24 * 60 * 60
+# Longest a claim may be held, should its request die without releasing it
+CLAIM_TIMEOUT = 60
+WAIT_TIMEOUT = 5
+POLL_INTERVAL = 0.05
+
+
+def _cache_key(user_id, scope, key):
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'payments:idempotency:{scope}:{user_id}:{digest}'
+
+
+def fingerprint(request):
+    """Digest of what makes a request the same request"""
+    body = json.dumps(request.data, sort_keys=True, cls=JSONEncoder)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def stored_response(user_id, scope, key):
+    """``{'fingerprint', 'status', 'data'}`` stored for a key, or None"""
+    cache_key = _cache_key(user_id, scope, key)
+    try:
+        stored = cache.get(cache_key)
+    except Exception:
+        logger.warning('Idempotency cache unavailable, reading stored keys', exc_info=True)
+        cache_key = stored = None
+    if stored is not None:
+        return stored
+
+    row = IdempotencyKey.objects.filter(
+        user_id=user_id, scope=scope, key=key, status_code__isnull=False, expires_at__gt=timezone.now()
+    ).values('fingerprint', 'status_code', 'response', 'expires_at').first()
+    if row is None:
+        return None
+    stored = {'fingerprint': row['fingerprint'], 'status': row['status_code'], 'data': row['response']}
+    if cache_key is not None:
+        remaining = int((row['expires_at'] - timezone.now()).total_seconds())
+        try:
+            cache.set(cache_key, stored, max(remaining, 1))
+        except Exception:
+            pass
+    return stored
+
+
+def claim(user_id, scope, key):
+    """Take the key for one in-flight request.
+
+    Returns where the claim was taken (``'cache'`` or ``'database'``), or
+    None while another request holds the key.
+    """
+    try:
+        return 'cache' if cache.add(_cache_key(user_id, scope, key) + ':claim', 1, CLAIM_TIMEOUT) else None
+    except Exception:
+        logger.warning('Idempotency cache unavailable, claiming key in the database', exc_info=True)
+
+    now = timezone.now()
+    IdempotencyKey.objects.filter(user_id=user_id, scope=scope, key=key, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                user_id=user_id, scope=scope, key=key, fingerprint='',
+                expires_at=now + timedelta(seconds=CLAIM_TIMEOUT)
+            )
+    except IntegrityError:
+        return None
+    return 'database'
+
+
+def release(user_id, scope, key, claimed):
+    """Drop a claim; a stored response stays"""
+    if claimed == 'database':
+        IdempotencyKey.objects.filter(user_id=user_id, scope=scope, key=key, status_code__isnull=True).delete()
+        return
+    try:
+        cache.delete(_cache_key(user_id, scope, key) + ':claim')
+    except Exception:
+        pass
+
+
+def store(user_id, scope, key, request_fingerprint, response):
+    data = json.loads(json.dumps(response.data, cls=JSONEncoder))
+    IdempotencyKey.objects.update_or_create(user_id=user_id, scope=scope, key=key, defaults={
+        'fingerprint': request_fingerprint,
+        'status_code': response.status_code,
+        'response': data,
+        'expires_at': timezone.now() + timedelta(seconds=IDEMPOTENCY_TTL),
+    })
+    stored = {'fingerprint': request_fingerprint, 'status': response.status_code, 'data': data}
+    try:
+        cache.set(_cache_key(user_id, scope, key), stored, IDEMPOTENCY_TTL)
+    except Exception:
+        pass
+
+
+def replay(stored, request_fingerprint):
+    if stored['fingerprint'] != request_fingerprint:
+        return Response({
+            'success': False,
+            'errors': [f'{HEADER} was already used for a different request']
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(stored['data'], status=stored['status'], headers={REPLAYED_HEADER: 'true'})
+
+
+def idempotent(scope):
+    """Replay the stored response of requests repeating an ``Idempotency-Key``.
+
+    Goes below ``@api_view`` and the permission decorators, so the request
+    is authenticated. Requests without the header run as usual.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if key is None:
+                return view(request, *args, **kwargs)
+            if not key.strip() or len(key) > MAX_KEY_LENGTH:
+                return Response({
+                    'success': False,
+                    'errors': [f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters']
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            user_id = request.user.pk
+            request_fingerprint = fingerprint(request)
+            deadline = time.monotonic() + WAIT_TIMEOUT
+            claimed = None
+            while claimed is None:
+                stored = stored_response(user_id, scope, key)
+                if stored is not None:
+                    return replay(stored, request_fingerprint)
+                claimed = claim(user_id, scope, key)
+                if claimed is None:
+                    if time.monotonic() >= deadline:
+                        return Response({
+                            'success': False,
+                            'errors': [f'A request with this {HEADER} is still in progress']
+                        }, status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+                    time.sleep(POLL_INTERVAL)
+                    continue
+                # The request holding the key may have finished since the lookup
+                stored = stored_response(user_id, scope, key)
+                if stored is not None:
+                    release(user_id, scope, key, claimed)
+                    return replay(stored, request_fingerprint)
+
+            try:
+                response = view(request, *args, **kwargs)
+                if response.status_code < 500:
+                    store(user_id, scope, key, request_fingerprint, response)
+            finally:
+                release(user_id, scope, key, claimed)
+            return response
+        return wrapped
+    return decorator
+
+
+def prune(now=None):
+    """Delete expired keys; returns the number removed"""
+    return IdempotencyKey.objects.filter(expires_at__lte=now or timezone.now()).delete()[0]
@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from nal_backend.apps.payments.reconciliation import DEFAULT_BATCH_SIZE, reconcile_file
+
+
+class Command(BaseCommand):
+    help = 'Reconcile a gateway settlement CSV against transactions and write a discrepancy report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--report', help='Discrepancy report CSV (default: stdout)')
+        parser.add_argument('--since', help='First day of the settlement period (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Last day of the settlement period (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        since, until = (parse_date(options[name]) if options[name] else None for name in ('since', 'until'))
+        if (options['since'] and since is None) or (options['until'] and until is None):
+            raise CommandError('--since and --until must be dates (YYYY-MM-DD)')
+        if (since is None) != (until is None):
+            raise CommandError('--since and --until go together')
+
+        report = open(options['report'], 'w', newline='') if options['report'] else sys.stdout
+        try:
+            with open(options['path'], 'rb') as source:
+                result = reconcile_file(source, report, since, until, options['batch_size'])
+        finally:
+            if report is not sys.stdout:
+                report.close()
+
+        for kind, count in sorted(result.discrepancies.items()):
+            self.stderr.write(f'{kind}: {count}')
+        self.stderr.write(self.style.SUCCESS(
+            f'Reconciled {result.rows} rows ({result.matched} matched, {result.discrepancy_count} discrepancies) '
+            f'in {result.seconds:.1f}s, {result.rows_per_second:,.0f} rows/s'
+        ))
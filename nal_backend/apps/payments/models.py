@@ -96,4 +96,29 @@ class WebhookEvent(models.Model):
     processed_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
-        db_table = 'webhook_events'
\ No newline at end of file
+        db_table = 'webhook_events'
+        indexes = [
+            models.Index(fields=['processed', 'id']),
+        ]
+
+class IdempotencyKey(models.Model):
+    """Response of a request made with an Idempotency-Key header, replayed for retries"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    # Empty on the in-flight claim taken while the cache is unreachable
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'idempotency_keys'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='idempotency_unique_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
@@ -0,0 +1,164 @@
+"""Streaming reconciliation of gateway settlement files against transactions.
+
+A settlement file is a CSV with one row per settled payment: ``payment_id``
+(the gateway id, matched against ``gateway_transaction_id`` and then
+``payment_intent_id``), ``amount`` in rupees and the gateway ``status``.
+Rows are read lazily and matched in batches, with one indexed ``__in``
+query per id column and batch, so memory does not grow with the file:
+discrepancies are written to the report as they are found, and the only
+state kept across batches is a bitmap of the matched transaction ids.
+
+Discrepancies:
+
+* ``MISSING_TRANSACTION``: no transaction has the row's payment id,
+* ``AMOUNT_MISMATCH`` / ``STATUS_MISMATCH``: the transaction disagrees,
+* ``DUPLICATE_SETTLEMENT``: an earlier row already settled the transaction,
+* ``INVALID_ROW``: the row has no payment id or an unreadable amount,
+* ``MISSING_SETTLEMENT``: a transaction completed within the settlement
+  period (``since``/``until``, when given) that no row settled.
+"""
+import csv
+import io
+import time
+from decimal import Decimal, InvalidOperation
+
+from .models import Transaction
+
+DEFAULT_BATCH_SIZE = 2000
+REPORT_COLUMNS = ['kind', 'line', 'payment_id', 'transaction_id', 'expected', 'actual']
+
+# Transaction status each gateway settlement status corresponds to
+SETTLEMENT_STATUSES = {
+    'captured': 'COMPLETED',
+    'settled': 'COMPLETED',
+    'refunded': 'REFUNDED',
+    'failed': 'FAILED',
+}
+
+TRANSACTION_FIELDS = ['id', 'uuid', 'amount', 'status', 'payment_intent_id', 'gateway_transaction_id']
+
+
+class ReconciliationResult:
+    def __init__(self):
+        self.rows = 0
+        self.matched = 0
+        self.discrepancies = {}
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def discrepancy_count(self):
+        return sum(self.discrepancies.values())
+
+
+class Reconciler:
+    """Match settlement rows to transactions, writing discrepancies to ``report``"""
+
+    def __init__(self, report, batch_size=DEFAULT_BATCH_SIZE):
+        self.writer = csv.writer(report)
+        self.writer.writerow(REPORT_COLUMNS)
+        self.batch_size = batch_size
+        self.result = ReconciliationResult()
+        self.settled = bytearray()
+
+    def flag(self, kind, line, payment_id='', transaction=None, expected='', actual=''):
+        self.result.discrepancies[kind] = self.result.discrepancies.get(kind, 0) + 1
+        self.writer.writerow([kind, line, payment_id, transaction['uuid'] if transaction else '', expected, actual])
+
+    def mark_settled(self, transaction_id):
+        index, bit = divmod(transaction_id, 8)
+        if index >= len(self.settled):
+            self.settled.extend(bytes(index + 1 - len(self.settled) + len(self.settled) // 2))
+        self.settled[index] |= 1 << bit
+
+    def is_settled(self, transaction_id):
+        index, bit = divmod(transaction_id, 8)
+        return index < len(self.settled) and bool(self.settled[index] >> bit & 1)
+
+    def run(self, rows, since=None, until=None):
+        started = time.perf_counter()
+        batch = []
+        for line, row in rows:
+            self.result.rows += 1
+            batch.append((line, row))
+            if len(batch) == self.batch_size:
+                self.match(batch)
+                batch = []
+        self.match(batch)
+        if since is not None and until is not None:
+            self.find_unsettled(since, until)
+        self.result.seconds = time.perf_counter() - started
+        return self.result
+
+    def lookup(self, payment_ids):
+        """``{payment_id: transaction}`` by gateway transaction id, then payment intent id"""
+        found = {}
+        for field in ('gateway_transaction_id', 'payment_intent_id'):
+            wanted = [payment_id for payment_id in payment_ids if payment_id not in found]
+            if not wanted:
+                break
+            for transaction in Transaction.objects.filter(**{f'{field}__in': wanted}).values(*TRANSACTION_FIELDS):
+                found.setdefault(transaction[field], transaction)
+        return found
+
+    def match(self, batch):
+        parsed = []
+        for line, row in batch:
+            payment_id = (row.get('payment_id') or '').strip()
+            try:
+                amount = Decimal((row.get('amount') or '').strip())
+            except InvalidOperation:
+                amount = None
+            if not payment_id or amount is None or not amount.is_finite():
+                self.flag('INVALID_ROW', line, payment_id, actual=row.get('amount') or '')
+                continue
+            parsed.append((line, payment_id, amount, (row.get('status') or '').strip().lower()))
+        if not parsed:
+            return
+
+        transactions = self.lookup({payment_id for _, payment_id, _, _ in parsed})
+        for line, payment_id, amount, settlement_status in parsed:
+            transaction = transactions.get(payment_id)
+            if transaction is None:
+                self.flag('MISSING_TRANSACTION', line, payment_id, actual=str(amount))
+                continue
+            self.result.matched += 1
+            if self.is_settled(transaction['id']):
+                self.flag('DUPLICATE_SETTLEMENT', line, payment_id, transaction, '', str(amount))
+            self.mark_settled(transaction['id'])
+            if transaction['amount'] != amount:
+                self.flag('AMOUNT_MISMATCH', line, payment_id, transaction, transaction['amount'], amount)
+            expected_status = SETTLEMENT_STATUSES.get(settlement_status, settlement_status.upper())
+            if transaction['status'] != expected_status:
+                self.flag('STATUS_MISMATCH', line, payment_id, transaction, transaction['status'], settlement_status)
+
+    def find_unsettled(self, since, until):
+        completed = Transaction.objects.filter(
+            status='COMPLETED', completed_at__date__gte=since, completed_at__date__lte=until
+        ).order_by('id')
+        # Keyset chunks rather than iterator(): MySQLdb buffers a whole result set
+        last_id = 0
+        while True:
+            chunk = list(completed.filter(id__gt=last_id).values(*TRANSACTION_FIELDS)[:self.batch_size])
+            if not chunk:
+                return
+            last_id = chunk[-1]['id']
+            for transaction in chunk:
+                if not self.is_settled(transaction['id']):
+                    payment_id = transaction['gateway_transaction_id'] or transaction['payment_intent_id']
+                    self.flag('MISSING_SETTLEMENT', '', payment_id, transaction, transaction['amount'], '')
+
+
+def iter_rows(stream):
+    """Yield ``(line_number, row)`` from a binary CSV stream"""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    for row in reader:
+        yield reader.line_num, row
+
+
+def reconcile_file(stream, report, since=None, until=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Reconcile the settlement CSV ``stream`` (binary), writing the report to the text stream ``report``"""
+    return Reconciler(report, batch_size=batch_size).run(iter_rows(stream), since=since, until=until)
@@ -0,0 +1,23 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def process_webhook_events(max_batches=20):
+    """Apply stored gateway webhook events in batches"""
+    from .webhooks import process_pending
+    
+    handled = process_pending(max_batches=max_batches)
+    if handled:
+        logger.info(f"Processed {handled} webhook events")
+    return handled
+
+@shared_task
+def prune_idempotency_keys():
+    """Delete expired Idempotency-Key responses"""
+    from .idempotency import prune
+    
+    removed = prune()
+    logger.info(f"Pruned {removed} idempotency keys")
+    return removed
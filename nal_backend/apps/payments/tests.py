@@ -0,0 +1,406 @@
+import csv
+import io
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework import status
+from nal_backend.apps.analytics.models import DailyRevenue
+from nal_backend.apps.authentication.models import User
+from nal_backend.apps.properties.models import Property
+from . import gateway, idempotency, reconciliation, webhooks
+from .fake_gateway import FakeGateway
+from .models import IdempotencyKey, Transaction, WebhookEvent
+from .tasks import process_webhook_events
+
+
+def webhook_event(event_id, event_type, payment_id, order_id=None):
+    entity = {'id': payment_id}
+    if order_id is not None:
+        entity['order_id'] = order_id
+    return {
+        'id': event_id,
+        'event': event_type,
+        'payload': {'payment': {'entity': entity}},
+    }
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET='whsec_test')
+class WebhookTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123', role='BUYER'
+        )
+        self.transactions = [
+            Transaction.objects.create(
+                user=self.user, amount='500.00', transaction_type='BOOKING_FEE',
+                status='PROCESSING', payment_intent_id=f'pi_{index}'
+            )
+            for index in range(3)
+        ]
+    
+    def deliver(self, event, signature=None):
+        body = json.dumps(event).encode()
+        return self.client.post(
+            reverse('razorpay-webhook'), body, content_type='application/json',
+            HTTP_X_RAZORPAY_SIGNATURE=webhooks.sign(body) if signature is None else signature
+        )
+    
+    def test_duplicate_deliveries_acknowledged_once(self):
+        """Test a redelivered event is acknowledged without a second row"""
+        event = webhook_event('evt_1', 'payment.captured', 'pi_0')
+        for _ in range(3):
+            response = self.deliver(event)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        # Processing happens out of the request
+        self.assertEqual(Transaction.objects.get(payment_intent_id='pi_0').status, 'PROCESSING')
+    
+    def test_invalid_deliveries_rejected(self):
+        """Test bad signatures and malformed bodies are a 400 and store nothing"""
+        self.assertEqual(self.deliver(webhook_event('evt_1', 'payment.captured', 'pi_0'), signature='forged').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse('razorpay-webhook'), b'not json', content_type='application/json',
+                                    HTTP_X_RAZORPAY_SIGNATURE=webhooks.sign(b'not json'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(RAZORPAY_WEBHOOK_SECRET=''):
+            event = webhook_event('evt_2', 'payment.captured', 'pi_0')
+            self.assertEqual(self.deliver(event, signature=webhooks.sign(json.dumps(event).encode(), '')).status_code,
+                             status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(WebhookEvent.objects.exists())
+    
+    def test_batch_processing_applies_events(self):
+        """Test the task applies a batch of events with a fixed number of queries"""
+        self.deliver(webhook_event('evt_1', 'payment.captured', 'pi_0'))
+        self.deliver(webhook_event('evt_2', 'payment.failed', 'pi_1'))
+        self.deliver(webhook_event('evt_3', 'payment.captured', 'pi_unknown'))
+        self.deliver(webhook_event('evt_4', 'refund.processed', 'pi_2'))
+        
+        with CaptureQueriesContext(connection) as queries:
+            handled = webhooks.process_batch()
+        
+        self.assertEqual(handled, 4)
+        # 8 to apply the events, the rest to add the completed payment to the revenue rollups
+        self.assertLessEqual(len(queries), 19)
+        statuses = dict(Transaction.objects.values_list('payment_intent_id', 'status'))
+        self.assertEqual(statuses, {'pi_0': 'COMPLETED', 'pi_1': 'FAILED', 'pi_2': 'PROCESSING'})
+        self.assertIsNotNone(Transaction.objects.get(payment_intent_id='pi_0').completed_at)
+        self.assertFalse(WebhookEvent.objects.filter(processed=False).exists())
+        self.assertEqual(WebhookEvent.objects.get(event_id='evt_1').transaction, self.transactions[0])
+        self.assertEqual(process_webhook_events(), 0)
+
+
+class ReconciliationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123', role='BUYER'
+        )
+        self.today = timezone.localdate()
+        self.transactions = {}
+        for name, amount, txn_status in (('paid', '500.00', 'COMPLETED'), ('short', '750.00', 'COMPLETED'),
+                                         ('pending', '300.00', 'PROCESSING'), ('unsettled', '900.00', 'COMPLETED')):
+            self.transactions[name] = Transaction.objects.create(
+                user=self.user, amount=amount, transaction_type='BOOKING_FEE', status=txn_status,
+                payment_intent_id=f'pi_{name}', gateway_transaction_id=f'txn_{name}' if name != 'pending' else '',
+                completed_at=timezone.now() if txn_status == 'COMPLETED' else None
+            )
+    
+    def reconcile(self, rows, **kwargs):
+        source = io.StringIO()
+        writer = csv.writer(source)
+        writer.writerow(['payment_id', 'amount', 'status'])
+        writer.writerows(rows)
+        report = io.StringIO()
+        result = reconciliation.reconcile_file(io.BytesIO(source.getvalue().encode()), report, batch_size=2, **kwargs)
+        return result, list(csv.DictReader(io.StringIO(report.getvalue())))
+    
+    def test_flags_discrepancies(self):
+        """Test mismatched, missing, duplicate and invalid rows are reported"""
+        result, report = self.reconcile([
+            ['txn_paid', '500.00', 'captured'],
+            ['txn_short', '700.00', 'captured'],
+            ['pi_pending', '300', 'captured'],
+            ['txn_ghost', '100.00', 'captured'],
+            ['txn_paid', '500.00', 'captured'],
+            ['', '100.00', 'captured'],
+            ['txn_short', 'n/a', 'captured'],
+        ], since=self.today - timedelta(days=1), until=self.today)
+        
+        self.assertEqual(result.rows, 7)
+        self.assertEqual(result.matched, 4)
+        self.assertEqual(result.discrepancies, {
+            'AMOUNT_MISMATCH': 1, 'STATUS_MISMATCH': 1, 'MISSING_TRANSACTION': 1,
+            'DUPLICATE_SETTLEMENT': 1, 'INVALID_ROW': 2, 'MISSING_SETTLEMENT': 1,
+        })
+        flagged = {(row['kind'], row['payment_id']) for row in report}
+        self.assertIn(('AMOUNT_MISMATCH', 'txn_short'), flagged)
+        self.assertIn(('STATUS_MISMATCH', 'pi_pending'), flagged)
+        self.assertIn(('MISSING_SETTLEMENT', 'txn_unsettled'), flagged)
+        amount_row = next(row for row in report if row['kind'] == 'AMOUNT_MISMATCH')
+        self.assertEqual((amount_row['expected'], amount_row['actual'], amount_row['line']), ('750.00', '700.00', '3'))
+    
+    def test_batched_lookups(self):
+        """Test each batch costs a fixed number of queries"""
+        rows = [['txn_paid', '500.00', 'captured']] + [['pi_pending', '300.00', 'failed']] * 5
+        with CaptureQueriesContext(connection) as queries:
+            result, _ = self.reconcile(rows)
+        self.assertEqual(result.matched, 6)
+        self.assertEqual(len(queries), 2 * 3)
+
+
+class IdempotencyTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='testpass123', role='BUYER'
+        )
+        self.property = Property.objects.create(
+            owner=self.user, title='Sea view apartment', description='Two bedroom apartment',
+            price='7500000.00', property_type='APARTMENT', status='PUBLISHED', address='12 Marine Drive',
+            city='Mumbai', state='Maharashtra', pincode='400002'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.payment = {'amount': '500.00', 'transaction_type': 'BOOKING_FEE', 'property_id': self.property.id}
+    
+    def initiate(self, key=None, **overrides):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key is not None else {}
+        return self.client.post(reverse('initiate-payment'), {**self.payment, **overrides}, format='json', **headers)
+    
+    def test_retries_replay_first_response(self):
+        """Test a retried initiate or confirm returns the original response without new writes"""
+        first = self.initiate('key-1')
+        retry = self.initiate('key-1')
+        
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['data']['transaction_id'], str(first.data['data']['transaction_id']))
+        self.assertEqual(Transaction.objects.count(), 1)
+        
+        url = reverse('confirm-payment', args=[first.data['data']['transaction_id']])
+        for _ in range(2):
+            response = self.client.post(url, {'payment_method_id': 'pm_card'}, format='json', HTTP_IDEMPOTENCY_KEY='key-2')
+            self.assertEqual(response.data['data']['status'], 'COMPLETED')
+        self.assertEqual(IdempotencyKey.objects.count(), 2)
+    
+    def test_requests_without_key_or_with_new_key_run(self):
+        """Test requests without a key, or with distinct keys, each create a transaction"""
+        self.initiate()
+        self.initiate()
+        self.initiate('key-1')
+        self.initiate('key-2')
+        self.assertEqual(Transaction.objects.count(), 4)
+    
+    def test_key_reused_for_different_request_rejected(self):
+        """Test a key sent with a different body is a 422"""
+        self.initiate('key-1')
+        response = self.initiate('key-1', amount='900.00')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(self.initiate('x' * 300).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Transaction.objects.count(), 1)
+    
+    def test_replays_from_database_after_cache_loss(self):
+        """Test stored responses survive cache eviction and outages"""
+        first = self.initiate('key-1')
+        cache.clear()
+        self.assertEqual(self.initiate('key-1').json(), first.json())
+        
+        broken = mock.Mock(**{f'{name}.side_effect': ConnectionError for name in ('get', 'add', 'set', 'delete')})
+        with mock.patch.object(idempotency, 'cache', broken):
+            self.assertEqual(self.initiate('key-1').json(), first.json())
+            self.assertEqual(self.initiate('key-2').status_code, status.HTTP_201_CREATED)
+            self.assertEqual(self.initiate('key-2')['Idempotent-Replayed'], 'true')
+        self.assertEqual(Transaction.objects.count(), 2)
+    
+    def test_in_flight_duplicate_conflicts(self):
+        """Test a duplicate of a request still running waits and then gets a 409"""
+        self.assertEqual(idempotency.claim(self.user.pk, 'initiate_payment', 'key-1'), 'cache')
+        with mock.patch.object(idempotency, 'WAIT_TIMEOUT', 0.1):
+            response = self.initiate('key-1')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Transaction.objects.exists())
+    
+    def test_prune_expired_keys(self):
+        """Test expired keys are removed and no longer replayed"""
+        self.initiate('key-1')
+        cache.clear()
+        self.assertEqual(idempotency.prune(timezone.now() + timedelta(seconds=idempotency.IDEMPOTENCY_TTL + 1)), 1)
+        self.assertEqual(self.initiate('key-1').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+
+class GatewayClientTestCase(TestCase):
+    def setUp(self):
+        self.fake = FakeGateway().start()
+        self.addCleanup(self.fake.stop)
+        self.now = 0.0
+        self.breaker = gateway.CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=lambda: self.now)
+        self.client = gateway.GatewayClient(self.fake.url, 'rzp_test', 'secret', read_timeout=0.2, breaker=self.breaker)
+    
+    def test_calls_reuse_pooled_connection(self):
+        """Test consecutive calls share one keep-alive connection"""
+        for index in range(10):
+            order = self.client.create_order(50000, 'INR', f'receipt-{index}')
+            self.assertEqual((order['amount'], order['status']), (50000, 'created'))
+        self.assertEqual((self.fake.requests, self.fake.connections), (10, 1))
+    
+    def test_retries_only_safe_calls(self):
+        """Test 5xx answers are retried for captures but not for order creation"""
+        self.fake.fail_next = [503, 502]
+        self.assertEqual(self.client.capture_payment('pay_1', 50000, 'INR')['status'], 'captured')
+        self.assertEqual(self.fake.requests, 3)
+        
+        self.fake.fail_next = [503]
+        with self.assertRaises(gateway.GatewayUnavailable):
+            self.client.create_order(50000, 'INR', 'receipt')
+        self.assertEqual(self.fake.requests, 4)
+    
+    def test_timeouts_bound_slow_gateway(self):
+        """Test a hung gateway costs a call its timeout rather than the worker"""
+        self.fake.latency = 1.0
+        client = gateway.GatewayClient(self.fake.url, 'rzp_test', 'secret', read_timeout=0.1, max_retries=0)
+        started = time.monotonic()
+        with self.assertRaises(gateway.GatewayUnavailable):
+            client.capture_payment('pay_1', 50000, 'INR')
+        self.assertLess(time.monotonic() - started, 0.8)
+    
+    def test_circuit_breaker_fails_fast_then_probes(self):
+        """Test the breaker opens after repeated failures and closes after a good probe"""
+        self.fake.fail_next = [503] * 6
+        for _ in range(2):
+            with self.assertRaises(gateway.GatewayUnavailable):
+                self.client.capture_payment('pay_1', 50000, 'INR')
+        self.assertEqual(self.breaker.state, 'open')
+        
+        with self.assertRaises(gateway.GatewayUnavailable):
+            self.client.capture_payment('pay_1', 50000, 'INR')
+        self.assertEqual(self.fake.requests, 6)
+        
+        self.now += 30
+        self.assertEqual(self.client.capture_payment('pay_1', 50000, 'INR')['status'], 'captured')
+        self.assertEqual(self.breaker.state, 'closed')
+    
+    def test_client_errors_raise_without_retry(self):
+        """Test 4xx answers are returned as GatewayError and keep the circuit closed"""
+        # Each refused capture is followed by a lookup of the payment
+        self.fake.fail_next = [400] * 6
+        for _ in range(3):
+            with self.assertRaises(gateway.GatewayError) as raised:
+                self.client.capture_payment('pay_1', 50000, 'INR')
+            self.assertNotIsInstance(raised.exception, gateway.GatewayUnavailable)
+        self.assertEqual((self.fake.requests, self.breaker.state), (6, 'closed'))
+    
+    def test_capture_with_lost_answer_succeeds(self):
+        """Test a capture retried after its answer was lost is confirmed from the payment's state"""
+        self.fake.lose_next = 1
+        payment = self.client.capture_payment('pay_1', 50000, 'INR')
+        self.assertEqual((payment['status'], payment['amount']), ('captured', 50000))
+        # Capture, retried capture refused as already captured, lookup
+        self.assertEqual(self.fake.requests, 3)
+        
+        with self.assertRaises(gateway.GatewayError) as raised:
+            self.client.capture_payment('pay_1', 60000, 'INR')
+        self.assertEqual(raised.exception.status_code, 400)
+    
+    def gateway_api(self):
+        user = User.objects.create_user(email='buyer@example.com', username='buyer', password='testpass123')
+        api = APIClient()
+        api.force_authenticate(user=user)
+        settings_override = override_settings(PAYMENT_GATEWAY_ENABLED=True, RAZORPAY_API_URL=self.fake.url,
+                                              RAZORPAY_WEBHOOK_SECRET='whsec_test')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        gateway.reset_client()
+        self.addCleanup(gateway.reset_client)
+        return api
+    
+    def test_order_and_capture_amounts_agree(self):
+        """Test the order and the capture use the same paise for non-integral amounts"""
+        api = self.gateway_api()
+        for index, amount, paise in ((1, '19.99', 1999), (2, '0.29', 29), (3, 1234.56, 123456)):
+            response = api.post(reverse('initiate-payment'), {
+                'amount': amount, 'transaction_type': 'BOOKING_FEE', 'property_id': None
+            }, format='json')
+            order_id = response.data['data']['payment_intent']['id']
+            api.post(reverse('confirm-payment', args=[response.data['data']['transaction_id']]),
+                     {'payment_method_id': f'pay_{index}'}, format='json')
+            self.assertEqual(self.fake.orders[order_id]['amount'], paise)
+            self.assertEqual(self.fake.payments[f'pay_{index}']['amount'], paise)
+            self.assertEqual(Transaction.objects.get(payment_intent_id=order_id).status, 'COMPLETED')
+    
+    def test_repeated_confirmation_keeps_captured_payment(self):
+        """Test confirming a decided transaction again returns it without another capture"""
+        api = self.gateway_api()
+        response = api.post(reverse('initiate-payment'), {
+            'amount': '500.00', 'transaction_type': 'BOOKING_FEE', 'property_id': None
+        }, format='json')
+        url = reverse('confirm-payment', args=[response.data['data']['transaction_id']])
+        self.assertEqual(api.post(url, {'payment_method_id': 'pay_1'}, format='json').data['data']['status'], 'COMPLETED')
+        requests = self.fake.requests
+        
+        for payment_method_id in ('pay_1', 'pay_2'):
+            response = api.post(url, {'payment_method_id': payment_method_id}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual((response.data['data']['status'], response.data['data']['gateway_transaction_id']),
+                             ('COMPLETED', 'pay_1'))
+        self.assertEqual(self.fake.requests, requests)
+        self.assertEqual(Transaction.objects.get().payment_method_id, 'pay_1')
+    
+    def test_webhooks_match_gateway_payments(self):
+        """Test webhooks find gateway payments by order id, and failed attempts never undo a capture"""
+        api = self.gateway_api()
+        orders = []
+        for _ in range(2):
+            response = api.post(reverse('initiate-payment'), {
+                'amount': '500.00', 'transaction_type': 'BOOKING_FEE', 'property_id': None
+            }, format='json')
+            orders.append((response.data['data']['transaction_id'], response.data['data']['payment_intent']['id']))
+        api.post(reverse('confirm-payment', args=[orders[1][0]]), {'payment_method_id': 'pay_2'}, format='json')
+        
+        for event in (webhook_event('evt_1', 'payment.captured', 'pay_1', order_id=orders[0][1]),
+                      webhook_event('evt_2', 'payment.failed', 'pay_0', order_id=orders[0][1]),
+                      webhook_event('evt_3', 'payment.failed', 'pay_A', order_id=orders[1][1]),
+                      webhook_event('evt_4', 'payment.failed', 'pay_2', order_id=orders[1][1])):
+            body = json.dumps(event).encode()
+            api.post(reverse('razorpay-webhook'), body, content_type='application/json',
+                     HTTP_X_RAZORPAY_SIGNATURE=webhooks.sign(body))
+        webhooks.process_pending()
+        
+        statuses = dict(Transaction.objects.values_list('payment_intent_id', 'status'))
+        self.assertEqual(statuses, {orders[0][1]: 'COMPLETED', orders[1][1]: 'COMPLETED'})
+        linked = set(WebhookEvent.objects.filter(transaction__isnull=False).values_list('event_id', flat=True))
+        self.assertEqual(linked, {'evt_1', 'evt_4'})
+        self.assertEqual(DailyRevenue.objects.get(status='COMPLETED').amount, Decimal('1000.00'))
+    
+    def test_payment_views_use_gateway(self):
+        """Test initiate and confirm go through the gateway when it is enabled"""
+        user = User.objects.create_user(email='buyer@example.com', username='buyer', password='testpass123')
+        api = APIClient()
+        api.force_authenticate(user=user)
+        with override_settings(PAYMENT_GATEWAY_ENABLED=True, RAZORPAY_API_URL=self.fake.url):
+            gateway.reset_client()
+            self.addCleanup(gateway.reset_client)
+            response = api.post(reverse('initiate-payment'), {
+                'amount': '500.00', 'transaction_type': 'BOOKING_FEE', 'property_id': None
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertTrue(response.data['data']['payment_intent']['id'].startswith('order_'))
+            
+            url = reverse('confirm-payment', args=[response.data['data']['transaction_id']])
+            self.fake.fail_next = [503] * 3
+            self.assertEqual(api.post(url, {'payment_method_id': 'pay_1'}, format='json').status_code,
+                             status.HTTP_503_SERVICE_UNAVAILABLE)
+            response = api.post(url, {'payment_method_id': 'pay_1'}, format='json')
+        self.assertEqual(response.data['data']['status'], 'COMPLETED')
+        self.assertEqual(response.data['data']['gateway_transaction_id'], 'pay_1')
@@ -1,16 +1,19 @@
-import hashlib
-import hmac
+import uuid
+from decimal import Decimal
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from django.conf import settings
+from django.db import transaction as db_transaction
 from django.utils import timezone
-from .models import Transaction, WebhookEvent
-import json
+from nal_backend.apps.analytics import rollups
+from . import gateway, webhooks
+from .idempotency import idempotent
+from .models import Transaction
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent('initiate_payment')
 def initiate_payment(request):
     """Initiate payment process"""
     try:
@@ -23,28 +26,41 @@ def initiate_payment(request):
                 'errors': [f'Required fields: {", ".join(required_fields)}']
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create transaction record
+        # Create the transaction with its payment intent in a single insert
+        transaction_uuid = uuid.uuid4()
+        
+        # Paise computed once: the order, the stored amount and the capture agree
+        amount = gateway.to_paise(data['amount'])
+        
+        if gateway.enabled():
+            order = gateway.get_client().create_order(amount, 'INR', str(transaction_uuid))
+            payment_intent = {
+                'id': order['id'],
+                'amount': order['amount'],
+                'currency': order['currency'],
+                'status': order['status']
+            }
+        else:
+            # Simulate payment gateway integration (Razorpay)
+            payment_intent = {
+                'id': f'pi_{transaction_uuid}',
+                'amount': amount,
+                'currency': 'INR',
+                'status': 'requires_payment_method'
+            }
+        
         transaction = Transaction.objects.create(
+            uuid=transaction_uuid,
             user=request.user,
             property_id=data['property_id'],
-            amount=data['amount'],
+            amount=Decimal(amount) / 100,
             transaction_type=data['transaction_type'],
             description=data.get('description', ''),
-            metadata=data.get('metadata', {})
+            metadata=data.get('metadata', {}),
+            payment_intent_id=payment_intent['id'],
+            status='PROCESSING'
         )
         
-        # Simulate payment gateway integration (Razorpay)
-        payment_intent = {
-            'id': f'pi_{transaction.uuid}',
-            'amount': int(float(data['amount']) * 100),  # Convert to paise
-            'currency': 'INR',
-            'status': 'requires_payment_method'
-        }
-        
-        transaction.payment_intent_id = payment_intent['id']
-        transaction.status = 'PROCESSING'
-        transaction.save()
-        
         return Response({
             'success': True,
             'data': {
@@ -54,6 +70,11 @@ def initiate_payment(request):
             }
         }, status=status.HTTP_201_CREATED)
         
+    except gateway.GatewayUnavailable:
+        return Response({
+            'success': False,
+            'errors': ['Payment gateway unavailable, please retry']
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
         return Response({
             'success': False,
@@ -62,49 +83,70 @@ def initiate_payment(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent('confirm_payment')
 def confirm_payment(request, transaction_id):
     """Confirm payment completion"""
-    try:
-        transaction = Transaction.objects.get(uuid=transaction_id, user=request.user)
-        
-        payment_method_id = request.data.get('payment_method_id')
-        if not payment_method_id:
-            return Response({
-                'success': False,
-                'errors': ['payment_method_id is required']
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Simulate payment processing
-        # In production, integrate with actual payment gateway
-        success = True  # Simulate success
-        
-        if success:
-            transaction.status = 'COMPLETED'
-            transaction.payment_method_id = payment_method_id
-            transaction.gateway_transaction_id = f'txn_{transaction.uuid}'
-            transaction.completed_at = timezone.now()
-            transaction.gateway_response = {
-                'status': 'success',
-                'gateway_transaction_id': f'txn_{transaction.uuid}',
-                'payment_method': payment_method_id
-            }
-        else:
-            transaction.status = 'FAILED'
-            transaction.gateway_response = {
-                'status': 'failed',
-                'error': 'Payment declined'
-            }
-        
-        transaction.save()
-        
+    payment_method_id = request.data.get('payment_method_id')
+    if not payment_method_id:
         return Response({
-            'success': True,
-            'data': {
-                'transaction_id': transaction.uuid,
-                'status': transaction.status,
-                'gateway_transaction_id': transaction.gateway_transaction_id
-            }
-        })
+            'success': False,
+            'errors': ['payment_method_id is required']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        # Locked until saved: a repeated confirmation waits, then finds the outcome
+        with db_transaction.atomic():
+            transaction = Transaction.objects.select_for_update().get(uuid=transaction_id, user=request.user)
+            if transaction.status != 'PROCESSING':
+                # Already decided; a second capture would be refused and read as a decline
+                return _confirmation_response(transaction)
+            
+            gateway_transaction_id = f'txn_{transaction.uuid}'
+            error = 'Payment declined'
+            if gateway.enabled():
+                try:
+                    payment = gateway.get_client().capture_payment(
+                        payment_method_id, gateway.to_paise(transaction.amount), transaction.currency
+                    )
+                    success = payment.get('status') == 'captured'
+                    gateway_transaction_id = payment.get('id', payment_method_id)
+                except gateway.GatewayUnavailable:
+                    # Nothing was decided; the client retries the confirmation
+                    return Response({
+                        'success': False,
+                        'errors': ['Payment gateway unavailable, please retry']
+                    }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                except gateway.GatewayError as e:
+                    success, error = False, str(e)
+            else:
+                # Simulate payment processing
+                success = True
+            
+            if success:
+                transaction.status = 'COMPLETED'
+                transaction.payment_method_id = payment_method_id
+                transaction.gateway_transaction_id = gateway_transaction_id
+                transaction.completed_at = timezone.now()
+                transaction.gateway_response = {
+                    'status': 'success',
+                    'gateway_transaction_id': gateway_transaction_id,
+                    'payment_method': payment_method_id
+                }
+            else:
+                transaction.status = 'FAILED'
+                transaction.gateway_response = {
+                    'status': 'failed',
+                    'error': error
+                }
+            
+            transaction.save(update_fields=[
+                'status', 'payment_method_id', 'gateway_transaction_id', 'completed_at', 'gateway_response',
+                'updated_at'
+            ])
+            if transaction.status == 'COMPLETED':
+                rollups.transactions_changed([transaction.id])
+        
+        return _confirmation_response(transaction)
         
     except Transaction.DoesNotExist:
         return Response({
@@ -112,6 +154,16 @@ def confirm_payment(request, transaction_id):
             'errors': ['Transaction not found']
         }, status=status.HTTP_404_NOT_FOUND)
 
+def _confirmation_response(transaction):
+    return Response({
+        'success': True,
+        'data': {
+            'transaction_id': transaction.uuid,
+            'status': transaction.status,
+            'gateway_transaction_id': transaction.gateway_transaction_id
+        }
+    })
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_transactions(request):
@@ -150,69 +202,14 @@ def list_transactions(request):
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def webhook_handler(request):
-    """Handle payment gateway webhooks"""
+    """Acknowledge a payment gateway webhook; events are applied by process_webhook_events"""
+    payload = request.body
+    if not webhooks.verify_signature(payload, request.headers.get('X-Razorpay-Signature', '')):
+        return Response({'error': 'Invalid signature'}, status=status.HTTP_400_BAD_REQUEST)
+    
     try:
-        # Verify webhook signature (implement based on your payment provider)
-        signature = request.headers.get('X-Razorpay-Signature', '')
-        payload = request.body
-        
-        # Verify signature (simplified - implement proper verification)
-        # expected_signature = hmac.new(
-        #     settings.RAZORPAY_WEBHOOK_SECRET.encode(),
-        #     payload,
-        #     hashlib.sha256
-        # ).hexdigest()
-        
-        # if not hmac.compare_digest(signature, expected_signature):
-        #     return Response({'error': 'Invalid signature'}, status=400)
-        
-        event_data = json.loads(payload)
-        event_type = event_data.get('event')
-        
-        # Create webhook event record
-        webhook_event = WebhookEvent.objects.create(
-            provider='razorpay',
-            event_type=event_type,
-            event_id=event_data.get('id', ''),
-            payload=event_data
-        )
-        
-        # Process webhook based on event type
-        if event_type == 'payment.captured':
-            payment_id = event_data['payload']['payment']['entity']['id']
-            # Find and update transaction
-            try:
-                transaction = Transaction.objects.get(payment_intent_id=payment_id)
-                transaction.status = 'COMPLETED'
-                transaction.completed_at = timezone.now()
-                transaction.save()
-                
-                webhook_event.transaction = transaction
-                webhook_event.processed = True
-                webhook_event.processed_at = timezone.now()
-                webhook_event.save()
-                
-            except Transaction.DoesNotExist:
-                pass
-        
-        elif event_type == 'payment.failed':
-            payment_id = event_data['payload']['payment']['entity']['id']
-            try:
-                transaction = Transaction.objects.get(payment_intent_id=payment_id)
-                transaction.status = 'FAILED'
-                transaction.save()
-                
-                webhook_event.transaction = transaction
-                webhook_event.processed = True
-                webhook_event.processed_at = timezone.now()
-                webhook_event.save()
-                
-            except Transaction.DoesNotExist:
-                pass
-        
-        return Response({'status': 'success'})
-        
-    except Exception as e:
-        return Response({
-            'error': 'Webhook processing failed'
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        webhooks.record_event(payload, request.headers.get('X-Razorpay-Event-Id', ''))
+    except webhooks.InvalidWebhook as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({'status': 'success'})
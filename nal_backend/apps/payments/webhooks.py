@@ -0,0 +1,166 @@
+"""Gateway webhook ingestion.
+
+The webhook endpoint only verifies the signature and stores the raw event:
+one insert that ignores an ``event_id`` already stored, so gateway retries
+and duplicate deliveries are acknowledged without a second row or an error.
+``process_pending`` (the ``process_webhook_events`` task, run every few
+seconds by Celery beat) then applies unprocessed events in batches, with one
+query for the transactions of a batch (by order and payment id, see
+``find_transaction``) and a few set-based updates for the transactions and
+events. Completed payments are
+added to the revenue rollups (``analytics.rollups``) in the same batch.
+"""
+import hashlib
+import hmac
+import json
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from nal_backend.apps.analytics import rollups
+
+from .models import Transaction, WebhookEvent
+
+PROVIDER = 'razorpay'
+BATCH_SIZE = 500
+
+# Transaction status each event type moves the payment to
+EVENT_STATUSES = {
+    'payment.captured': 'COMPLETED',
+    'payment.failed': 'FAILED',
+}
+
+# Never moved back to PROCESSING or FAILED by an event
+SETTLED_STATUSES = ('COMPLETED', 'REFUNDED')
+
+
+class InvalidWebhook(Exception):
+    pass
+
+
+def sign(payload, secret=None):
+    """Hex HMAC-SHA256 of the raw body, as the gateway computes it"""
+    secret = settings.RAZORPAY_WEBHOOK_SECRET if secret is None else secret
+    return hmac.new(secret.encode(), payload, hashlib.sha256).hexdigest()
+
+
+def verify_signature(payload, signature):
+    # Without a configured secret no delivery can be trusted
+    if not settings.RAZORPAY_WEBHOOK_SECRET or not signature:
+        return False
+    return hmac.compare_digest(sign(payload), signature)
+
+
+def record_event(payload, event_id=''):
+    """Store a verified delivery unless its event is already stored.
+
+    ``event_id`` is the gateway's delivery header; events without one are
+    identified by their body, so identical redeliveries still collapse.
+    """
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        raise InvalidWebhook('Invalid JSON payload')
+    if not isinstance(event, dict):
+        raise InvalidWebhook('Invalid JSON payload')
+
+    event_id = str(event_id or event.get('id') or hashlib.sha256(payload).hexdigest())[:255]
+    WebhookEvent.objects.bulk_create([
+        WebhookEvent(provider=PROVIDER, event_type=str(event.get('event', ''))[:50], event_id=event_id, payload=event)
+    ], ignore_conflicts=True)
+    return event_id
+
+
+def payment_refs(event):
+    """``(order id, payment id)`` of the payment an event refers to, either possibly None"""
+    try:
+        entity = event['payload']['payment']['entity']
+        return entity.get('order_id') or None, entity.get('id') or None
+    except (AttributeError, KeyError, TypeError):
+        return None, None
+
+
+def find_transaction(event_type, refs, by_intent, by_payment):
+    """The transaction of an event's ``(order id, payment id)``.
+
+    With the gateway enabled ``payment_intent_id`` holds the order id, and
+    ``gateway_transaction_id`` the payment id once the payment is confirmed;
+    simulated payments use the payment id as their ``payment_intent_id``.
+    An order can see several payment attempts, so a failed attempt is only
+    matched by its own payment id, never through the order.
+    """
+    order_id, payment_id = refs
+    if EVENT_STATUSES[event_type] != 'FAILED' and order_id in by_intent:
+        return by_intent[order_id]
+    return by_intent.get(payment_id) or by_payment.get(payment_id)
+
+
+def process_batch(batch_size=BATCH_SIZE):
+    """Apply the oldest unprocessed events; returns how many were handled"""
+    with transaction.atomic():
+        pending = WebhookEvent.objects.filter(processed=False).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Concurrent workers take disjoint batches
+            pending = pending.select_for_update(skip_locked=True)
+        events = list(pending[:batch_size])
+        if not events:
+            return 0
+
+        refs = {event.id: payment_refs(event.payload) for event in events if event.event_type in EVENT_STATUSES}
+        order_ids = {order_id for order_id, _ in refs.values()} - {None}
+        payment_ids = {payment_id for _, payment_id in refs.values()} - {None}
+        by_intent, by_payment = {}, {}
+        if order_ids or payment_ids:
+            for txn in Transaction.objects.filter(
+                Q(payment_intent_id__in=order_ids | payment_ids) | Q(gateway_transaction_id__in=payment_ids)
+            ):
+                by_intent[txn.payment_intent_id] = txn
+                if txn.gateway_transaction_id:
+                    by_payment[txn.gateway_transaction_id] = txn
+
+        now = timezone.now()
+        final_status = {}
+        linked = []
+        for event in events:
+            if event.id not in refs:
+                continue
+            txn = find_transaction(event.event_type, refs[event.id], by_intent, by_payment)
+            if txn is None:
+                continue
+            event.transaction = txn
+            linked.append(event)
+            # Later events of a payment win, but a captured payment stays captured
+            if txn.status not in SETTLED_STATUSES and final_status.get(txn.id) != 'COMPLETED':
+                final_status[txn.id] = EVENT_STATUSES[event.event_type]
+
+        # One update per resulting status rather than one per transaction
+        by_status = {}
+        for txn_id, txn_status in final_status.items():
+            by_status.setdefault(txn_status, []).append(txn_id)
+        for txn_status, txn_ids in by_status.items():
+            changes = {'status': txn_status, 'updated_at': now}
+            if txn_status == 'COMPLETED':
+                changes['completed_at'] = now
+            # Also guards against a confirmation that landed since the read
+            Transaction.objects.filter(id__in=txn_ids).exclude(status__in=SETTLED_STATUSES).update(**changes)
+        rollups.transactions_changed(by_status.get('COMPLETED', []))
+
+        # Events for unknown payments or of other types are recorded as
+        # handled too, so they do not hold up later batches
+        WebhookEvent.objects.filter(id__in=[event.id for event in events]).update(processed=True, processed_at=now)
+        WebhookEvent.objects.bulk_update(linked, ['transaction'])
+    return len(events)
+
+
+def process_pending(batch_size=BATCH_SIZE, max_batches=None):
+    """Process batches until no unprocessed event is left; returns the event count"""
+    handled = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = process_batch(batch_size)
+        if not count:
+            break
+        handled += count
+        batches += 1
+    return handled
@@ -0,0 +1,79 @@
+"""Per-property amenity bitmask.
+
+Every ``PropertyAmenity`` gets a ``bit`` and ``Property.amenity_mask`` has
+that bit set for each amenity of the property, so requiring several
+amenities is one ``amenity_mask & wanted = wanted`` predicate on the
+properties table instead of one join per amenity against the mapping table.
+The ``(status, amenity_mask)`` index lets counts be answered from the index
+alone: ~7 ms against ~90 ms with joins at 100k listings
+(``python -m benchmarks.amenity_filter``, SQLite).
+
+Masks are rewritten from the mapping table whenever a mapping is saved or
+deleted (see signals), and set directly by the bulk importer. Amenities past
+the 63 available bits have no bit and are still filtered with a join.
+"""
+from collections import defaultdict
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Property, PropertyAmenity, PropertyAmenityMapping
+
+
+def mask_for(bits):
+    mask = 0
+    for bit in bits:
+        if bit is not None:
+            mask |= 1 << bit
+    return mask
+
+
+def masks_for(property_ids):
+    """Current mask of each of ``property_ids`` from the mapping table"""
+    masks = {property_id: 0 for property_id in property_ids}
+    rows = PropertyAmenityMapping.objects.filter(
+        property_id__in=property_ids, amenity__bit__isnull=False
+    ).values_list('property_id', 'amenity__bit')
+    for property_id, bit in rows:
+        masks[property_id] |= 1 << bit
+    return masks
+
+
+def refresh_masks(property_ids, touch=False):
+    """Rewrite ``amenity_mask`` of ``property_ids``; one UPDATE per distinct mask.
+
+    With ``touch`` the properties' ``updated_at`` is bumped in the same
+    statement so cached detail payloads go stale.
+    """
+    by_mask = defaultdict(list)
+    for property_id, mask in masks_for(property_ids).items():
+        by_mask[mask].append(property_id)
+    values = {'updated_at': timezone.now()} if touch else {}
+    updated = 0
+    for mask, ids in by_mask.items():
+        queryset = Property.objects.filter(id__in=ids)
+        if not touch:
+            # Rebuilds leave rows that already hold the right mask alone
+            queryset = queryset.exclude(amenity_mask=mask)
+        updated += queryset.update(amenity_mask=mask, **values)
+    return updated
+
+
+def assign_bits():
+    """Give a bit to amenities created before masks existed; returns how many"""
+    assigned = 0
+    for amenity in PropertyAmenity.objects.filter(bit=None).order_by('id'):
+        amenity.save(update_fields=['bit'])
+        assigned += amenity.bit is not None
+    return assigned
+
+
+def filter_by_amenities(queryset, amenities):
+    """Keep properties having every one of ``amenities`` (``PropertyAmenity`` rows)"""
+    mask = mask_for(amenity.bit for amenity in amenities)
+    if mask:
+        queryset = queryset.alias(matched_amenities=F('amenity_mask').bitand(mask)).filter(matched_amenities=mask)
+    for amenity in amenities:
+        if amenity.bit is None:
+            queryset = queryset.filter(amenities__amenity=amenity)
+    return queryset
@@ -0,0 +1,213 @@
+"""Response caches for the public property endpoints.
+
+Property detail payloads are cached per uuid and ``updated_at``. Every change
+that affects the payload (media, amenities, owner/agent names) touches the
+property's ``updated_at``, so a new version simply misses the cache and the
+same value doubles as the ETag/Last-Modified validator.
+
+Listing pages are keyed on a signature of the request parameters plus
+the current version of every namespace the request depends on:
+
+* ``type:<property_type>`` when filtering on property type,
+* ``city:<value>`` when filtering on city,
+* ``all`` for requests filtering on neither,
+* ``availability`` when filtering on a free booking slot.
+
+Property and media writes bump the namespaces of the affected listing after
+the transaction commits. Because the city filter is a substring match, a
+write bumps the namespace of every substring of the city name up to
+``MAX_CITY_FILTER_LENGTH`` characters, so a request for ``city=mum`` is
+invalidated by a Mumbai listing. That is at most ``MAX_CITY_FILTER_LENGTH``
+keys per character of the city: 136 for a 16 character name, 1,480 for the
+100 character maximum. Requests filtering on a longer city depend on the
+``city:*`` namespace instead, which writes of any city that long bump. Versions are random
+tokens rather than counters, so an evicted version key can never bring a
+stale page back to life.
+"""
+import hashlib
+import json
+import uuid
+from functools import wraps
+from urllib.parse import quote
+
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+from .models import Property
+
+LIST_CACHE_TIMEOUT = 300
+DETAIL_CACHE_TIMEOUT = 60 * 60
+MAX_CITY_FILTER_LENGTH = 16
+LONG_CITY_NAMESPACE = 'city:*'
+HITS_KEY = 'properties:list:hits'
+MISSES_KEY = 'properties:list:misses'
+
+
+def normalize_city(value):
+    return ' '.join((value or '').lower().split())
+
+
+def request_signature(params):
+    """Stable hash of every query parameter, empty ones included"""
+    items = sorted((key, value) for key in params for value in params.getlist(key))
+    return hashlib.sha1(json.dumps(items).encode()).hexdigest()
+
+
+def _version_key(namespace):
+    # City substrings can hold spaces and punctuation
+    return f'properties:ns:{quote(namespace, safe=":*")}'
+
+
+def request_namespaces(params):
+    namespaces = ['global']
+    property_type = params.get('property_type')
+    city = normalize_city(params.get('city'))
+    if property_type:
+        namespaces.append(f'type:{property_type}')
+    if city:
+        namespaces.append(f'city:{city}' if len(city) <= MAX_CITY_FILTER_LENGTH else LONG_CITY_NAMESPACE)
+    if not property_type and not city:
+        namespaces.append('all')
+    # Bumped by every availability index write (see bookings.availability_index)
+    if params.get('available_on'):
+        namespaces.append('availability')
+    return namespaces
+
+
+def property_namespaces(city, property_type):
+    """Namespaces whose cached pages may contain a listing"""
+    namespaces = {'all', f'type:{property_type}'}
+    city = normalize_city(city)
+    for start in range(len(city)):
+        for end in range(start + 1, min(start + MAX_CITY_FILTER_LENGTH, len(city)) + 1):
+            namespaces.add(f'city:{city[start:end].strip()}')
+    namespaces.discard('city:')
+    if len(city) > MAX_CITY_FILTER_LENGTH:
+        namespaces.add(LONG_CITY_NAMESPACE)
+    return namespaces
+
+
+def current_versions(namespaces):
+    keys = [_version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_namespaces(namespaces):
+    token = uuid.uuid4().hex
+    cache.set_many({_version_key(namespace): token for namespace in namespaces}, None)
+
+
+def invalidate_listings(*states):
+    """Bump the namespaces of the given listing states once the transaction commits.
+
+    Each state is a ``(city, property_type, status)`` tuple, typically the
+    listing before and after a write. Writes that never touch a published
+    listing leave the cache alone.
+    """
+    namespaces = set()
+    for city, property_type, status in states:
+        if status == 'PUBLISHED':
+            namespaces |= property_namespaces(city, property_type)
+    if namespaces:
+        transaction.on_commit(lambda: bump_namespaces(namespaces))
+
+
+def invalidate_all():
+    bump_namespaces(['global'])
+
+
+class ListingCache:
+    """Versioned cache keys for one listing request"""
+
+    def __init__(self, params):
+        versions = current_versions(request_namespaces(params))
+        self.token = hashlib.sha1(':'.join(versions).encode()).hexdigest()[:16]
+
+    @classmethod
+    def for_request(cls, request):
+        if not hasattr(request, '_listing_cache'):
+            request._listing_cache = cls(request.GET)
+        return request._listing_cache
+
+    def key(self, kind, signature):
+        return f'properties:{kind}:{signature}:{self.token}'
+
+
+def _record(metric_key):
+    if not cache.add(metric_key, 1, None):
+        try:
+            cache.incr(metric_key)
+        except ValueError:
+            cache.add(metric_key, 1, None)
+
+
+def cache_stats():
+    """Hit/miss counters of the listing cache"""
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = stats.get(HITS_KEY, 0), stats.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+def cached_listing(view):
+    """Serve successful listing responses from the cache"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        listing_cache = ListingCache.for_request(request)
+        key = listing_cache.key('list', request_signature(request.GET))
+
+        data = cache.get(key)
+        if data is not None:
+            _record(HITS_KEY)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _record(MISSES_KEY)
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, LIST_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    return wrapper
+
+
+def property_version(request, property_id):
+    """``updated_at`` of the property, looked up once per request"""
+    if not hasattr(request, '_property_version'):
+        request._property_version = Property.objects.filter(uuid=property_id).values_list(
+            'updated_at', flat=True
+        ).first()
+    return request._property_version
+
+
+def _fields_suffix(fields):
+    return ':' + ','.join(sorted(fields)) if fields else ''
+
+
+def property_etag(request, property_id):
+    updated_at = property_version(request, property_id)
+    if updated_at is None:
+        return None
+    # Sparse fieldsets are different representations of the same version
+    fields = [name.strip() for name in request.GET.get('fields', '').split(',') if name.strip()]
+    return hashlib.sha1(f'{property_id}:{updated_at.isoformat()}{_fields_suffix(set(fields))}'.encode()).hexdigest()
+
+
+def property_last_modified(request, property_id):
+    return property_version(request, property_id)
+
+
+def detail_cache_key(property_id, updated_at, fields=None):
+    return f'properties:detail:{property_id}:{updated_at.isoformat()}{_fields_suffix(fields)}'
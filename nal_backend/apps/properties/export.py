@@ -0,0 +1,112 @@
+"""Streaming export of the property catalogue as NDJSON or CSV.
+
+Rows are read in primary key order, ``chunk_size`` at a time, with
+``values()`` and a keyset condition (``id > last id``) rather than one big
+cursor: MySQL drivers buffer a whole result set client side, so a single
+``iterator()`` over the catalogue would not keep memory flat. Media and
+amenities of each chunk are fetched with one query each, and the encoded
+chunk is yielded before the next one is read, so memory depends on the
+chunk size only, never on the size of the catalogue.
+
+CSV output flattens the nested values: amenity names and media URLs are
+joined with ``|`` (the separator the importer accepts for amenities).
+"""
+import csv
+import datetime
+import io
+import json
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .importer import AMENITY_SEPARATOR
+from .models import Property, PropertyAmenityMapping, PropertyMedia
+
+EXPORT_ROLES = ('ADMIN', 'SYSTEM')
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+EXPORT_FIELDS = (
+    'uuid', 'title', 'description', 'price', 'currency', 'property_type', 'status',
+    'address', 'city', 'state', 'pincode', 'latitude', 'longitude', 'bedrooms',
+    'bathrooms', 'area_sqft', 'parking_spaces', 'ribl_score', 'urgent_sale_value',
+    'created_at', 'updated_at',
+)
+MEDIA_FIELDS = ('media_type', 'media_url', 'is_primary', 'caption')
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def iter_chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of export rows (dicts) for ``queryset``, ``chunk_size`` at a time"""
+    queryset = queryset.order_by('id')
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).values('id', *EXPORT_FIELDS)[:chunk_size])
+        if not rows:
+            return
+        last_id = rows[-1]['id']
+        ids = [row['id'] for row in rows]
+
+        media = defaultdict(list)
+        for item in PropertyMedia.objects.filter(property_id__in=ids).order_by('-is_primary', 'id').values('property_id', *MEDIA_FIELDS):
+            media[item.pop('property_id')].append(item)
+        amenities = defaultdict(list)
+        mappings = PropertyAmenityMapping.objects.filter(property_id__in=ids).order_by('amenity__name')
+        for property_id, name in mappings.values_list('property_id', 'amenity__name'):
+            amenities[property_id].append(name)
+
+        for row in rows:
+            property_id = row.pop('id')
+            row['amenities'] = amenities[property_id]
+            row['media'] = media[property_id]
+        yield rows
+        if len(rows) < chunk_size:
+            return
+
+
+def _ndjson(chunks):
+    for rows in chunks:
+        yield ''.join(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+
+
+def _csv_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return '' if value is None else value
+
+
+def _csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS + ('amenities', 'media_urls'))
+    for rows in chunks:
+        for row in rows:
+            writer.writerow(
+                [_csv_value(row[field]) for field in EXPORT_FIELDS]
+                + [AMENITY_SEPARATOR.join(row['amenities']),
+                   AMENITY_SEPARATOR.join(item['media_url'] for item in row['media'])]
+            )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # The header alone when nothing matched
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+
+def export_queryset(updated_since=None):
+    """Published listings, or every listing changed since ``updated_since``.
+
+    Incremental exports include unpublished and sold listings so consumers
+    can drop them; their ``status`` tells them apart.
+    """
+    if updated_since is None:
+        return Property.objects.filter(status='PUBLISHED')
+    return Property.objects.filter(updated_at__gte=updated_since)
+
+
+def stream_export(queryset, export_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Encoded export of ``queryset``, one string per chunk of rows"""
+    encode = _ndjson if export_format == 'ndjson' else _csv
+    return encode(iter_chunks(queryset, chunk_size))
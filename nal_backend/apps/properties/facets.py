@@ -0,0 +1,189 @@
+"""Facet counts for the property listing.
+
+Counts of published listings per property type, city, bedroom bucket and
+price band are kept in ``PropertyFacetCount`` for the unfiltered listing and
+for every single ``property_type`` / ``city`` filter value. Property writes
+apply +1/-1 deltas to the affected rows in the same transaction, so the
+common facet requests are a single indexed read. Any other combination of
+filters is answered with one grouped aggregate over the filtered listing.
+"""
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, Value, When
+from django.db.models.functions import Cast
+
+from .models import Property, PropertyFacetCount
+
+FACETS = ('property_type', 'city', 'bedrooms', 'price_band')
+# Filters with precomputed tables, and how a request value selects their rows
+PRECOMPUTED_FILTERS = {
+    'property_type': 'filter_value',
+    'city': 'filter_value__icontains',
+}
+
+MAX_BEDROOM_BUCKET = 5
+# (label, lower bound inclusive, upper bound exclusive) in INR
+PRICE_BANDS = [
+    ('under_25l', None, Decimal('2500000')),
+    ('25l_50l', Decimal('2500000'), Decimal('5000000')),
+    ('50l_1cr', Decimal('5000000'), Decimal('10000000')),
+    ('1cr_2cr', Decimal('10000000'), Decimal('20000000')),
+    ('2cr_5cr', Decimal('20000000'), Decimal('50000000')),
+    ('5cr_plus', Decimal('50000000'), None),
+]
+
+
+def bedroom_bucket(bedrooms):
+    bedrooms = max(int(bedrooms or 0), 0)
+    return f'{MAX_BEDROOM_BUCKET}+' if bedrooms >= MAX_BEDROOM_BUCKET else str(bedrooms)
+
+
+def price_band(price):
+    price = Decimal(str(price))
+    for label, lower, upper in PRICE_BANDS:
+        if upper is None or price < upper:
+            return label
+    return PRICE_BANDS[-1][0]
+
+
+def _bedroom_expression():
+    return Case(
+        When(bedrooms__gte=MAX_BEDROOM_BUCKET, then=Value(f'{MAX_BEDROOM_BUCKET}+')),
+        When(bedrooms__lte=0, then=Value('0')),
+        default=Cast('bedrooms', CharField()),
+        output_field=CharField(),
+    )
+
+
+def _price_band_expression():
+    whens = [When(price__lt=upper, then=Value(label)) for label, _, upper in PRICE_BANDS if upper is not None]
+    return Case(*whens, default=Value(PRICE_BANDS[-1][0]), output_field=CharField())
+
+
+def facet_values(state):
+    """Facet values of a listing state (a mapping of property fields)"""
+    return {
+        'property_type': state['property_type'],
+        'city': state['city'],
+        'bedrooms': bedroom_bucket(state['bedrooms']),
+        'price_band': price_band(state['price']),
+    }
+
+
+def facet_rows(values):
+    """Keys of every facet count row a listing with ``values`` contributes to"""
+    scopes = [('', '')] + [(field, values[field]) for field in PRECOMPUTED_FILTERS]
+    return [
+        (filter_field, filter_value, facet, values[facet])
+        for filter_field, filter_value in scopes
+        for facet in FACETS
+    ]
+
+
+def apply_deltas(deltas):
+    """Add ``deltas`` (facet row key -> change) to the stored counts"""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        PropertyFacetCount.objects.bulk_create(
+            [PropertyFacetCount(filter_field=key[0], filter_value=key[1], facet=key[2], value=key[3])
+             for key, delta in deltas.items() if delta > 0],
+            ignore_conflicts=True,
+        )
+        for (filter_field, filter_value, facet, value), delta in deltas.items():
+            PropertyFacetCount.objects.filter(
+                filter_field=filter_field, filter_value=filter_value, facet=facet, value=value
+            ).update(count=F('count') + delta)
+
+
+def record_change(previous, current):
+    """Move a listing's contribution from the ``previous`` to the ``current`` state.
+
+    Either state may be ``None``; only published states are counted.
+    """
+    record_changes([(previous, current)])
+
+
+def record_changes(changes):
+    """Apply several ``(previous, current)`` state changes at once"""
+    deltas = Counter()
+    for previous, current in changes:
+        if previous and previous['status'] == 'PUBLISHED':
+            deltas.subtract(facet_rows(facet_values(previous)))
+        if current and current['status'] == 'PUBLISHED':
+            deltas.update(facet_rows(facet_values(current)))
+    apply_deltas(deltas)
+
+
+def _grouped_counts(queryset):
+    """Published listing counts grouped by every facet, in one query"""
+    return queryset.order_by().annotate(
+        bedroom_bucket=_bedroom_expression(), price_band=_price_band_expression()
+    ).values('property_type', 'city', 'bedroom_bucket', 'price_band').annotate(total=Count('id'))
+
+
+def _format(counts):
+    order = {
+        'bedrooms': [str(bucket) for bucket in range(MAX_BEDROOM_BUCKET)] + [f'{MAX_BEDROOM_BUCKET}+'],
+        'price_band': [label for label, _, _ in PRICE_BANDS],
+    }
+    result = {}
+    for facet in FACETS:
+        values = {value: count for value, count in counts[facet].items() if count > 0}
+        if facet in order:
+            keys = [value for value in order[facet] if value in values]
+        else:
+            keys = sorted(values, key=lambda value: (-values[value], value))
+        result[facet] = [{'value': value, 'count': values[value]} for value in keys]
+    return result
+
+
+def aggregate_counts(queryset):
+    """Facet counts of an arbitrary filtered listing"""
+    counts = defaultdict(Counter)
+    for row in _grouped_counts(queryset):
+        counts['property_type'][row['property_type']] += row['total']
+        counts['city'][row['city']] += row['total']
+        counts['bedrooms'][row['bedroom_bucket']] += row['total']
+        counts['price_band'][row['price_band']] += row['total']
+    return _format(counts)
+
+
+def precomputed_counts(filter_field='', filter_value=''):
+    """Facet counts of the unfiltered listing or of a single filter"""
+    rows = PropertyFacetCount.objects.filter(filter_field=filter_field, count__gt=0)
+    if filter_field:
+        # Cities are disjoint, so summing the tables of every city the
+        # substring filter matches gives the exact counts.
+        rows = rows.filter(**{PRECOMPUTED_FILTERS[filter_field]: filter_value})
+    counts = defaultdict(Counter)
+    for facet, value, count in rows.values_list('facet', 'value', 'count'):
+        counts[facet][value] += count
+    return _format(counts)
+
+
+def rebuild():
+    """Recompute every facet count row from the published listings"""
+    deltas = Counter()
+    for row in _grouped_counts(Property.objects.filter(status='PUBLISHED')):
+        values = {
+            'property_type': row['property_type'],
+            'city': row['city'],
+            'bedrooms': row['bedroom_bucket'],
+            'price_band': row['price_band'],
+        }
+        for key in facet_rows(values):
+            deltas[key] += row['total']
+
+    with transaction.atomic():
+        PropertyFacetCount.objects.all().delete()
+        PropertyFacetCount.objects.bulk_create(
+            [PropertyFacetCount(filter_field=key[0], filter_value=key[1], facet=key[2], value=key[3], count=count)
+             for key, count in deltas.items()],
+            batch_size=1000,
+        )
+    return len(deltas)
@@ -0,0 +1,64 @@
+"""Sparse fieldsets (``?fields=uuid,title,price``) for the property endpoints.
+
+A requested subset trims the serializer output and is pushed down to the
+query: only the columns behind the requested fields are selected (so the
+large ``description``/``address`` TEXT columns stay on disk unless asked
+for) and joins and prefetches feeding unrequested fields are skipped.
+"""
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(value, serializer_class):
+    """Requested output fields of ``serializer_class``, or None for all of them.
+
+    Raises ``InvalidFields`` with a client-facing message on unknown names.
+    """
+    if not value:
+        return None
+    requested = [name.strip() for name in value.split(',') if name.strip()]
+    available = serializer_class().fields
+    unknown = [name for name in requested if name not in available]
+    if unknown:
+        raise InvalidFields(f'Unknown fields: {", ".join(unknown)}; available: {", ".join(available)}')
+    return frozenset(requested) or None
+
+
+def wants(fields, name):
+    return fields is None or name in fields
+
+
+def selected_columns(queryset, fields, related_columns=None):
+    """Columns ``queryset`` must load to render ``fields``.
+
+    ``related_columns`` maps output fields to the related column they read
+    (``owner_name`` -> ``owner__profile__full_name``). The ordering columns
+    are always kept so keyset cursors are built without reloading rows.
+    """
+    concrete = {field.name for field in queryset.model._meta.concrete_fields}
+    related_columns = related_columns or {}
+    columns = ['id']
+    columns += [name for name in fields if name in concrete]
+    columns += [related_columns[name] for name in fields if name in related_columns]
+    columns += [key.lstrip('-') for key in queryset.query.order_by if key.lstrip('-') in concrete]
+    return list(dict.fromkeys(columns))
+
+
+def only_fields(queryset, fields, related_columns=None):
+    """``queryset`` restricted to the columns behind ``fields`` (all when None)"""
+    if fields is None:
+        return queryset
+    return queryset.only(*selected_columns(queryset, fields, related_columns))
+
+
+class SparseFieldsMixin:
+    """Drop serializer fields not listed in ``context['fields']``"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
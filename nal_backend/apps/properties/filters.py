@@ -0,0 +1,103 @@
+"""Filters shared by the public property listing endpoints."""
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+
+from nal_backend.apps.bookings.availability_index import filter_available
+from . import geo
+from .amenities import filter_by_amenities
+from .models import PropertyAmenity
+from .search import get_search_backend
+
+FILTER_PARAMS = ('q', 'property_type', 'min_price', 'max_price', 'city', 'bedrooms', 'amenities', 'lat', 'lng', 'available_on')
+
+
+class InvalidFilter(ValueError):
+    pass
+
+
+def active_filters(params):
+    """Names of the filters set in ``params``"""
+    return {name for name in FILTER_PARAMS if params.get(name)}
+
+
+def filter_properties(queryset, params):
+    """Apply the listing query parameters to ``queryset``.
+    
+    Raises ``InvalidFilter`` with a client-facing message on bad input.
+    """
+    q = params.get('q')
+    if q:
+        queryset = get_search_backend().filter_queryset(queryset, q)
+    
+    property_type = params.get('property_type')
+    if property_type:
+        queryset = queryset.filter(property_type=property_type)
+    
+    min_price = params.get('min_price')
+    max_price = params.get('max_price')
+    if min_price:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price:
+        queryset = queryset.filter(price__lte=max_price)
+    
+    city = params.get('city')
+    if city:
+        queryset = queryset.filter(city__icontains=city)
+    
+    bedrooms = params.get('bedrooms')
+    if bedrooms:
+        queryset = queryset.filter(bedrooms__gte=bedrooms)
+    
+    # Comma separated amenity names, all of which are required
+    amenities = params.get('amenities')
+    if amenities:
+        names = {name.strip() for name in amenities.split(',') if name.strip()}
+        found = list(PropertyAmenity.objects.filter(name__in=names))
+        unknown = names - {amenity.name for amenity in found}
+        if unknown:
+            raise InvalidFilter(f'Unknown amenities: {", ".join(sorted(unknown))}')
+        queryset = filter_by_amenities(queryset, found)
+    
+    # Free site-visit slot on a date, optionally within [available_from, available_until)
+    available_on = params.get('available_on')
+    if available_on:
+        queryset = _filter_availability(queryset, available_on, params)
+    
+    # Location-based search
+    lat = params.get('lat')
+    lng = params.get('lng')
+    radius = params.get('radius', 10)  # km
+    
+    if lat and lng:
+        try:
+            lat, lng, radius = float(lat), float(lng), float(radius)
+        except (TypeError, ValueError):
+            raise InvalidFilter('lat, lng and radius must be numbers')
+        
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180 and radius > 0):
+            raise InvalidFilter('lat, lng or radius out of range')
+        
+        # Geohash cell pruning followed by exact haversine filtering
+        queryset = geo.within_radius(queryset, lat, lng, radius)
+    
+    return queryset
+
+
+def _filter_availability(queryset, available_on, params):
+    try:
+        date = parse_date(available_on)
+        from_time = parse_time(params.get('available_from') or '00:00')
+        until_time = parse_time(params.get('available_until') or '00:00')
+    except ValueError:
+        date = from_time = until_time = None
+    if date is None or from_time is None or until_time is None:
+        raise InvalidFilter('available_on must be YYYY-MM-DD and available_from/available_until HH:MM')
+    if date < timezone.localdate():
+        raise InvalidFilter('available_on cannot be in the past')
+    
+    # Hour granularity; an end of 00:00 means the end of the day
+    from_hour = from_time.hour
+    until_hour = until_time.hour + (until_time.minute > 0) if until_time != datetime.time(0) else 24
+    return filter_available(queryset, date, from_hour, until_hour)
@@ -0,0 +1,164 @@
+"""Geohash helpers for radius search on properties.
+
+Every property stores the geohash of its coordinates in an indexed column.
+A radius search first prunes candidates to the geohash cells covering the
+search circle (indexed prefix scans) and then applies the exact haversine
+distance to the survivors.
+"""
+import math
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+GEOHASH_PRECISION = 12
+MAX_COVER_CELLS = 16
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate pair as a geohash string"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if longitude >= mid:
+                value = (value << 1) | 1
+                lng_lo = mid
+            else:
+                value <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if latitude >= mid:
+                value = (value << 1) | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return the (lat, lng) size in degrees of a geohash cell"""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """Return (min_lat, max_lat, min_lng, max_lng) enclosing the search circle"""
+    lat_delta = radius_km / KM_PER_DEGREE_LAT
+    min_lat = max(latitude - lat_delta, -90.0)
+    max_lat = min(latitude + lat_delta, 90.0)
+
+    # Longitude degrees shrink with cos(latitude); use the latitude closest to
+    # the pole so the box still covers the whole circle.
+    widest = max(abs(min_lat), abs(max_lat))
+    cos_lat = math.cos(math.radians(widest))
+    if cos_lat < 1e-6:
+        return min_lat, max_lat, -180.0, 180.0
+    lng_delta = min(radius_km / (KM_PER_DEGREE_LAT * cos_lat), 180.0)
+    return min_lat, max_lat, longitude - lng_delta, longitude + lng_delta
+
+
+def _cells_at(precision, box):
+    min_lat, max_lat, min_lng, max_lng = box
+    lat_step, lng_step = cell_size(precision)
+    lat_start = math.floor((min_lat + 90.0) / lat_step)
+    lat_end = math.floor((min(max_lat, 90.0 - 1e-9) + 90.0) / lat_step)
+    lng_start = math.floor((min_lng + 180.0) / lng_step)
+    lng_end = math.floor((max_lng + 180.0) / lng_step)
+    lng_cells = int(min(lng_end - lng_start + 1, round(360.0 / lng_step)))
+    return lat_start, lat_end, lng_start, lng_cells
+
+
+def covering_cells(latitude, longitude, radius_km, max_cells=MAX_COVER_CELLS):
+    """Return the geohash prefixes of the cells covering the search circle.
+
+    Uses the finest precision whose cover stays within ``max_cells`` cells so
+    the candidate set is as tight as possible without an unwieldy query.
+    """
+    box = bounding_box(latitude, longitude, radius_km)
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_start, lat_end, lng_start, lng_cells = _cells_at(precision, box)
+        if (lat_end - lat_start + 1) * lng_cells <= max_cells:
+            break
+
+    lat_step, lng_step = cell_size(precision)
+    cells = set()
+    for lat_index in range(lat_start, lat_end + 1):
+        cell_lat = -90.0 + (lat_index + 0.5) * lat_step
+        for offset in range(lng_cells):
+            cell_lng = -180.0 + ((lng_start + offset) % round(360.0 / lng_step) + 0.5) * lng_step
+            cells.add(encode(cell_lat, cell_lng, precision))
+    return sorted(cells)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in kilometres between two coordinates"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_expression(latitude, longitude, lat_field='latitude', lng_field='longitude'):
+    """ORM expression computing the haversine distance in km to a point"""
+    lat0 = math.radians(latitude)
+    lng0 = math.radians(longitude)
+    half_d_lat = (Radians(F(lat_field)) - Value(lat0)) / Value(2.0)
+    half_d_lng = (Radians(F(lng_field)) - Value(lng0)) / Value(2.0)
+    a = (
+        Power(Sin(half_d_lat), 2)
+        + Value(math.cos(lat0)) * Cos(Radians(F(lat_field))) * Power(Sin(half_d_lng), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(Least(a, Value(1.0))), output_field=FloatField())
+
+
+def prefix_range(prefix):
+    """Q object matching geohashes starting with ``prefix``.
+
+    Expressed as a half-open range rather than LIKE so every backend can
+    serve it as a range scan on the geohash index.
+    """
+    upper = prefix
+    while upper and upper[-1] == _BASE32[-1]:
+        upper = upper[:-1]
+    if not upper:
+        return Q(geohash__gte=prefix)
+    upper = upper[:-1] + _BASE32[_BASE32.index(upper[-1]) + 1]
+    return Q(geohash__gte=prefix, geohash__lt=upper)
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    """Restrict ``queryset`` to rows within ``radius_km`` of the point.
+
+    The result is annotated with ``distance_km`` so callers can order on it.
+    """
+    cells = covering_cells(latitude, longitude, radius_km)
+    cell_filter = Q()
+    for cell in cells:
+        cell_filter |= prefix_range(cell)
+
+    return queryset.filter(cell_filter).annotate(
+        distance_km=haversine_expression(latitude, longitude)
+    ).filter(distance_km__lte=radius_km)
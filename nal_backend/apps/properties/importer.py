@@ -0,0 +1,177 @@
+"""Streaming bulk import of properties from CSV or NDJSON.
+
+Rows are read lazily from the file, validated with ``PropertyCreateSerializer``
+(one serializer instance reused for every row, so its fields are built once)
+and written with ``bulk_create`` in batches, together with their amenity
+mappings. Invalid rows are reported with their line number and skipped; they
+never abort the rest of the batch.
+
+Columns are the ``PropertyCreateSerializer`` fields plus an optional
+``amenities`` column: amenity names separated by ``|`` in CSV, or a list in
+NDJSON. Empty CSV cells are treated as missing values.
+"""
+import csv
+import io
+import json
+
+from django.db import DatabaseError, transaction
+from rest_framework.exceptions import ValidationError
+
+from .amenities import mask_for
+from .models import Property, PropertyAmenity, PropertyAmenityMapping
+from .serializers import PropertyCreateSerializer
+from .signals import properties_bulk_created
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+AMENITY_SEPARATOR = '|'
+
+
+class CountingReader(io.RawIOBase):
+    """Binary stream wrapper that counts the bytes read, for progress"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        self.bytes_read += len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def detect_format(file_name):
+    return 'NDJSON' if file_name.lower().endswith(('.ndjson', '.jsonl')) else 'CSV'
+
+
+def iter_rows(stream, file_format):
+    """Yield ``(line_number, row, error)`` from a binary stream"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'CSV':
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Drop empty cells so optional fields fall back to their defaults
+            yield reader.line_num, {key: value for key, value in row.items() if key and value not in ('', None)}, None
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, None, {'non_field_errors': [f'Invalid JSON: {exc}']}
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, {'non_field_errors': ['Each line must be a JSON object']}
+            continue
+        yield line_number, row, None
+
+
+def parse_amenities(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(AMENITY_SEPARATOR)
+    return [name.strip() for name in value if name and name.strip()]
+
+
+class ImportResult:
+    def __init__(self):
+        self.processed_rows = 0
+        self.created_rows = 0
+        self.failed_rows = 0
+        self.errors = []
+
+    def add_error(self, line_number, errors):
+        self.failed_rows += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': line_number, 'errors': errors})
+
+
+class PropertyImporter:
+    """Validate and insert properties for one owner in batches"""
+
+    def __init__(self, owner, batch_size=DEFAULT_BATCH_SIZE, on_batch=None):
+        self.owner = owner
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+        self.serializer = PropertyCreateSerializer()
+        self.amenities = dict(PropertyAmenity.objects.values_list('name', 'id'))
+        self.amenity_bits = dict(PropertyAmenity.objects.values_list('id', 'bit'))
+        self.result = ImportResult()
+
+    def validate(self, row):
+        """Return ``(property, amenity_ids)`` for a valid row, raising ``ValidationError`` otherwise"""
+        row = dict(row)
+        names = parse_amenities(row.pop('amenities', None))
+        unknown = [name for name in names if name not in self.amenities]
+        data = self.serializer.run_validation(row)
+        if unknown:
+            raise ValidationError({'amenities': [f'Unknown amenity: {name}' for name in unknown]})
+
+        amenity_ids = {self.amenities[name] for name in names}
+        property_obj = Property(owner=self.owner, **data)
+        property_obj.refresh_geohash()
+        # Mappings are bulk inserted without signals, so set the mask here
+        property_obj.amenity_mask = mask_for(self.amenity_bits[amenity_id] for amenity_id in amenity_ids)
+        return property_obj, amenity_ids
+
+    def run(self, rows):
+        batch = []
+        for line_number, row, error in rows:
+            self.result.processed_rows += 1
+            if error is None:
+                try:
+                    batch.append((line_number, *self.validate(row)))
+                except ValidationError as exc:
+                    error = exc.detail
+            if error is not None:
+                self.result.add_error(line_number, error)
+
+            if self.result.processed_rows % self.batch_size == 0:
+                self.flush(batch)
+                batch = []
+        if self.result.processed_rows % self.batch_size:
+            self.flush(batch)
+        return self.result
+
+    def flush(self, batch):
+        if batch:
+            try:
+                self.result.created_rows += self.insert(batch)
+            except DatabaseError as exc:
+                for line_number, _, _ in batch:
+                    self.result.add_error(line_number, {'non_field_errors': [f'Database error: {exc}']})
+        if self.on_batch is not None:
+            self.on_batch(self.result)
+
+    def insert(self, batch):
+        properties = [property_obj for _, property_obj, _ in batch]
+        with transaction.atomic():
+            Property.objects.bulk_create(properties)
+            if any(property_obj.pk is None for property_obj in properties):
+                # Backends that cannot return ids from a bulk insert (MySQL)
+                ids = dict(Property.objects.filter(
+                    uuid__in=[property_obj.uuid for property_obj in properties]
+                ).values_list('uuid', 'id'))
+                for property_obj in properties:
+                    property_obj.pk = ids[property_obj.uuid]
+
+            PropertyAmenityMapping.objects.bulk_create([
+                PropertyAmenityMapping(property_id=property_obj.pk, amenity_id=amenity_id)
+                for _, property_obj, amenity_ids in batch
+                for amenity_id in amenity_ids
+            ])
+            properties_bulk_created.send(sender=Property, properties=properties)
+        return len(properties)
+
+
+def import_file(owner, stream, file_format, batch_size=DEFAULT_BATCH_SIZE, on_batch=None):
+    """Import every row of ``stream`` (a binary file object)"""
+    importer = PropertyImporter(owner, batch_size=batch_size, on_batch=on_batch)
+    return importer.run(iter_rows(stream, file_format))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from nal_backend.apps.properties import export
+
+
+class Command(BaseCommand):
+    help = 'Stream the property catalogue as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(export.FORMATS), default='ndjson')
+        parser.add_argument('--output', help='File to write to (default: stdout)')
+        parser.add_argument(
+            '--updated-since',
+            help='Only export properties changed at or after this ISO 8601 timestamp, whatever their status',
+        )
+        parser.add_argument('--chunk-size', type=int, default=export.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        updated_since = None
+        if options['updated_since']:
+            updated_since = parse_datetime(options['updated_since'])
+            if updated_since is None:
+                raise CommandError('--updated-since must be an ISO 8601 timestamp')
+            if timezone.is_naive(updated_since):
+                updated_since = timezone.make_aware(updated_since)
+
+        started_at = timezone.now()
+        queryset = export.export_queryset(updated_since)
+        chunks = export.stream_export(queryset, options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+
+        # Pass this as --updated-since next time for an incremental export
+        self.stderr.write(f'Export started at {started_at.isoformat()}')
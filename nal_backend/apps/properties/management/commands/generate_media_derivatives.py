@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from nal_backend.apps.properties.models import PropertyMedia
+from nal_backend.apps.properties.tasks import generate_media_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail and responsive variants for property images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Also process images that already have derivatives')
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--sync', action='store_true', help='Render in this process instead of queueing tasks')
+
+    def handle(self, *args, **options):
+        queryset = PropertyMedia.objects.filter(media_type='IMAGE')
+        if not options['all']:
+            queryset = queryset.exclude(metadata__has_key='derivatives')
+        media_ids = list(queryset.order_by('id').values_list('id', flat=True))
+
+        batch_size = options['batch_size']
+        for start in range(0, len(media_ids), batch_size):
+            batch = media_ids[start:start + batch_size]
+            if options['sync']:
+                stats = generate_media_derivatives(batch)
+                self.stdout.write(f"{start + len(batch)}/{len(media_ids)}: {stats}")
+            else:
+                generate_media_derivatives.delay(batch)
+
+        action = 'Processed' if options['sync'] else 'Queued'
+        self.stdout.write(self.style.SUCCESS(f'{action} {len(media_ids)} images'))
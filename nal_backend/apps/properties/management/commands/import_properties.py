@@ -0,0 +1,39 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from nal_backend.apps.properties.importer import DEFAULT_BATCH_SIZE, detect_format, import_file
+
+
+class Command(BaseCommand):
+    help = 'Stream properties from a CSV or NDJSON file into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--owner', required=True, help='Email of the owning seller or agent')
+        parser.add_argument('--format', choices=['csv', 'ndjson'])
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            owner = get_user_model().objects.get(email=options['owner'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['owner']} not found")
+
+        file_format = (options['format'] or detect_format(options['path'])).upper()
+        started = time.monotonic()
+
+        def report_progress(result):
+            self.stdout.write(f'{result.processed_rows} rows processed, {result.failed_rows} failed')
+
+        with open(options['path'], 'rb') as source:
+            result = import_file(owner, source, file_format, options['batch_size'], on_batch=report_progress)
+
+        for error in result.errors:
+            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created_rows} of {result.processed_rows} rows in {elapsed:.1f}s '
+            f'({result.failed_rows} failed)'
+        ))
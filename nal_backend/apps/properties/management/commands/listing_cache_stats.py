@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from nal_backend.apps.properties.cache import cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the property listing cache'
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        ratio = 'n/a' if stats['hit_ratio'] is None else f"{stats['hit_ratio']:.2%}"
+        self.stdout.write(f"hits={stats['hits']} misses={stats['misses']} hit_ratio={ratio}")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from nal_backend.apps.properties import amenities
+from nal_backend.apps.properties.models import Property
+
+
+class Command(BaseCommand):
+    help = 'Assign amenity bits and recompute the amenity mask of every property'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        assigned = amenities.assign_bits()
+
+        batch_size = options['batch_size']
+        property_ids = Property.objects.order_by('id').values_list('id', flat=True)
+        batch = []
+        updated = 0
+        for property_id in property_ids.iterator(chunk_size=batch_size):
+            batch.append(property_id)
+            if len(batch) >= batch_size:
+                updated += amenities.refresh_masks(batch)
+                batch = []
+        if batch:
+            updated += amenities.refresh_masks(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Assigned {assigned} amenity bits, updated {updated} amenity masks'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from nal_backend.apps.properties import facets
+
+
+class Command(BaseCommand):
+    help = 'Recompute the precomputed property facet counts'
+
+    def handle(self, *args, **options):
+        rows = facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} facet count rows'))
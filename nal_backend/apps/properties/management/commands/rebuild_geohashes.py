@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from nal_backend.apps.properties.models import Property
+
+
+class Command(BaseCommand):
+    help = 'Recompute the geohash column for properties with coordinates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Property.objects.exclude(latitude=None).exclude(longitude=None).only(
+            'id', 'latitude', 'longitude', 'geohash'
+        )
+
+        batch = []
+        updated = 0
+        for property_obj in queryset.iterator(chunk_size=batch_size):
+            previous = property_obj.geohash
+            if property_obj.refresh_geohash() != previous:
+                batch.append(property_obj)
+            if len(batch) >= batch_size:
+                Property.objects.bulk_update(batch, ['geohash'])
+                updated += len(batch)
+                batch = []
+
+        if batch:
+            Property.objects.bulk_update(batch, ['geohash'])
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Updated geohash for {updated} properties'))
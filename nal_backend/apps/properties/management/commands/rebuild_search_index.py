@@ -0,0 +1,39 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from nal_backend.apps.properties.cache import invalidate_all
+from nal_backend.apps.properties.models import (
+    Property, PropertySearchDocument, PropertySearchPosting, PropertySearchTerm,
+)
+from nal_backend.apps.properties.search import get_search_backend
+from nal_backend.apps.properties.search.database import STATS_CACHE_KEY, DatabaseSearchBackend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the property full-text search index from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        queryset = Property.objects.filter(status='PUBLISHED').only(
+            'id', 'status', 'title', 'description', 'city', 'address'
+        )
+
+        if isinstance(backend, DatabaseSearchBackend):
+            # Searches keep using the old index until the new one commits,
+            # and a failed rebuild leaves it in place
+            with transaction.atomic():
+                PropertySearchPosting.objects.all().delete()
+                PropertySearchDocument.objects.all().delete()
+                PropertySearchTerm.objects.all().delete()
+                backend.rebuild(queryset, batch_size=options['batch_size'])
+            cache.delete(STATS_CACHE_KEY)
+        else:
+            if hasattr(backend, 'ensure_index'):
+                backend.ensure_index()
+            backend.rebuild(queryset, batch_size=options['batch_size'])
+        invalidate_all()
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {queryset.count()} properties'))
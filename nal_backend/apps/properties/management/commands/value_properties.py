@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from nal_backend.apps.properties.valuation import run_valuation
+
+
+class Command(BaseCommand):
+    help = 'Recompute ribl_score and urgent_sale_value from comparable listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Refit the comparable statistics and value every property',
+        )
+
+    def handle(self, *args, **options):
+        run = run_valuation(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{run.get_mode_display()} valuation: {run.valued_rows} valued, {run.updated_rows} updated'
+        ))
@@ -0,0 +1,300 @@
+"""Image derivatives for property media.
+
+Every IMAGE ``PropertyMedia`` gets a cropped thumbnail and width-bounded
+responsive variants, each as WebP and JPEG. Derivatives are stored content
+addressed under the SHA-256 of the source image, with a manifest written
+last; an image whose manifest already exists is never decoded again, so
+re-uploads of the same photo (or the same photo on several listings) are
+free. The manifest is copied into ``PropertyMedia.metadata['derivatives']``.
+
+Decoding and resizing is CPU bound and runs in a process pool sized by
+``PROPERTY_MEDIA_WORKERS``. Inside a daemonic worker process (Celery's
+prefork pool), where child processes are not allowed, or with zero workers,
+images are rendered in-process instead.
+"""
+import hashlib
+import io
+import ipaddress
+import json
+import logging
+import multiprocessing
+import socket
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .storage import get_media_storage
+
+logger = logging.getLogger(__name__)
+
+# name -> (max width, max height, crop to exactly that size)
+VARIANTS = {
+    'thumb': (320, 240, True),
+    'small': (640, 1280, False),
+    'medium': (1024, 2048, False),
+    'large': (1600, 3200, False),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DEFAULT_FORMAT = 'webp'
+
+FETCH_TIMEOUT = 10
+MAX_SOURCE_BYTES = 25 * 1024 * 1024
+MAX_REDIRECTS = 3
+
+_pool = None
+
+
+class SourceError(Exception):
+    pass
+
+
+def derivative_prefix(digest):
+    return f'derivatives/{digest[:2]}/{digest}'
+
+
+def manifest_key(digest):
+    return f'{derivative_prefix(digest)}/manifest.json'
+
+
+def render_variants(source):
+    """Render every variant of an encoded image; runs in the worker pool"""
+    image = Image.open(io.BytesIO(source))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image.convert('RGBA'), mask=image.convert('RGBA').split()[-1])
+        image = background
+
+    rendered = {'width': image.width, 'height': image.height, 'variants': {}}
+    for name, (width, height, crop) in VARIANTS.items():
+        if crop:
+            variant = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        else:
+            variant = image.copy()
+            variant.thumbnail((width, height), Image.LANCZOS)
+        files = {}
+        for extension, (pil_format, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            variant.save(buffer, pil_format, **options)
+            files[extension] = buffer.getvalue()
+        rendered['variants'][name] = {'width': variant.width, 'height': variant.height, 'files': files}
+    return rendered
+
+
+def _render_or_none(source):
+    try:
+        return render_variants(source)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # Not a decodable image (PIL's UnidentifiedImageError is an OSError)
+        return None
+
+
+def _get_pool():
+    global _pool
+    workers = settings.PROPERTY_MEDIA_WORKERS
+    if workers <= 0 or multiprocessing.current_process().daemon:
+        return None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool
+
+
+def render_many(sources):
+    """Render ``sources`` in the pool; undecodable images come back as ``None``"""
+    pool = _get_pool()
+    if pool is None:
+        return [_render_or_none(source) for source in sources]
+    return list(pool.map(_render_or_none, sources))
+
+
+def public_address(host, port):
+    """Resolve ``host`` and return the address to connect to, refusing non-public ones.
+
+    ``media_url`` comes from users and is fetched from the workers, which can
+    reach internal services and the cloud metadata endpoint.
+    """
+    try:
+        addresses = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError, ValueError) as exc:
+        raise SourceError(f'Could not resolve {host}: {exc}')
+    for *_, sockaddr in addresses:
+        if not ipaddress.ip_address(sockaddr[0].split('%')[0]).is_global:
+            raise SourceError(f'Refusing to fetch from {host}: not a public address')
+    return addresses[0][4][0]
+
+
+class PublicAddressMixin:
+    """Connect to the address ``public_address`` checked rather than resolving again.
+
+    A second lookup could be answered with a private address (DNS rebinding).
+    Only the socket goes to the pinned address; the Host header, SNI and
+    certificate check still use the host name.
+    """
+
+    def _new_conn(self):
+        host = self._dns_host
+        self._dns_host = public_address(host, self.port)
+        try:
+            return super()._new_conn()
+        finally:
+            self._dns_host = host
+
+
+class PublicHTTPConnection(PublicAddressMixin, HTTPConnection):
+    pass
+
+
+class PublicHTTPSConnection(PublicAddressMixin, HTTPSConnection):
+    pass
+
+
+class PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = PublicHTTPConnection
+
+
+class PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = PublicHTTPSConnection
+
+
+class PublicAddressAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': PublicHTTPConnectionPool,
+            'https': PublicHTTPSConnectionPool,
+        }
+
+
+def public_session():
+    session = requests.Session()
+    # A proxy would open the connection itself, past the address check
+    session.trust_env = False
+    session.mount('http://', PublicAddressAdapter())
+    session.mount('https://', PublicAddressAdapter())
+    return session
+
+
+def fetch_source(media_url):
+    """Read the original image, from our own storage when it lives there"""
+    storage = get_media_storage()
+    base_url = storage.url('')
+    if base_url and media_url.startswith(base_url):
+        with storage.open(media_url[len(base_url):], 'rb') as source:
+            data = source.read(MAX_SOURCE_BYTES + 1)
+    else:
+        url = media_url
+        try:
+            with public_session() as session:
+                for _ in range(MAX_REDIRECTS + 1):
+                    # Every redirect target must be http(s) too; addresses are checked on connect
+                    parts = urlsplit(url)
+                    if parts.scheme not in ('http', 'https') or not parts.hostname:
+                        raise SourceError(f'Refusing to fetch {url}: not an http(s) URL')
+                    with session.get(url, timeout=FETCH_TIMEOUT, stream=True, allow_redirects=False) as response:
+                        if response.is_redirect:
+                            url = urljoin(url, response.headers['Location'])
+                            continue
+                        response.raise_for_status()
+                        data = response.raw.read(MAX_SOURCE_BYTES + 1, decode_content=True)
+                        break
+                else:
+                    raise SourceError(f'Could not fetch {media_url}: more than {MAX_REDIRECTS} redirects')
+        except requests.RequestException as exc:
+            raise SourceError(f'Could not fetch {media_url}: {exc}')
+    if len(data) > MAX_SOURCE_BYTES:
+        raise SourceError(f'{media_url} is larger than {MAX_SOURCE_BYTES} bytes')
+    return data
+
+
+def store_derivatives(digest, rendered):
+    """Save rendered files and return the manifest"""
+    storage = get_media_storage()
+    prefix = derivative_prefix(digest)
+    manifest = {'sha256': digest, 'width': rendered['width'], 'height': rendered['height'], 'variants': {}}
+    for name, variant in rendered['variants'].items():
+        entry = {'width': variant['width'], 'height': variant['height']}
+        for extension, data in variant['files'].items():
+            key = storage.save(f'{prefix}/{name}.{extension}', ContentFile(data))
+            entry[extension] = storage.url(key)
+        manifest['variants'][name] = entry
+    # Written last: its presence marks a complete set of derivatives
+    storage.save(manifest_key(digest), ContentFile(json.dumps(manifest).encode()))
+    return manifest
+
+
+def load_manifest(digest):
+    storage = get_media_storage()
+    if not storage.exists(manifest_key(digest)):
+        return None
+    with storage.open(manifest_key(digest), 'rb') as manifest:
+        return json.loads(manifest.read())
+
+
+def process_media(media_list):
+    """Generate (or reuse) derivatives for ``media_list`` and record them.
+
+    Returns counts of rendered, reused and failed images.
+    """
+    stats = {'rendered': 0, 'reused': 0, 'failed': 0}
+    digests = {}
+    sources = {}
+    for media in media_list:
+        try:
+            source = fetch_source(media.media_url)
+        except (SourceError, OSError) as exc:
+            logger.warning(f"Skipping derivatives for media {media.id}: {str(exc)}")
+            stats['failed'] += 1
+            continue
+        digest = hashlib.sha256(source).hexdigest()
+        digests[media.id] = digest
+        sources.setdefault(digest, source)
+
+    manifests = {}
+    pending = []
+    for digest in sources:
+        manifest = load_manifest(digest)
+        if manifest is None:
+            pending.append(digest)
+        else:
+            manifests[digest] = manifest
+            stats['reused'] += 1
+
+    for digest, rendered in zip(pending, render_many([sources[digest] for digest in pending])):
+        if rendered is not None:
+            manifests[digest] = store_derivatives(digest, rendered)
+            stats['rendered'] += 1
+
+    for media in media_list:
+        digest = digests.get(media.id)
+        if digest is None:
+            continue
+        if digest not in manifests:
+            logger.warning(f"Media {media.id} is not a decodable image")
+            stats['failed'] += 1
+            continue
+        media.metadata = {**media.metadata, 'derivatives': manifests[digest]}
+        media.save(update_fields=['metadata'])
+    return stats
+
+
+def variant_url(media, size, image_format=DEFAULT_FORMAT):
+    """URL of a derivative of ``media``, or the original when not generated yet"""
+    return derivative_url(media.media_url, media.metadata, size, image_format)
+
+
+def derivative_url(media_url, metadata, size, image_format=DEFAULT_FORMAT):
+    """``variant_url`` for a media row read with ``values()``"""
+    derivatives = (metadata or {}).get('derivatives')
+    if size and derivatives and size in derivatives['variants']:
+        return derivatives['variants'][size].get(image_format, media_url)
+    return media_url
@@ -1,6 +1,7 @@
 import uuid
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
+from . import geo
 
 class Property(models.Model):
     STATUS_CHOICES = [
@@ -39,16 +40,20 @@ class Property(models.Model):
     pincode = models.CharField(max_length=10)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, default='')
     
     # Property Details
     bedrooms = models.IntegerField(default=0)
     bathrooms = models.IntegerField(default=0)
     area_sqft = models.IntegerField(null=True, blank=True)
     parking_spaces = models.IntegerField(default=0)
+    # Bit ``PropertyAmenity.bit`` is set for every amenity of the property
+    amenity_mask = models.BigIntegerField(default=0)
     
     # Scoring & Valuation
     ribl_score = models.FloatField(null=True, blank=True)
     urgent_sale_value = models.DecimalField(max_digits=18, decimal_places=2, null=True, blank=True)
+    valued_at = models.DateTimeField(null=True, blank=True)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -63,7 +68,27 @@ class Property(models.Model):
             models.Index(fields=['property_type']),
             models.Index(fields=['status']),
             models.Index(fields=['city', 'state']),
+            models.Index(fields=['status', 'geohash']),
+            models.Index(fields=['status', 'created_at', 'id']),
+            models.Index(fields=['status', 'price', 'id']),
+            models.Index(fields=['updated_at']),
+            models.Index(fields=['status', 'amenity_mask']),
         ]
+    
+    def refresh_geohash(self):
+        """Recompute the geohash from the current coordinates"""
+        if self.latitude is None or self.longitude is None:
+            self.geohash = ''
+        else:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+        return self.geohash
+    
+    def save(self, *args, **kwargs):
+        self.refresh_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
 
 class PropertyMedia(models.Model):
     MEDIA_TYPE_CHOICES = [
@@ -84,13 +109,37 @@ class PropertyMedia(models.Model):
         db_table = 'property_media'
 
 class PropertyAmenity(models.Model):
+    # Bits available in the signed 64-bit ``Property.amenity_mask``
+    MASK_BITS = 63
+    BIT_ATTEMPTS = 5
+    
     name = models.CharField(max_length=100, unique=True)
     icon = models.CharField(max_length=50, blank=True)
     category = models.CharField(max_length=50, blank=True)
+    bit = models.PositiveSmallIntegerField(unique=True, null=True, blank=True)
     
     class Meta:
         db_table = 'property_amenities'
         verbose_name_plural = 'Property Amenities'
+    
+    def save(self, *args, **kwargs):
+        if self.bit is not None:
+            return super().save(*args, **kwargs)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'bit'}
+        for attempt in range(self.BIT_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    # Lowest free bit; amenities beyond MASK_BITS go without one. A
+                    # locking read sees the bits concurrent saves committed
+                    used = set(PropertyAmenity.objects.select_for_update().exclude(bit=None).values_list('bit', flat=True))
+                    self.bit = next((bit for bit in range(self.MASK_BITS) if bit not in used), None)
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                # A concurrent save took the bit; any other conflict fails every attempt
+                self.bit = None
+                if attempt == self.BIT_ATTEMPTS - 1:
+                    raise
 
 class PropertyAmenityMapping(models.Model):
     property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='amenities')
@@ -98,4 +147,120 @@ class PropertyAmenityMapping(models.Model):
     
     class Meta:
         db_table = 'property_amenity_mapping'
-        unique_together = ['property', 'amenity']
\ No newline at end of file
+        unique_together = ['property', 'amenity']
+
+class PropertySearchTerm(models.Model):
+    term = models.CharField(max_length=64, unique=True)
+    document_frequency = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'property_search_terms'
+
+class PropertySearchDocument(models.Model):
+    property = models.OneToOneField(Property, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    length = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'property_search_documents'
+
+class PropertySearchPosting(models.Model):
+    term = models.CharField(max_length=64)
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='search_postings')
+    weight = models.FloatField()
+    
+    class Meta:
+        db_table = 'property_search_postings'
+        unique_together = ['property', 'term']
+        indexes = [
+            models.Index(fields=['term', 'property']),
+        ]
+
+class PropertyFacetCount(models.Model):
+    filter_field = models.CharField(max_length=20, blank=True)
+    filter_value = models.CharField(max_length=100, blank=True)
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'property_facet_counts'
+        unique_together = ['filter_field', 'filter_value', 'facet', 'value']
+
+
+class PropertyImportJob(models.Model):
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    FORMAT_CHOICES = [
+        ('CSV', 'CSV'),
+        ('NDJSON', 'NDJSON'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='property_imports')
+    file_format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    storage_key = models.CharField(max_length=500)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    
+    # Progress
+    total_bytes = models.BigIntegerField(default=0)
+    processed_bytes = models.BigIntegerField(default=0)
+    processed_rows = models.IntegerField(default=0)
+    created_rows = models.IntegerField(default=0)
+    failed_rows = models.IntegerField(default=0)
+    errors = models.JSONField(default=list)  # first MAX_REPORTED_ERRORS row errors
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'property_import_jobs'
+        indexes = [
+            models.Index(fields=['owner', 'created_at']),
+        ]
+    
+    @property
+    def progress(self):
+        if self.status == 'COMPLETED':
+            return 1.0
+        if not self.total_bytes:
+            return 0.0
+        return min(self.processed_bytes / self.total_bytes, 1.0)
+
+
+class PropertyValuationStat(models.Model):
+    level = models.CharField(max_length=10)
+    group_key = models.CharField(max_length=150)
+    comparables = models.IntegerField()
+    median_ppsf = models.FloatField()
+    q1_ppsf = models.FloatField()
+    q3_ppsf = models.FloatField()
+    median_price = models.FloatField()
+    
+    class Meta:
+        db_table = 'property_valuation_stats'
+        unique_together = ['level', 'group_key']
+
+class PropertyValuationRun(models.Model):
+    MODE_CHOICES = [
+        ('FULL', 'Full'),
+        ('INCREMENTAL', 'Incremental'),
+    ]
+    
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    valued_rows = models.IntegerField(default=0)
+    updated_rows = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'property_valuation_runs'
+        indexes = [
+            models.Index(fields=['finished_at']),
+        ]
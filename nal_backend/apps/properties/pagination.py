@@ -0,0 +1,160 @@
+"""Pagination for the property listing.
+
+Two modes are supported:
+
+* keyset (``?cursor=``): an opaque cursor encodes the sort keys of the last
+  row so the next page is an indexed seek rather than an OFFSET scan, and no
+  COUNT is run unless the client asks for one;
+* page numbers (``?page=``): the classic paginator, with the total count
+  cached per filter signature or skipped entirely with ``count=none``.
+"""
+import base64
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+# Stable orderings; the trailing id makes every ordering total
+ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+}
+DEFAULT_ORDERING = 'newest'
+
+PAGINATION_PARAMS = frozenset(['page', 'page_size', 'cursor', 'count', 'sort'])
+COUNT_MODES = ('cached', 'exact', 'none')
+COUNT_CACHE_TIMEOUT = 60
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def filter_signature(params, exclude=PAGINATION_PARAMS):
+    """Stable hash of the filtering query parameters"""
+    items = sorted(
+        (key, value.strip())
+        for key in params
+        if key not in exclude
+        for value in params.getlist(key)
+        if value.strip()
+    )
+    return hashlib.sha1(json.dumps(items).encode()).hexdigest()
+
+
+def _parse_key(field, raw):
+    if field == 'created_at':
+        value = parse_datetime(raw)
+        if value is None:
+            raise InvalidCursor(raw)
+        return value
+    if field == 'price':
+        try:
+            return Decimal(raw)
+        except InvalidOperation:
+            raise InvalidCursor(raw)
+    return int(raw)
+
+
+def encode_cursor(sort, row):
+    """Cursor after ``row``, a model instance or a ``values()`` dict"""
+    fields = [key.lstrip('-') for key in ORDERINGS[sort]]
+    keys = [row[field] if isinstance(row, dict) else getattr(row, field) for field in fields]
+    values = [key.isoformat() if field == 'created_at' else str(key) for field, key in zip(fields, keys)]
+    payload = json.dumps({'s': sort, 'k': values}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(sort, cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        fields = [key.lstrip('-') for key in ORDERINGS[sort]]
+        if payload['s'] != sort or len(payload['k']) != len(fields):
+            raise InvalidCursor(cursor)
+        return [_parse_key(field, raw) for field, raw in zip(fields, payload['k'])]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor(cursor)
+
+
+def seek_filter(ordering, values):
+    """Rows strictly after ``values`` in ``ordering`` (a two-key ordering).
+
+    Written as ``k <= v AND (k < v OR id < last_id)`` so the leading key
+    bounds an index range scan.
+    """
+    (key, tie_breaker), (value, last_id) = ordering, values
+    op = 'lt' if key.startswith('-') else 'gt'
+    inclusive = 'lte' if op == 'lt' else 'gte'
+    key, tie_breaker = key.lstrip('-'), tie_breaker.lstrip('-')
+    return Q(**{f'{key}__{inclusive}': value}) & (
+        Q(**{f'{key}__{op}': value}) | Q(**{key: value, f'{tie_breaker}__{op}': last_id})
+    )
+
+
+class KeysetPage:
+    """One page of keyset-paginated rows"""
+
+    def __init__(self, queryset, sort, page_size, cursor=None):
+        self.sort = sort
+        queryset = queryset.order_by(*ORDERINGS[sort])
+        if cursor:
+            queryset = queryset.filter(seek_filter(ORDERINGS[sort], decode_cursor(sort, cursor)))
+
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.object_list = rows[:page_size]
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        return encode_cursor(self.sort, self.object_list[-1])
+
+
+def count_results(queryset, cache_key=None):
+    """Count ``queryset``, reusing a recent count for the same cache key"""
+    if cache_key is None:
+        return queryset.count()
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator whose total count is cached per filter signature"""
+
+    def __init__(self, object_list, per_page, cache_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+
+    @cached_property
+    def count(self):
+        return count_results(self.object_list, self.cache_key)
+
+
+class CountlessPage:
+    """A numbered page that never counts the full result set"""
+
+    def __init__(self, queryset, number, page_size):
+        offset = (number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.number = number
+        self.object_list = rows[:page_size]
+        self._has_next = len(rows) > page_size
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number > 1
@@ -0,0 +1,24 @@
+"""Pluggable full-text search for property listings.
+
+The backend is chosen with the ``PROPERTY_SEARCH_BACKEND`` setting. The
+bundled database backend keeps an inverted index in regular tables; the
+Elasticsearch backend talks to the cluster configured in
+``ELASTICSEARCH_DSL``.
+"""
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .base import BaseSearchBackend, parse_query, tokenize
+
+_backends = {}
+
+
+def get_search_backend():
+    """Return the configured search backend instance"""
+    path = settings.PROPERTY_SEARCH_BACKEND
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+__all__ = ['BaseSearchBackend', 'get_search_backend', 'parse_query', 'tokenize']
@@ -0,0 +1,94 @@
+import re
+from collections import Counter
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERM_LENGTH = 64
+
+STOPWORDS = frozenset([
+    'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it',
+    'of', 'on', 'or', 'the', 'to', 'with',
+])
+
+# Relative importance of each indexed field when computing term frequency
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'city': 2.0,
+    'address': 1.0,
+    'description': 1.0,
+}
+
+
+def tokenize(text):
+    """Split text into lowercase index terms"""
+    if not text:
+        return []
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in TOKEN_RE.findall(text.lower())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+def document_terms(property_obj):
+    """Return the field-weighted term frequencies and length of a property"""
+    frequencies = Counter()
+    length = 0
+    for field, weight in FIELD_WEIGHTS.items():
+        tokens = tokenize(getattr(property_obj, field))
+        length += len(tokens)
+        for token in tokens:
+            frequencies[token] += weight
+    return frequencies, length
+
+
+def parse_query(query):
+    """Split a search query into ``(term, is_prefix)`` pairs.
+
+    The last term is treated as a prefix while the user is still typing it,
+    i.e. unless the query ends with whitespace.
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        return []
+    parsed = [(token, False) for token in tokens]
+    if not query[-1].isspace() and query.lower().rstrip().endswith(tokens[-1]):
+        parsed[-1] = (tokens[-1], True)
+    return parsed
+
+
+class BaseSearchBackend:
+    """Interface implemented by property search backends"""
+
+    def should_index(self, property_obj):
+        return property_obj.status == 'PUBLISHED'
+
+    def index(self, property_obj):
+        """Add or refresh a property in the index"""
+        raise NotImplementedError
+
+    def index_many(self, properties):
+        for property_obj in properties:
+            self.index(property_obj)
+
+    def remove(self, property_id):
+        """Drop a property from the index"""
+        raise NotImplementedError
+
+    def filter_queryset(self, queryset, query):
+        """Restrict ``queryset`` to matches of ``query``.
+
+        The returned queryset is annotated with ``relevance`` (higher is
+        better) so callers can order on it.
+        """
+        raise NotImplementedError
+
+    def rebuild(self, queryset, batch_size=1000):
+        """Reindex every property in ``queryset``"""
+        batch = []
+        for property_obj in queryset.iterator(chunk_size=batch_size):
+            batch.append(property_obj)
+            if len(batch) >= batch_size:
+                self.index_many(batch)
+                batch = []
+        if batch:
+            self.index_many(batch)
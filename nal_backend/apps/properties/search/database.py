@@ -0,0 +1,172 @@
+import math
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+
+from ..models import PropertySearchDocument, PropertySearchPosting, PropertySearchTerm
+from .base import BaseSearchBackend, document_terms, parse_query
+
+STATS_CACHE_KEY = 'property-search:stats'
+STATS_CACHE_TIMEOUT = 300
+
+
+def prefix_upper_bound(prefix):
+    """Smallest string greater than every string starting with ``prefix``"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Inverted index stored in the application database.
+
+    Each posting stores a precomputed BM25 term weight (term frequency
+    saturated with ``k1`` and normalised by document length with ``b``), so a
+    query only has to multiply by the term's IDF and sum per property. The
+    average document length used for normalisation is the one at indexing
+    time, which drifts slowly and is refreshed by ``rebuild_search_index``.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def _stats(self):
+        stats = cache.get(STATS_CACHE_KEY)
+        if stats is None:
+            aggregate = PropertySearchDocument.objects.aggregate(
+                documents=Count('property_id'), average_length=Avg('length')
+            )
+            stats = (aggregate['documents'], aggregate['average_length'] or 0.0)
+            cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TIMEOUT)
+        return stats
+
+    def _weight(self, frequency, length, average_length):
+        norm = 1 - self.b + self.b * (length / average_length if average_length else 1.0)
+        return frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+
+    def _adjust_frequencies(self, deltas):
+        by_delta = defaultdict(list)
+        for term, delta in deltas.items():
+            if delta:
+                by_delta[delta].append(term)
+
+        new_terms = [term for delta, terms in by_delta.items() if delta > 0 for term in terms]
+        if new_terms:
+            PropertySearchTerm.objects.bulk_create(
+                [PropertySearchTerm(term=term) for term in new_terms], ignore_conflicts=True
+            )
+        for delta, terms in by_delta.items():
+            PropertySearchTerm.objects.filter(term__in=terms).update(
+                document_frequency=F('document_frequency') + delta
+            )
+
+    def _previous_terms(self, property_ids):
+        previous = defaultdict(set)
+        postings = PropertySearchPosting.objects.filter(property_id__in=property_ids)
+        for property_id, term in postings.values_list('property_id', 'term'):
+            previous[property_id].add(term)
+        return previous
+
+    def index(self, property_obj):
+        self.index_many([property_obj])
+
+    def index_many(self, properties):
+        indexable = [obj for obj in properties if self.should_index(obj)]
+        removed = [obj.pk for obj in properties if not self.should_index(obj)]
+        if removed:
+            self.remove_many(removed)
+        if not indexable:
+            return
+
+        _, average_length = self._stats()
+        property_ids = [obj.pk for obj in indexable]
+        deltas = Counter()
+        postings = []
+        documents = []
+
+        with transaction.atomic():
+            previous = self._previous_terms(property_ids)
+            for obj in indexable:
+                frequencies, length = document_terms(obj)
+                documents.append(PropertySearchDocument(property_id=obj.pk, length=length))
+                for term, frequency in frequencies.items():
+                    postings.append(PropertySearchPosting(
+                        term=term,
+                        property_id=obj.pk,
+                        weight=self._weight(frequency, length, average_length or length),
+                    ))
+                current = set(frequencies)
+                deltas.update({term: 1 for term in current - previous[obj.pk]})
+                deltas.subtract({term: 1 for term in previous[obj.pk] - current})
+
+            PropertySearchPosting.objects.filter(property_id__in=property_ids).delete()
+            PropertySearchDocument.objects.filter(property_id__in=property_ids).delete()
+            PropertySearchPosting.objects.bulk_create(postings, batch_size=1000)
+            PropertySearchDocument.objects.bulk_create(documents, batch_size=1000)
+            self._adjust_frequencies(deltas)
+
+        if len(indexable) > 1:
+            # Bulk indexing moves the corpus statistics noticeably
+            cache.delete(STATS_CACHE_KEY)
+
+    def remove(self, property_id):
+        self.remove_many([property_id])
+
+    def remove_many(self, property_ids):
+        with transaction.atomic():
+            previous = self._previous_terms(property_ids)
+            deltas = Counter()
+            for terms in previous.values():
+                deltas.subtract({term: 1 for term in terms})
+            PropertySearchPosting.objects.filter(property_id__in=property_ids).delete()
+            PropertySearchDocument.objects.filter(property_id__in=property_ids).delete()
+            self._adjust_frequencies(deltas)
+
+    def _term_q(self, term, prefix, field):
+        if prefix:
+            return Q(**{f'{field}__gte': term, f'{field}__lt': prefix_upper_bound(term)})
+        return Q(**{field: term})
+
+    def _document_frequencies(self, parsed):
+        exact = [term for term, prefix in parsed if not prefix]
+        frequencies = dict(
+            PropertySearchTerm.objects.filter(term__in=exact).values_list('term', 'document_frequency')
+        )
+        for term, prefix in parsed:
+            if prefix:
+                # A prefix expands to several terms; their summed document
+                # frequency is an upper bound that keeps the IDF conservative.
+                frequencies[term] = PropertySearchTerm.objects.filter(
+                    self._term_q(term, True, 'term')
+                ).aggregate(total=Sum('document_frequency'))['total']
+        return frequencies
+
+    def filter_queryset(self, queryset, query):
+        parsed = parse_query(query or '')
+        if not parsed:
+            return queryset.annotate(relevance=Value(0.0, output_field=FloatField()))
+
+        documents, _ = self._stats()
+        frequencies = self._document_frequencies(parsed)
+
+        match = Q()
+        score_cases = []
+        term_cases = []
+        for position, (term, prefix) in enumerate(parsed):
+            condition = self._term_q(term, prefix, 'term')
+            frequency = frequencies.get(term) or 0
+            idf = math.log(1 + (max(documents, frequency) - frequency + 0.5) / (frequency + 0.5))
+            match |= condition
+            score_cases.append(When(condition, then=F('weight') * Value(idf)))
+            term_cases.append(When(condition, then=Value(position)))
+
+        # Score on the narrow postings table alone: every query term has to
+        # match and relevance sums the BM25 contributions per property.
+        matches = PropertySearchPosting.objects.filter(match).values('property_id').annotate(
+            score=Sum(Case(*score_cases, default=Value(0.0), output_field=FloatField())),
+            matched_terms=Count(Case(*term_cases), distinct=True),
+        ).filter(matched_terms=len(parsed))
+
+        return queryset.filter(id__in=matches.values('property_id')).annotate(
+            relevance=Subquery(matches.filter(property_id=OuterRef('pk')).values('score')[:1])
+        )
@@ -0,0 +1,139 @@
+import logging
+
+from django.conf import settings
+from django.db.models import Case, FloatField, Q, Value, When
+
+from .base import FIELD_WEIGHTS, BaseSearchBackend, tokenize
+
+logger = logging.getLogger(__name__)
+
+INDEX_SETTINGS = {
+    'analysis': {
+        'analyzer': {
+            'listing': {
+                'type': 'custom',
+                'tokenizer': 'standard',
+                'filter': ['lowercase', 'asciifolding'],
+            },
+        },
+    },
+}
+
+
+class ElasticsearchSearchBackend(BaseSearchBackend):
+    """Search backend using the cluster configured in ``ELASTICSEARCH_DSL``.
+
+    Elasticsearch ranks the matches; the top ``max_results`` ids are then
+    intersected with the remaining ORM filters of the listing query. While
+    the cluster is unreachable or failing, searches fall back to unranked
+    substring matching in the database.
+    """
+
+    max_results = 1000
+
+    def __init__(self, index_name=None, alias='default'):
+        self.index_name = index_name or getattr(settings, 'PROPERTY_SEARCH_INDEX', 'properties')
+        self.alias = alias
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from elasticsearch import Elasticsearch
+
+            hosts = settings.ELASTICSEARCH_DSL[self.alias]['hosts']
+            if isinstance(hosts, str):
+                hosts = [host if '://' in host else f'http://{host}' for host in hosts.split(',')]
+            self._client = Elasticsearch(hosts)
+        return self._client
+
+    def ensure_index(self):
+        if self.client.indices.exists(index=self.index_name):
+            return
+        self.client.indices.create(
+            index=self.index_name,
+            settings=INDEX_SETTINGS,
+            mappings={
+                'properties': {
+                    field: {'type': 'text', 'analyzer': 'listing'} for field in FIELD_WEIGHTS
+                },
+            },
+        )
+
+    def _document(self, property_obj):
+        return {field: getattr(property_obj, field) or '' for field in FIELD_WEIGHTS}
+
+    def index(self, property_obj):
+        if not self.should_index(property_obj):
+            return self.remove(property_obj.pk)
+        try:
+            self.client.index(index=self.index_name, id=property_obj.pk, document=self._document(property_obj))
+        except Exception as e:
+            logger.error(f"Failed to index property {property_obj.pk}: {str(e)}")
+
+    def index_many(self, properties):
+        from elasticsearch.helpers import bulk
+
+        actions = []
+        for property_obj in properties:
+            if self.should_index(property_obj):
+                actions.append({
+                    '_op_type': 'index',
+                    '_index': self.index_name,
+                    '_id': property_obj.pk,
+                    '_source': self._document(property_obj),
+                })
+            else:
+                actions.append({'_op_type': 'delete', '_index': self.index_name, '_id': property_obj.pk})
+        try:
+            bulk(self.client, actions, raise_on_error=False)
+        except Exception as e:
+            logger.error(f"Bulk indexing of {len(actions)} properties failed: {str(e)}")
+
+    def remove(self, property_id):
+        try:
+            self.client.options(ignore_status=404).delete(index=self.index_name, id=property_id)
+        except Exception as e:
+            logger.error(f"Failed to remove property {property_id} from index: {str(e)}")
+
+    def fallback_queryset(self, queryset, query):
+        """Listings containing every query term in one of the indexed fields"""
+        for term in tokenize(query):
+            matches = Q()
+            for field in FIELD_WEIGHTS:
+                matches |= Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(matches)
+        return queryset.annotate(relevance=Value(0.0, output_field=FloatField()))
+
+    def filter_queryset(self, queryset, query):
+        from elasticsearch import ApiError, TransportError
+
+        try:
+            response = self.client.search(
+                index=self.index_name,
+                query={
+                    'multi_match': {
+                        'query': query,
+                        'type': 'bool_prefix',
+                        'operator': 'and',
+                        'fields': [f'{field}^{weight:g}' for field, weight in FIELD_WEIGHTS.items()],
+                    },
+                },
+                size=self.max_results,
+                source=False,
+            )
+        except (ApiError, TransportError) as e:
+            # Connection failures and timeouts are TransportErrors, error answers ApiErrors
+            logger.error(f"Search for {query!r} failed, falling back to the database: {str(e)}")
+            return self.fallback_queryset(queryset, query)
+        scores = {int(hit['_id']): hit['_score'] for hit in response['hits']['hits']}
+        if not scores:
+            return queryset.none().annotate(relevance=Value(0.0, output_field=FloatField()))
+
+        return queryset.filter(id__in=list(scores)).annotate(
+            relevance=Case(
+                *[When(id=property_id, then=Value(score)) for property_id, score in scores.items()],
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+        )
@@ -1,40 +1,189 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import Property, PropertyMedia, PropertyAmenity
+from .fieldsets import SparseFieldsMixin, only_fields, selected_columns, wants
+from .media import DEFAULT_FORMAT, derivative_url, variant_url
+from .models import Property, PropertyMedia, PropertyAmenity, PropertyImportJob
 
 class PropertyMediaSerializer(serializers.ModelSerializer):
     class Meta:
         model = PropertyMedia
-        fields = ['id', 'media_url', 'media_type', 'is_primary', 'caption', 'created_at']
+        fields = ['id', 'media_url', 'media_type', 'is_primary', 'caption', 'metadata', 'created_at']
+        read_only_fields = ['metadata']
 
 class PropertyAmenitySerializer(serializers.ModelSerializer):
     class Meta:
         model = PropertyAmenity
         fields = ['id', 'name', 'icon', 'category']
 
-class PropertyListSerializer(serializers.ModelSerializer):
+class PropertyListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     primary_image = serializers.SerializerMethodField()
     owner_name = serializers.CharField(source='owner.profile.full_name', read_only=True)
+    distance_km = serializers.SerializerMethodField()
     
     class Meta:
         model = Property
         fields = ['uuid', 'title', 'price', 'currency', 'property_type', 'status',
                  'city', 'state', 'bedrooms', 'bathrooms', 'area_sqft', 
-                 'ribl_score', 'primary_image', 'owner_name', 'created_at']
+                 'ribl_score', 'primary_image', 'owner_name', 'distance_km', 'created_at']
+    
+    RELATED_COLUMNS = {'owner_name': 'owner__profile__full_name'}
+    
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        """Load owners and primary images for a page in a constant number of queries.
+        
+        With ``fields`` only their columns are read and unrequested relations
+        are not loaded at all.
+        """
+        if wants(fields, 'owner_name'):
+            queryset = queryset.select_related('owner__profile')
+        if wants(fields, 'primary_image'):
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'media',
+                    queryset=PropertyMedia.objects.filter(is_primary=True, media_type='IMAGE').order_by('id'),
+                    to_attr='primary_images'
+                )
+            )
+        return only_fields(queryset, fields, cls.RELATED_COLUMNS)
     
     def get_primary_image(self, obj):
-        primary_media = obj.media.filter(is_primary=True, media_type='IMAGE').first()
-        return primary_media.media_url if primary_media else None
+        if hasattr(obj, 'primary_images'):
+            primary_media = obj.primary_images[0] if obj.primary_images else None
+        else:
+            primary_media = obj.media.filter(is_primary=True, media_type='IMAGE').order_by('id').first()
+        if primary_media is None:
+            return None
+        # ``image_size`` selects a generated derivative when one exists
+        return variant_url(
+            primary_media, self.context.get('image_size'), self.context.get('image_format', DEFAULT_FORMAT)
+        )
+    
+    def get_distance_km(self, obj):
+        # Only annotated on radius searches
+        distance = getattr(obj, 'distance_km', None)
+        return round(distance, 3) if distance is not None else None
+
+class FastPropertyListSerializer:
+    """``PropertyListSerializer`` output built straight from ``values()`` rows.
+    
+    Renders to the same JSON without instantiating models, walking
+    ``owner.profile`` or running the per-field serializer machinery. Each
+    field's converter is compiled once from the DRF field itself, replaced
+    by a builtin where the two are equivalent.
+    """
+    # Serializer fields read from a related model
+    SOURCES = {'owner_name': 'owner__profile__full_name'}
+    # Filled in per page rather than read from the row
+    COMPUTED = ('primary_image', 'distance_km')
+    BUILTIN_CONVERTERS = {
+        serializers.CharField: str,
+        serializers.IntegerField: int,
+        serializers.FloatField: float,
+    }
+    _fields = None
+    
+    def __init__(self, rows, context=None):
+        self.rows = rows
+        self.context = context or {}
+    
+    @classmethod
+    def compiled_fields(cls):
+        """``(name, source, converter)`` for every output field, in output order"""
+        if cls._fields is None:
+            fields = []
+            for name, field in PropertyListSerializer().fields.items():
+                if name in cls.COMPUTED:
+                    fields.append((name, name, None))
+                    continue
+                converter = cls.BUILTIN_CONVERTERS.get(type(field), field.to_representation)
+                if isinstance(field, serializers.UUIDField) and field.uuid_format == 'hex_verbose':
+                    converter = str
+                fields.append((name, cls.SOURCES.get(name, name), converter))
+            cls._fields = fields
+        return cls._fields
+    
+    @classmethod
+    def setup_values(cls, queryset, fields=None):
+        """Select exactly the columns the fast path needs for ``fields`` (all when None)"""
+        if fields is None:
+            columns = ['id'] + [source for name, source, _ in cls.compiled_fields() if name not in cls.COMPUTED]
+        else:
+            columns = selected_columns(queryset, fields, cls.SOURCES)
+        if wants(fields, 'distance_km') and 'distance_km' in queryset.query.annotations:
+            columns.append('distance_km')
+        return queryset.prefetch_related(None).values(*columns)
+    
+    def primary_images(self, property_ids):
+        """First primary image URL of each property, as ``setup_eager_loading`` picks it"""
+        image_size = self.context.get('image_size')
+        image_format = self.context.get('image_format', DEFAULT_FORMAT)
+        images = {}
+        media = PropertyMedia.objects.filter(
+            property_id__in=property_ids, is_primary=True, media_type='IMAGE'
+        ).order_by('id').values_list('property_id', 'media_url', 'metadata')
+        for property_id, media_url, metadata in media:
+            if property_id not in images:
+                images[property_id] = derivative_url(media_url, metadata, image_size, image_format)
+        return images
+    
+    @property
+    def data(self):
+        rows = list(self.rows)
+        requested = self.context.get('fields')
+        fields = [field for field in self.compiled_fields() if wants(requested, field[0])]
+        images = self.primary_images([row['id'] for row in rows]) if wants(requested, 'primary_image') else {}
+        results = []
+        for row in rows:
+            item = {}
+            for name, source, converter in fields:
+                if converter is None:
+                    if name == 'primary_image':
+                        item[name] = images.get(row['id'])
+                    else:
+                        distance = row.get('distance_km')
+                        item[name] = round(distance, 3) if distance is not None else None
+                    continue
+                # A missing related row (no profile) reads as None, as in DRF
+                value = row[source]
+                item[name] = None if value is None else converter(value)
+            results.append(item)
+        return results
 
-class PropertyDetailSerializer(serializers.ModelSerializer):
+class PropertyDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     media = PropertyMediaSerializer(many=True, read_only=True)
-    amenities = PropertyAmenitySerializer(many=True, read_only=True)
+    amenities = serializers.SerializerMethodField()
     owner_name = serializers.CharField(source='owner.profile.full_name', read_only=True)
     agent_name = serializers.CharField(source='agent.profile.full_name', read_only=True)
     
     class Meta:
         model = Property
-        fields = '__all__'
+        # Index and bookkeeping columns; ``amenities`` lists the amenities,
+        # ``latitude`` and ``longitude`` give the location
+        exclude = ['amenity_mask', 'geohash', 'valued_at']
         read_only_fields = ['uuid', 'owner', 'ribl_score', 'urgent_sale_value', 'created_at', 'updated_at']
+    
+    RELATED_COLUMNS = {
+        'owner_name': 'owner__profile__full_name',
+        'agent_name': 'agent__profile__full_name',
+    }
+    
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        related = [path for name, path in (('owner_name', 'owner__profile'), ('agent_name', 'agent__profile'))
+                   if wants(fields, name)]
+        if related:
+            queryset = queryset.select_related(*related)
+        if wants(fields, 'media'):
+            queryset = queryset.prefetch_related('media')
+        if wants(fields, 'amenities'):
+            queryset = queryset.prefetch_related('amenities__amenity')
+        return only_fields(queryset, fields, cls.RELATED_COLUMNS)
+    
+    def get_amenities(self, obj):
+        # ``amenities`` holds the mapping rows; expose the amenities themselves
+        amenities = [mapping.amenity for mapping in obj.amenities.all()]
+        return PropertyAmenitySerializer(amenities, many=True).data
 
 class PropertyCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -45,4 +194,12 @@ class PropertyCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         validated_data['owner'] = self.context['request'].user
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+class PropertyImportJobSerializer(serializers.ModelSerializer):
+    progress = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = PropertyImportJob
+        fields = ['uuid', 'file_format', 'status', 'progress', 'processed_rows', 'created_rows',
+                 'failed_rows', 'errors', 'created_at', 'started_at', 'finished_at']
@@ -0,0 +1,118 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from nal_backend.apps.users.models import Profile
+from . import amenities, facets
+from .cache import invalidate_listings
+from .models import Property, PropertyAmenity, PropertyAmenityMapping, PropertyMedia
+from .search import get_search_backend
+from .tasks import generate_media_derivatives
+
+# Sent with ``properties`` after a bulk insert that bypassed the model signals
+properties_bulk_created = Signal()
+
+STATE_FIELDS = ('city', 'property_type', 'status', 'bedrooms', 'price')
+
+
+def property_state(property_obj):
+    return {field: getattr(property_obj, field) for field in STATE_FIELDS}
+
+
+def listing_state(state):
+    return (state['city'], state['property_type'], state['status'])
+
+
+def touch_properties(queryset):
+    """Bump ``updated_at`` so cached detail payloads and ETags go stale"""
+    queryset.update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=Property)
+def remember_listing_state(sender, instance, **kwargs):
+    # Cached pages and facet counts of the listing before this write must
+    # be updated too, e.g. when the city or the status changes.
+    instance._previous_state = None
+    if instance.pk:
+        instance._previous_state = Property.objects.filter(pk=instance.pk).values(*STATE_FIELDS).first()
+
+
+@receiver(post_save, sender=Property)
+def index_property(sender, instance, **kwargs):
+    get_search_backend().index(instance)
+
+
+@receiver(post_save, sender=Property)
+def update_property_listings(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_state', None)
+    current = property_state(instance)
+    facets.record_change(previous, current)
+    invalidate_listings(listing_state(current), *([listing_state(previous)] if previous else []))
+
+
+@receiver(properties_bulk_created, sender=Property)
+def update_bulk_created_listings(sender, properties, **kwargs):
+    states = [property_state(property_obj) for property_obj in properties]
+    get_search_backend().index_many(properties)
+    facets.record_changes([(None, state) for state in states])
+    invalidate_listings(*[listing_state(state) for state in states])
+
+
+@receiver(pre_delete, sender=Property)
+def unindex_property(sender, instance, **kwargs):
+    # Runs before the cascade removes the postings so document
+    # frequencies can still be decremented.
+    get_search_backend().remove(instance.pk)
+
+
+@receiver(post_delete, sender=Property)
+def update_deleted_property_listings(sender, instance, **kwargs):
+    state = property_state(instance)
+    facets.record_change(state, None)
+    invalidate_listings(listing_state(state))
+
+
+@receiver(post_save, sender=PropertyMedia)
+@receiver(post_delete, sender=PropertyMedia)
+def invalidate_media_listings(sender, instance, **kwargs):
+    # Listing pages embed the primary image
+    state = Property.objects.filter(pk=instance.property_id).values(*STATE_FIELDS).first()
+    if state is not None:
+        invalidate_listings(listing_state(state))
+
+
+@receiver(post_save, sender=PropertyMedia)
+def queue_media_derivatives(sender, instance, created, **kwargs):
+    if created and instance.media_type == 'IMAGE':
+        transaction.on_commit(lambda: generate_media_derivatives.delay([instance.id]))
+
+
+@receiver(post_save, sender=PropertyMedia)
+@receiver(post_delete, sender=PropertyMedia)
+def touch_property(sender, instance, **kwargs):
+    touch_properties(Property.objects.filter(pk=instance.property_id))
+
+
+@receiver(post_save, sender=PropertyAmenityMapping)
+@receiver(post_delete, sender=PropertyAmenityMapping)
+def sync_amenity_mask(sender, instance, **kwargs):
+    amenities.refresh_masks([instance.property_id], touch=True)
+    # Listing pages filtered by amenities change with the mask
+    state = Property.objects.filter(pk=instance.property_id).values(*STATE_FIELDS).first()
+    if state is not None:
+        invalidate_listings(listing_state(state))
+
+
+@receiver(post_save, sender=PropertyAmenity)
+def touch_amenity_properties(sender, instance, created, **kwargs):
+    if not created:
+        touch_properties(Property.objects.filter(amenities__amenity=instance))
+
+
+@receiver(post_save, sender=Profile)
+def touch_profile_properties(sender, instance, created, **kwargs):
+    # Detail payloads embed the owner and agent names
+    if not created:
+        touch_properties(Property.objects.filter(Q(owner_id=instance.user_id) | Q(agent_id=instance.user_id)))
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.module_loading import import_string
+
+_storage = None
+
+
+class LocalMediaStorage(FileSystemStorage):
+    """Property media on the local filesystem, for development and tests.
+
+    Keys are content addressed, so saving an existing key keeps the stored
+    file instead of writing a renamed copy.
+    """
+
+    def __init__(self, location=None, base_url=None, **kwargs):
+        # ``location`` left unset follows MEDIA_ROOT
+        super().__init__(location=location, base_url=base_url or settings.PROPERTY_MEDIA_BASE_URL, **kwargs)
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+def get_media_storage():
+    """Return the storage configured by ``PROPERTY_MEDIA_STORAGE``"""
+    global _storage
+    if _storage is None:
+        _storage = import_string(settings.PROPERTY_MEDIA_STORAGE)()
+    return _storage
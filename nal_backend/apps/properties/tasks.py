@@ -0,0 +1,64 @@
+from celery import shared_task
+from django.core.files.storage import default_storage
+from django.utils import timezone
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def import_properties(job_id):
+    """Stream a bulk property import file into the database"""
+    from .importer import CountingReader, import_file
+    from .models import PropertyImportJob
+    
+    try:
+        job = PropertyImportJob.objects.select_related('owner').get(id=job_id)
+    except PropertyImportJob.DoesNotExist:
+        logger.error(f"Import job {job_id} not found")
+        return
+    
+    PropertyImportJob.objects.filter(id=job_id).update(status='RUNNING', started_at=timezone.now())
+    
+    try:
+        with default_storage.open(job.storage_key, 'rb') as source:
+            reader = CountingReader(source)
+            
+            def report_progress(result):
+                PropertyImportJob.objects.filter(id=job_id).update(
+                    processed_bytes=reader.bytes_read,
+                    processed_rows=result.processed_rows,
+                    created_rows=result.created_rows,
+                    failed_rows=result.failed_rows,
+                    errors=result.errors
+                )
+            
+            import_file(job.owner, io.BufferedReader(reader), job.file_format, on_batch=report_progress)
+        
+        PropertyImportJob.objects.filter(id=job_id).update(status='COMPLETED', finished_at=timezone.now())
+        logger.info(f"Property import {job_id} completed")
+        
+    except Exception as e:
+        logger.error(f"Property import {job_id} failed: {str(e)}")
+        PropertyImportJob.objects.filter(id=job_id).update(status='FAILED', finished_at=timezone.now())
+    finally:
+        default_storage.delete(job.storage_key)
+
+@shared_task
+def generate_media_derivatives(media_ids):
+    """Render thumbnails and responsive variants for property images"""
+    from .media import process_media
+    from .models import PropertyMedia
+    
+    media_list = list(PropertyMedia.objects.filter(id__in=media_ids, media_type='IMAGE'))
+    stats = process_media(media_list)
+    logger.info(f"Media derivatives: {stats['rendered']} rendered, {stats['reused']} reused, {stats['failed']} failed")
+    return stats
+
+@shared_task
+def run_property_valuation(full=False):
+    """Recompute ribl_score and urgent_sale_value for changed (or all) properties"""
+    from .valuation import run_valuation
+    
+    run = run_valuation(full=full)
+    return {'mode': run.mode, 'valued_rows': run.valued_rows, 'updated_rows': run.updated_rows}
@@ -0,0 +1,906 @@
+import csv
+import datetime
+import hashlib
+import io
+import json
+import shutil
+import socket
+import tempfile
+from unittest import mock
+import numpy as np
+from PIL import Image
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+from nal_backend.apps.authentication.models import User
+from nal_backend.apps.users.models import Profile
+from . import amenities, export, facets, geo, similarity, valuation
+from .filters import filter_properties
+from .search.database import DatabaseSearchBackend
+from .importer import import_file
+from .media import SourceError, fetch_source, process_media
+from .storage import get_media_storage
+from .models import (
+    Property, PropertyAmenity, PropertyAmenityMapping, PropertyImportJob, PropertyMedia, PropertySearchTerm,
+    PropertyValuationRun, PropertyValuationStat,
+)
+
+
+def create_property(owner, **overrides):
+    data = {
+        'owner': owner,
+        'title': 'Sea view apartment',
+        'description': 'Two bedroom apartment close to the station',
+        'price': '7500000.00',
+        'property_type': 'APARTMENT',
+        'status': 'PUBLISHED',
+        'address': '12 Marine Drive',
+        'city': 'Mumbai',
+        'state': 'Maharashtra',
+        'pincode': '400002',
+        'latitude': 19.0760,
+        'longitude': 72.8777,
+        'bedrooms': 2,
+        'bathrooms': 2,
+        'area_sqft': 950,
+    }
+    data.update(overrides)
+    return Property.objects.create(**data)
+
+
+class PropertyTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email='seller@example.com',
+            username='seller',
+            password='testpass123',
+            role='SELLER'
+        )
+        Profile.objects.create(user=self.owner, full_name='Asha Seller')
+
+
+class GeoSearchTestCase(PropertyTestCase):
+    def test_geohash_maintained_on_save(self):
+        """Test geohash follows the coordinates"""
+        property_obj = create_property(self.owner)
+        self.assertEqual(property_obj.geohash, geo.encode(19.0760, 72.8777))
+        
+        property_obj.latitude = None
+        property_obj.save()
+        self.assertEqual(property_obj.geohash, '')
+    
+    def test_covering_cells_contain_circle(self):
+        """Test the cell cover includes points on the circle boundary"""
+        for lat in (0.5, 19.0, 60.0):
+            cells = geo.covering_cells(lat, 77.0, 10)
+            for bearing_lat, bearing_lng in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+                # Point roughly 9.9 km away along the bearing
+                point_lat = lat + bearing_lat * 9.9 / geo.KM_PER_DEGREE_LAT
+                point_lng = 77.0 + bearing_lng * 9.9 / (geo.KM_PER_DEGREE_LAT * geo.math.cos(geo.math.radians(lat)))
+                point_hash = geo.encode(point_lat, point_lng)
+                self.assertTrue(any(point_hash.startswith(cell) for cell in cells))
+    
+    def test_radius_search_filters_and_sorts_by_distance(self):
+        """Test radius search uses exact distance and orders by it"""
+        near = create_property(self.owner, title='Near', latitude=19.0800, longitude=72.8800)
+        nearer = create_property(self.owner, title='Nearer', latitude=19.0761, longitude=72.8778)
+        # Inside the old bounding box corner but outside the 5 km circle
+        create_property(self.owner, title='Corner', latitude=19.1070, longitude=72.9150)
+        create_property(self.owner, title='Far', latitude=18.5204, longitude=73.8567)
+        
+        url = reverse('list-properties')
+        response = self.client.get(url, {'lat': 19.0760, 'lng': 72.8777, 'radius': 5, 'sort': 'distance'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['data']['properties']
+        self.assertEqual([item['title'] for item in results], [nearer.title, near.title])
+        self.assertLess(results[0]['distance_km'], results[1]['distance_km'])
+    
+    def test_sort_distance_requires_location(self):
+        """Test sort=distance without coordinates is rejected"""
+        url = reverse('list-properties')
+        response = self.client.get(url, {'sort': 'distance'})
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.data['success'])
+
+
+class SearchTestCase(PropertyTestCase):
+    def search(self, q):
+        response = self.client.get(reverse('list-properties'), {'q': q})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['title'] for item in response.data['data']['properties']]
+    
+    def test_search_ranks_title_matches_first(self):
+        """Test title matches outrank description-only matches"""
+        create_property(self.owner, title='Garden villa', description='Quiet street', property_type='VILLA')
+        create_property(self.owner, title='City flat', description='Shared garden at the back')
+        create_property(self.owner, title='Studio', description='No outdoor space')
+        
+        self.assertEqual(self.search('garden'), ['Garden villa', 'City flat'])
+    
+    def test_search_matches_prefix_and_requires_all_terms(self):
+        """Test the last term is prefix matched and all terms must match"""
+        create_property(self.owner, title='Penthouse with terrace', city='Pune')
+        create_property(self.owner, title='Penthouse', city='Mumbai')
+        
+        self.assertEqual(self.search('penthouse pu'), ['Penthouse with terrace'])
+        self.assertEqual(self.search('penth'), ['Penthouse', 'Penthouse with terrace'])
+    
+    def test_index_follows_status_and_delete(self):
+        """Test unpublished and deleted properties leave the index"""
+        property_obj = create_property(self.owner, title='Lake house')
+        self.assertEqual(self.search('lake'), ['Lake house'])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            property_obj.status = 'ARCHIVED'
+            property_obj.save()
+        self.assertEqual(self.search('lake'), [])
+        self.assertEqual(PropertySearchTerm.objects.get(term='lake').document_frequency, 0)
+        
+        property_obj.status = 'PUBLISHED'
+        property_obj.save()
+        property_obj.delete()
+        self.assertEqual(PropertySearchTerm.objects.get(term='lake').document_frequency, 0)
+    
+    
+    def test_failed_rebuild_keeps_index(self):
+        """Test the rebuild command replaces the index in one transaction"""
+        create_property(self.owner, title='Lake house')
+        create_property(self.owner, title='Hill cottage')
+        with mock.patch.object(DatabaseSearchBackend, 'index_many', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                call_command('rebuild_search_index', stdout=io.StringIO())
+        cache.clear()
+        self.assertEqual(self.search('lake'), ['Lake house'])
+        
+        call_command('rebuild_search_index', '--batch-size', '1', stdout=io.StringIO())
+        self.assertEqual(self.search('cottage'), ['Hill cottage'])
+        self.assertEqual(PropertySearchTerm.objects.get(term='lake').document_frequency, 1)
+
+class ListQueryCountTestCase(PropertyTestCase):
+    def test_query_count_does_not_grow_with_page_size(self):
+        """Test list_properties runs a constant number of queries per page"""
+        for index in range(12):
+            property_obj = create_property(self.owner, title=f'Listing {index}')
+            PropertyMedia.objects.create(
+                property=property_obj, media_url=f'https://cdn.example.com/{index}.jpg', is_primary=True
+            )
+            PropertyMedia.objects.create(
+                property=property_obj, media_url=f'https://cdn.example.com/{index}-2.jpg'
+            )
+        
+        url = reverse('list-properties')
+        counts = []
+        for page_size in (2, 12):
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'page_size': page_size})
+            self.assertEqual(len(response.data['data']['properties']), page_size)
+            counts.append(len(queries))
+        
+        self.assertEqual(counts[0], counts[1])
+        first = response.data['data']['properties'][0]
+        self.assertTrue(first['primary_image'].endswith(f"{first['title'].split()[-1]}.jpg"))
+
+
+class FastListSerializerTestCase(PropertyTestCase):
+    def setUp(self):
+        super().setUp()
+        no_profile = User.objects.create_user(email='agent@example.com', username='agent', password='testpass123')
+        imaged = create_property(self.owner, title='Imaged', ribl_score=71.5)
+        PropertyMedia.objects.create(property=imaged, media_url='https://cdn.example.com/a.jpg', is_primary=True, metadata={
+            'derivatives': {'variants': {'thumb': {'webp': 'https://cdn.example.com/a-thumb.webp'}}}
+        })
+        create_property(self.owner, title='No area', area_sqft=None, price='1234567.50', latitude=19.1, longitude=72.9)
+        create_property(no_profile, title='No profile', city='Pune')
+    
+    def responses(self, params):
+        contents = []
+        for fast in (False, True):
+            cache.clear()
+            with override_settings(PROPERTY_LIST_FAST_SERIALIZER=fast):
+                response = self.client.get(reverse('list-properties'), params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            contents.append(response.content)
+        return contents
+    
+    def test_fast_path_renders_identical_json(self):
+        """Test the values() fast path renders byte-identical pages"""
+        for params in ({}, {'image_size': 'thumb'}, {'lat': 19.0760, 'lng': 72.8777, 'radius': 50, 'sort': 'distance'},
+                       {'cursor': '', 'page_size': 2, 'sort': 'price_desc'}):
+            slow, fast = self.responses(params)
+            self.assertEqual(fast, slow)
+            if 'image_size' in params:
+                self.assertIn(b'a-thumb.webp', fast)
+    
+    def test_missing_profile_renders_null_owner_name(self):
+        """Test a listing whose owner has no profile gets a null owner_name on both paths"""
+        slow, fast = self.responses({'city': 'pune'})
+        self.assertEqual(fast, slow)
+        self.assertIn(b'"owner_name":null', fast)
+    
+    def test_fast_path_cursor_follows_on(self):
+        """Test next_cursor from a values() page continues where it left off"""
+        with override_settings(PROPERTY_LIST_FAST_SERIALIZER=True):
+            first = self.client.get(reverse('list-properties'), {'cursor': '', 'page_size': 2})
+            second = self.client.get(reverse('list-properties'), {'cursor': first.data['data']['pagination']['next_cursor'], 'page_size': 2})
+        titles = [item['title'] for page in (first, second) for item in page.data['data']['properties']]
+        self.assertEqual(sorted(titles), ['Imaged', 'No area', 'No profile'])
+
+
+class SparseFieldsTestCase(PropertyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.property = create_property(self.owner, title='Sparse listing')
+        PropertyMedia.objects.create(property=self.property, media_url='https://cdn.example.com/a.jpg', is_primary=True)
+        PropertyAmenityMapping.objects.create(property=self.property, amenity=PropertyAmenity.objects.create(name='Gym'))
+        create_property(self.owner, title='Second listing', price='100.00')
+    
+    def test_list_fields_trim_output_and_columns(self):
+        """Test ?fields= trims list items and never reads unrequested columns or media"""
+        for fast in (False, True):
+            cache.clear()
+            with override_settings(PROPERTY_LIST_FAST_SERIALIZER=fast), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('list-properties'), {'fields': 'uuid,title,price,city'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            for item in response.data['data']['properties']:
+                self.assertEqual(set(item), {'uuid', 'title', 'price', 'city'})
+            sql = ' '.join(query['sql'] for query in queries.captured_queries)
+            self.assertNotIn('description', sql)
+            self.assertNotIn('properties_propertymedia', sql)
+            self.assertNotIn('full_name', sql)
+    
+    def test_list_fields_match_full_payload(self):
+        """Test sparse items equal the same keys of the full payload on both paths"""
+        full = self.client.get(reverse('list-properties')).data['data']['properties']
+        wanted = ['uuid', 'primary_image', 'owner_name', 'created_at']
+        for fast in (False, True):
+            cache.clear()
+            with override_settings(PROPERTY_LIST_FAST_SERIALIZER=fast):
+                response = self.client.get(reverse('list-properties'), {'fields': ','.join(wanted)})
+            self.assertEqual(response.data['data']['properties'],
+                             [{name: item[name] for name in wanted} for item in full])
+    
+    def test_list_cursor_pages_with_fields(self):
+        """Test cursors work when the ordering columns were not requested"""
+        params = {'cursor': '', 'page_size': 1, 'sort': 'price_asc', 'fields': 'title'}
+        first = self.client.get(reverse('list-properties'), params)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(reverse('list-properties'), {**params, 'cursor': first.data['data']['pagination']['next_cursor']})
+        self.assertEqual(len(queries), 1)
+        titles = [page.data['data']['properties'][0]['title'] for page in (first, second)]
+        self.assertEqual(titles, ['Second listing', 'Sparse listing'])
+    
+    def test_detail_fields_skip_relations(self):
+        """Test a sparse detail skips media and amenity prefetches and has its own cache entry"""
+        url = reverse('get-property', args=[self.property.uuid])
+        with CaptureQueriesContext(connection) as queries:
+            sparse = self.client.get(url, {'fields': 'uuid,title,price'})
+        self.assertEqual(set(sparse.data['data']), {'uuid', 'title', 'price'})
+        # Version lookup and the row itself
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('description', queries.captured_queries[-1]['sql'])
+        
+        full = self.client.get(url)
+        self.assertEqual(len(full.data['data']['media']), 1)
+        self.assertEqual([item['name'] for item in full.data['data']['amenities']], ['Gym'])
+        self.assertNotEqual(full['ETag'], sparse['ETag'])
+        
+        amenities_only = self.client.get(url, {'fields': 'amenities'})
+        self.assertEqual(amenities_only.data['data'], {'amenities': full.data['data']['amenities']})
+    
+    def test_unknown_field_rejected(self):
+        """Test unknown field names are a 400 on both endpoints"""
+        response = self.client.get(reverse('list-properties'), {'fields': 'title,description'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for internal in ('amenity_mask', 'geohash', 'valued_at'):
+            response = self.client.get(reverse('get-property', args=[self.property.uuid]), {'fields': internal})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('get-property', args=[self.property.uuid]))
+        self.assertFalse({'amenity_mask', 'geohash', 'valued_at'} & set(response.data['data']))
+
+
+class PaginationTestCase(PropertyTestCase):
+    def setUp(self):
+        super().setUp()
+        for index, price in enumerate([500, 300, 300, 900, 100, 300, 700]):
+            create_property(self.owner, title=f'Listing {index}', price=price)
+    
+    def test_cursor_pages_cover_results_without_count(self):
+        """Test cursor pagination walks every row once and never counts"""
+        url = reverse('list-properties')
+        params = {'cursor': '', 'sort': 'price_asc', 'page_size': 3}
+        seen = []
+        with CaptureQueriesContext(connection) as queries:
+            while True:
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                pagination = response.data['data']['pagination']
+                seen.extend(item['price'] for item in response.data['data']['properties'])
+                self.assertNotIn('count', pagination)
+                if not pagination['has_next']:
+                    break
+                params['cursor'] = pagination['next_cursor']
+        
+        self.assertEqual([float(price) for price in seen], [100, 300, 300, 300, 500, 700, 900])
+        self.assertFalse(any('COUNT(' in query['sql'].upper() for query in queries.captured_queries))
+    
+    def test_invalid_cursor_rejected(self):
+        """Test a tampered cursor returns 400"""
+        response = self.client.get(reverse('list-properties'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_page_size_clamped_and_validated(self):
+        """Test out of range page sizes are clamped and non-integers rejected"""
+        url = reverse('list-properties')
+        for params in ({'page_size': 0}, {'page_size': -5, 'count': 'none'}, {'page_size': 0, 'cursor': ''}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data['data']['properties']), 1)
+        for params in ({'page_size': 'ten'}, {'page': '2.5'}):
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_page_mode_without_count(self):
+        """Test count=none skips the count but still reports has_next"""
+        response = self.client.get(reverse('list-properties'), {'page': 2, 'page_size': 3, 'count': 'none'})
+        pagination = response.data['data']['pagination']
+        
+        self.assertIsNone(pagination['count'])
+        self.assertTrue(pagination['has_next'])
+        self.assertTrue(pagination['has_previous'])
+        self.assertEqual(len(response.data['data']['properties']), 3)
+
+
+class ListingCacheTestCase(PropertyTestCase):
+    def test_repeated_request_served_from_cache(self):
+        """Test an identical request is a cache hit without queries"""
+        create_property(self.owner, title='Cached listing')
+        url = reverse('list-properties')
+        
+        first = self.client.get(url, {'city': 'mumbai'})
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url, {'city': 'mumbai'})
+        
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(len(queries), 0)
+    
+    def test_publish_invalidates_matching_filters_only(self):
+        """Test publishing a listing invalidates the pages that can contain it"""
+        draft = create_property(self.owner, title='Fresh listing', city='Pune', status='DRAFT')
+        create_property(self.owner, title='Villa listing', city='Goa', property_type='VILLA')
+        url = reverse('list-properties')
+        requests = [{}, {'city': 'pun'}, {'property_type': 'APARTMENT'}, {'property_type': 'VILLA'}]
+        for params in requests:
+            self.client.get(url, params)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            draft.status = 'PUBLISHED'
+            draft.save()
+        
+        hits = [self.client.get(url, params)['X-Cache'] for params in requests]
+        self.assertEqual(hits, ['MISS', 'MISS', 'MISS', 'HIT'])
+        titles = [item['title'] for item in self.client.get(url, {'city': 'pun'}).data['data']['properties']]
+        self.assertEqual(titles, ['Fresh listing'])
+    
+    
+    def test_long_city_names_invalidated(self):
+        """Test filters on any part of a long city name, or longer than the namespaced substrings, are invalidated"""
+        city = 'Sri Jayawardenepura Kotte Municipal Council Area, Western Province'
+        draft = create_property(self.owner, title='Far listing', city=city, status='DRAFT')
+        url = reverse('list-properties')
+        requests = [{'city': 'western province'}, {'city': city}, {'city': 'kotte'}]
+        for params in requests:
+            self.client.get(url, params)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            draft.status = 'PUBLISHED'
+            draft.save()
+        
+        for params in requests:
+            response = self.client.get(url, params)
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertEqual([item['title'] for item in response.data['data']['properties']], ['Far listing'])
+
+class AmenityFilterTestCase(PropertyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.gym, self.pool, self.parking = [
+            PropertyAmenity.objects.create(name=name) for name in ('Gym', 'Pool', 'Parking')
+        ]
+        self.all_three = create_property(self.owner, title='All three')
+        self.gym_only = create_property(self.owner, title='Gym only')
+        create_property(self.owner, title='None')
+        for amenity in (self.gym, self.pool, self.parking):
+            PropertyAmenityMapping.objects.create(property=self.all_three, amenity=amenity)
+        PropertyAmenityMapping.objects.create(property=self.gym_only, amenity=self.gym)
+    
+    def titles(self, **params):
+        response = self.client.get(reverse('list-properties'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(item['title'] for item in response.data['data']['properties'])
+    
+    def test_amenities_assigned_distinct_bits(self):
+        """Test each amenity gets its own bit and mappings keep masks in sync"""
+        self.assertEqual(len({self.gym.bit, self.pool.bit, self.parking.bit}), 3)
+        self.all_three.refresh_from_db()
+        self.assertEqual(self.all_three.amenity_mask, amenities.mask_for([self.gym.bit, self.pool.bit, self.parking.bit]))
+    
+    def test_concurrently_taken_bit_is_reassigned(self):
+        """Test an amenity whose bit was taken between the read and the insert gets a free one"""
+        select_for_update = PropertyAmenity.objects.select_for_update
+        reads = []
+        
+        def racing_read():
+            # The first read misses the amenities a concurrent request just committed
+            reads.append(1)
+            return select_for_update().none() if len(reads) == 1 else select_for_update()
+        
+        with mock.patch.object(PropertyAmenity.objects, 'select_for_update', side_effect=racing_read):
+            lift = PropertyAmenity.objects.create(name='Lift')
+        self.assertEqual(len(reads), 2)
+        self.assertEqual(lift.bit, 3)
+        self.assertEqual(PropertyAmenity.objects.filter(bit=lift.bit).count(), 1)
+        
+        with self.assertRaises(IntegrityError):
+            PropertyAmenity.objects.create(name='Gym')
+    
+    def test_filter_requires_every_amenity(self):
+        """Test amenities= keeps properties having all requested amenities"""
+        self.assertEqual(self.titles(amenities='Gym'), ['All three', 'Gym only'])
+        self.assertEqual(self.titles(amenities='Gym,Pool, Parking'), ['All three'])
+        
+        with CaptureQueriesContext(connection) as queries:
+            filter_properties(Property.objects.all(), {'amenities': 'Gym,Pool'}).count()
+        self.assertNotIn('property_amenity_mapping', queries.captured_queries[-1]['sql'])
+    
+    def test_mapping_changes_update_filter_results(self):
+        """Test removing a mapping clears its bit and invalidates cached pages"""
+        self.assertEqual(self.titles(amenities='Pool'), ['All three'])
+        with self.captureOnCommitCallbacks(execute=True):
+            PropertyAmenityMapping.objects.filter(property=self.all_three, amenity=self.pool).delete()
+        self.assertEqual(self.titles(amenities='Pool'), [])
+        self.assertEqual(self.titles(amenities='Gym,Parking'), ['All three'])
+    
+    def test_amenity_without_bit_falls_back_to_join(self):
+        """Test amenities past the mask width are still filtered"""
+        PropertyAmenity.objects.filter(id=self.parking.id).update(bit=None)
+        self.assertEqual(self.titles(amenities='Gym,Parking'), ['All three'])
+    
+    def test_unknown_amenity_rejected(self):
+        """Test an unknown amenity name is a client error"""
+        response = self.client.get(reverse('list-properties'), {'amenities': 'Gym,Helipad'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Helipad', response.data['errors'][0])
+
+
+class PropertyDetailCacheTestCase(PropertyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.property = create_property(self.owner, title='Detail listing')
+        self.url = reverse('get-property', args=[self.property.uuid])
+    
+    def test_conditional_get_returns_not_modified(self):
+        """Test a matching ETag is answered with 304 after a single query"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Last-Modified', response)
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(queries), 1)
+    
+    def test_media_and_amenity_changes_refresh_payload(self):
+        """Test related changes produce a new ETag and payload"""
+        first = self.client.get(self.url)
+        PropertyMedia.objects.create(property=self.property, media_url='https://cdn.example.com/a.jpg')
+        amenity = PropertyAmenity.objects.create(name='Gym')
+        PropertyAmenityMapping.objects.create(property=self.property, amenity=amenity)
+        
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(len(second.data['data']['media']), 1)
+        self.assertEqual([item['name'] for item in second.data['data']['amenities']], ['Gym'])
+    
+    def test_unknown_property_not_found(self):
+        """Test a missing property still returns 404"""
+        response = self.client.get(reverse('get-property', args=['00000000-0000-0000-0000-000000000000']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FacetTestCase(PropertyTestCase):
+    def setUp(self):
+        super().setUp()
+        create_property(self.owner, title='Flat', price='4000000.00', bedrooms=2)
+        create_property(self.owner, title='Big flat', price='12000000.00', bedrooms=6)
+        create_property(self.owner, title='Villa', city='Navi Mumbai', property_type='VILLA', price='30000000.00')
+        create_property(self.owner, title='Pune house', city='Pune', property_type='HOUSE')
+        create_property(self.owner, title='Draft', status='DRAFT')
+    
+    def facets(self, params):
+        response = self.client.get(reverse('property-facets'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['data']
+    
+    def test_precomputed_counts_match_aggregate(self):
+        """Test the incrementally maintained tables agree with a live aggregate"""
+        moved = Property.objects.get(title='Pune house')
+        moved.city = 'Mumbai'
+        moved.save()
+        Property.objects.get(title='Big flat').delete()
+        
+        for params in ({}, {'city': 'mumbai'}, {'property_type': 'APARTMENT'}):
+            data = self.facets(params)
+            self.assertEqual(data['source'], 'precomputed')
+            queryset = filter_properties(Property.objects.filter(status='PUBLISHED'), params)
+            self.assertEqual(data['facets'], facets.aggregate_counts(queryset))
+        
+        self.assertEqual(
+            self.facets({'city': 'mumbai'})['facets']['city'],
+            [{'value': 'Mumbai', 'count': 2}, {'value': 'Navi Mumbai', 'count': 1}]
+        )
+    
+    def test_combined_filters_use_single_aggregate(self):
+        """Test rare filter combinations fall back to one grouped query"""
+        with CaptureQueriesContext(connection) as queries:
+            data = self.facets({'city': 'mumbai', 'min_price': 5000000})
+        
+        self.assertEqual(data['source'], 'aggregate')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(data['facets']['price_band'], [
+            {'value': '1cr_2cr', 'count': 1}, {'value': '2cr_5cr', 'count': 1}
+        ])
+        self.assertEqual(data['facets']['bedrooms'], [{'value': '2', 'count': 1}, {'value': '5+', 'count': 1}])
+    
+    def test_rebuild_matches_incremental_counts(self):
+        """Test a full rebuild reproduces the incremental tables"""
+        before = self.facets({})
+        facets.rebuild()
+        self.assertEqual(self.facets({}), before)
+
+
+IMPORT_CSV = """title,description,price,property_type,address,city,state,pincode,latitude,longitude,bedrooms,amenities
+Lake flat,Near the lake,6500000,APARTMENT,1 Lake Road,Pune,Maharashtra,411001,18.52,73.85,2,Gym|Pool
+Bad price,Broken row,not-a-number,APARTMENT,2 Lake Road,Pune,Maharashtra,411001,,,1,
+Corner plot,Open plot,1500000,PLOT,3 Hill Road,Nashik,Maharashtra,422001,,,,
+Mystery,Unknown amenity,2500000,HOUSE,4 Hill Road,Nashik,Maharashtra,422001,,,3,Helipad
+"""
+
+
+class PropertyImportTestCase(PropertyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        PropertyAmenity.objects.create(name='Gym')
+        PropertyAmenity.objects.create(name='Pool')
+    
+    def test_csv_import_reports_row_errors_without_aborting(self):
+        """Test the import API creates valid rows, mappings and per-row errors"""
+        self.client.force_authenticate(user=self.owner)
+        upload = SimpleUploadedFile('portfolio.csv', IMPORT_CSV.encode(), content_type='text/csv')
+        with override_settings(MEDIA_ROOT=self.media_root):
+            response = self.client.post(reverse('create-property-import'), {'file': upload}, format='multipart')
+        
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = PropertyImportJob.objects.get(uuid=response.data['data']['uuid'])
+        self.assertEqual(job.status, 'COMPLETED')
+        self.assertEqual((job.processed_rows, job.created_rows, job.failed_rows), (4, 2, 2))
+        self.assertEqual([error['row'] for error in job.errors], [3, 5])
+        self.assertIn('price', job.errors[0]['errors'])
+        self.assertIn('amenities', job.errors[1]['errors'])
+        
+        lake = Property.objects.get(title='Lake flat')
+        self.assertEqual(lake.owner, self.owner)
+        self.assertEqual(lake.geohash, geo.encode(18.52, 73.85))
+        self.assertEqual(sorted(lake.amenities.values_list('amenity__name', flat=True)), ['Gym', 'Pool'])
+        self.assertEqual(lake.amenity_mask, amenities.mask_for(PropertyAmenity.objects.values_list('bit', flat=True)))
+        self.assertEqual(Property.objects.get(title='Corner plot').bedrooms, 0)
+        
+        response = self.client.get(reverse('get-property-import', args=[job.uuid]))
+        self.assertEqual(response.data['data']['progress'], 1.0)
+    
+    def test_ndjson_import_in_batches(self):
+        """Test NDJSON rows are inserted in batches with bad lines reported"""
+        lines = [
+            '{"title": "Flat %d", "description": "Flat", "price": "1000000", "property_type": "APARTMENT", '
+            '"address": "Road", "city": "Goa", "state": "Goa", "pincode": "403001"}' % index
+            for index in range(5)
+        ]
+        lines.insert(2, '{not json')
+        batches = []
+        result = import_file(
+            self.owner, io.BytesIO('\n'.join(lines).encode()), 'NDJSON', batch_size=2,
+            on_batch=lambda result: batches.append(result.created_rows)
+        )
+        
+        self.assertEqual((result.created_rows, result.failed_rows), (5, 1))
+        self.assertEqual(result.errors[0]['row'], 3)
+        self.assertEqual(batches, [2, 3, 5])
+        self.assertEqual(Property.objects.filter(city='Goa').count(), 5)
+
+
+def image_bytes(size=(1200, 900), color=(40, 120, 200)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class MediaDerivativeTestCase(PropertyTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.storage = get_media_storage()
+        self.property = create_property(self.owner)
+        self.client.force_authenticate(user=self.owner)
+    
+    def upload(self, data):
+        key = self.storage.save(f'originals/{hashlib.sha1(data).hexdigest()}.jpg', ContentFile(data))
+        url = reverse('upload-property-media', args=[self.property.uuid])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'media_url': self.storage.url(key), 'is_primary': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return PropertyMedia.objects.get(id=response.data['data']['id'])
+    
+    def test_upload_generates_derivatives(self):
+        """Test an uploaded image gets stored variants recorded in its metadata"""
+        media = self.upload(image_bytes())
+        derivatives = media.metadata['derivatives']
+        
+        self.assertEqual((derivatives['width'], derivatives['height']), (1200, 900))
+        self.assertEqual((derivatives['variants']['thumb']['width'], derivatives['variants']['thumb']['height']), (320, 240))
+        self.assertEqual(derivatives['variants']['small']['width'], 640)
+        for variant in derivatives['variants'].values():
+            for image_format in ('webp', 'jpeg'):
+                self.assertTrue(self.storage.exists(variant[image_format][len(self.storage.url('')):]))
+        
+        response = self.client.get(reverse('list-properties'), {'image_size': 'thumb'})
+        self.assertEqual(response.data['data']['properties'][0]['primary_image'], derivatives['variants']['thumb']['webp'])
+    
+    def test_identical_images_are_not_reprocessed(self):
+        """Test a second upload of the same bytes reuses the stored derivatives"""
+        data = image_bytes(color=(200, 30, 30))
+        first = self.upload(data)
+        second = PropertyMedia.objects.create(property=self.property, media_url=first.media_url)
+        
+        self.assertEqual(process_media([second]), {'rendered': 0, 'reused': 1, 'failed': 0})
+        second.refresh_from_db()
+        self.assertEqual(second.metadata['derivatives'], first.metadata['derivatives'])
+    
+    def test_internal_urls_not_fetched(self):
+        """Test media URLs outside our storage must be public http(s) URLs"""
+        for url in ('http://127.0.0.1:8000/admin/', 'http://169.254.169.254/latest/meta-data/',
+                    'http://[::ffff:10.0.0.1]/a.jpg', 'file:///etc/passwd', 'ftp://cdn.example.com/a.jpg'):
+            with self.assertRaises(SourceError):
+                fetch_source(url)
+        
+        media = PropertyMedia.objects.create(property=self.property, media_url='http://10.0.0.5/a.jpg')
+        self.assertEqual(process_media([media]), {'rendered': 0, 'reused': 0, 'failed': 1})
+    
+    def test_fetch_connects_to_checked_address(self):
+        """Test the socket goes to the address that passed the check, not to a second lookup"""
+        public = [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', ('93.184.216.34', 80))]
+        private = [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', ('10.0.0.5', 80))]
+        with mock.patch('socket.getaddrinfo', side_effect=[public, private]), \
+                mock.patch('urllib3.util.connection.create_connection', side_effect=OSError('refused')) as connect:
+            with self.assertRaises(SourceError):
+                fetch_source('http://images.example.com/a.jpg')
+        self.assertEqual(connect.call_args[0][0], ('93.184.216.34', 80))
+        
+        with mock.patch('socket.getaddrinfo', return_value=private), \
+                mock.patch('urllib3.util.connection.create_connection') as connect:
+            with self.assertRaises(SourceError):
+                fetch_source('http://images.example.com/a.jpg')
+        connect.assert_not_called()
+    
+    def test_invalid_image_size_rejected(self):
+        """Test an unknown image_size returns 400"""
+        response = self.client.get(reverse('list-properties'), {'image_size': 'huge'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SimilarPropertiesTestCase(PropertyTestCase):
+    def setUp(self):
+        super().setUp()
+        similarity._index = None  # one index per process; start each test empty
+        self.target = create_property(self.owner, title='Target', price='8000000.00', area_sqft=1000)
+        create_property(self.owner, title='Twin', price='8100000.00', area_sqft=1010, latitude=19.0800, longitude=72.8800)
+        create_property(self.owner, title='Pricier', price='30000000.00', area_sqft=2400, bedrooms=4)
+        create_property(self.owner, title='Far villa', property_type='VILLA', latitude=28.7041, longitude=77.1025)
+        create_property(self.owner, title='Hidden twin', price='8000000.00', area_sqft=1000, status='DRAFT')
+    
+    def similar(self, k=3):
+        response = self.client.get(reverse('similar-properties', args=[self.target.uuid]), {'k': k})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['title'] for item in response.data['data']['properties']]
+    
+    def test_ranks_published_neighbours(self):
+        """Test neighbours are ordered by similarity and exclude the target and drafts"""
+        self.assertEqual(self.similar(), ['Twin', 'Pricier', 'Far villa'])
+        self.assertEqual(self.similar(k=1), ['Twin'])
+    
+    def test_index_follows_listing_changes(self):
+        """Test the incremental refresh picks up published and unpublished listings"""
+        self.similar()
+        create_property(self.owner, title='New twin', price='8000000.00', area_sqft=1000)
+        twin = Property.objects.get(title='Twin')
+        twin.status = 'SOLD'
+        twin.save()
+        
+        similarity.get_similarity_index().refresh(force=True)
+        self.assertEqual(self.similar(k=2), ['New twin', 'Pricier'])
+    
+    def test_batched_queries_match_single_queries(self):
+        """Test a batch of query vectors returns the same neighbours as one at a time"""
+        index = similarity.get_similarity_index()
+        index.refresh()
+        properties = list(Property.objects.filter(status='PUBLISHED'))
+        vectors = index.vectors_for(properties)
+        batched = index.nearest(vectors, 2, exclude_ids=[obj.id for obj in properties])
+        for obj, vector, expected in zip(properties, vectors, batched):
+            self.assertEqual(index.nearest([vector], 2, exclude_ids=[obj.id])[0], expected)
+
+
+class PropertyValuationTestCase(PropertyTestCase):
+    def setUp(self):
+        super().setUp()
+        # Comparables at 8000-12000 INR per sqft in the same geohash cell
+        for ppsf in (8000, 9000, 10000, 11000, 12000):
+            create_property(self.owner, title=f'Sold {ppsf}', price=f'{ppsf * 1000}.00', area_sqft=1000, status='SOLD')
+        self.bargain = create_property(self.owner, title='Bargain', price='7000000.00', area_sqft=1000)
+        self.pricey = create_property(self.owner, title='Pricey', price='14000000.00', area_sqft=1000)
+        self.villa = create_property(self.owner, title='Lone villa', property_type='VILLA')
+    
+    def test_full_run_values_against_comparables(self):
+        """Test prices below the comparable median score above 50 and vice versa"""
+        run = valuation.run_valuation(full=True)
+        self.assertEqual(run.mode, 'FULL')
+        self.assertEqual(run.valued_rows, 8)
+        self.assertTrue(PropertyValuationStat.objects.filter(level='cell5', comparables=7).exists())
+        
+        bargain = Property.objects.get(id=self.bargain.id)
+        pricey = Property.objects.get(id=self.pricey.id)
+        villa = Property.objects.get(id=self.villa.id)
+        self.assertGreater(bargain.ribl_score, 50)
+        self.assertLess(pricey.ribl_score, 50)
+        self.assertLess(bargain.urgent_sale_value, bargain.price)
+        # Market value (10000/sqft) caps the urgent price of an overpriced listing
+        self.assertLessEqual(pricey.urgent_sale_value, 10000000 * (1 - valuation.MIN_URGENT_DISCOUNT))
+        self.assertIsNone(villa.ribl_score)
+        self.assertEqual(bargain.valued_at, bargain.updated_at)
+        self.assertEqual(villa.valued_at, villa.updated_at)
+    
+    def test_incremental_run_only_values_changed_properties(self):
+        """Test an incremental run revalues edited listings and leaves the rest untouched"""
+        valuation.run_valuation(full=True)
+        untouched = Property.objects.get(id=self.pricey.id)
+        before = Property.objects.get(id=self.bargain.id).ribl_score
+        
+        self.bargain.price = '5000000.00'
+        self.bargain.save()
+        with CaptureQueriesContext(connection) as queries:
+            run = valuation.run_valuation()
+        self.assertEqual(run.mode, 'INCREMENTAL')
+        self.assertEqual((run.valued_rows, run.updated_rows), (1, 1))
+        self.assertFalse([query for query in queries.captured_queries if 'property_valuation_stats' in query['sql'] and 'DELETE' in query['sql']])
+        
+        bargain = Property.objects.get(id=self.bargain.id)
+        self.assertGreater(bargain.ribl_score, before)
+        self.assertEqual(bargain.valued_at, bargain.updated_at)
+        self.assertEqual(Property.objects.get(id=self.pricey.id).updated_at, untouched.updated_at)
+        self.assertEqual(valuation.run_valuation().valued_rows, 0)
+    
+    def test_group_quantiles_match_numpy(self):
+        """Test grouped quantiles agree with numpy.percentile per group"""
+        rng = np.random.default_rng(7)
+        codes = rng.integers(0, 6, size=500)
+        values = rng.lognormal(9, 0.4, size=500)
+        q1, median = valuation._group_quantiles(codes, values, np.argsort(values), 6, (0.25, 0.5))
+        for code in range(6):
+            self.assertAlmostEqual(q1[code], np.percentile(values[codes == code], 25))
+            self.assertAlmostEqual(median[code], np.median(values[codes == code]))
+    
+    def test_valuation_task_falls_back_to_full_run(self):
+        """Test the scheduled task does a full run when nothing has been valued yet"""
+        from .tasks import run_property_valuation
+        
+        result = run_property_valuation.delay().get()
+        self.assertEqual(result['mode'], 'FULL')
+        self.assertEqual(PropertyValuationRun.objects.count(), 1)
+
+
+class PropertyExportTestCase(PropertyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(
+            email='data@example.com',
+            username='data',
+            password='testpass123',
+            role='ADMIN'
+        )
+        self.client.force_authenticate(user=self.admin)
+        self.lake = create_property(self.owner, title='Lake flat')
+        for title in ('Hill house', 'City loft', 'Garden villa'):
+            create_property(self.owner, title=title)
+        create_property(self.owner, title='Draft', status='DRAFT')
+        PropertyMedia.objects.create(property=self.lake, media_type='VIDEO', media_url='https://cdn.example.com/tour.mp4')
+        PropertyAmenityMapping.objects.create(property=self.lake, amenity=PropertyAmenity.objects.create(name='Gym'))
+    
+    def export(self, **params):
+        response = self.client.get(reverse('export-properties'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+    
+    def test_ndjson_export_streams_published_listings(self):
+        """Test NDJSON export has one line per published listing with media and amenities"""
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Lake flat', 'Hill house', 'City loft', 'Garden villa'])
+        self.assertEqual(rows[0]['amenities'], ['Gym'])
+        self.assertEqual(rows[0]['media'][0]['media_url'], 'https://cdn.example.com/tour.mp4')
+        self.assertEqual(rows[0]['uuid'], str(self.lake.uuid))
+        self.assertNotIn('id', rows[0])
+    
+    def test_csv_export_flattens_nested_values(self):
+        """Test CSV export has a header row and joined amenities and media"""
+        response, body = self.export(file_format='csv', city='mumbai')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual((rows[0]['amenities'], rows[0]['media_urls']), ('Gym', 'https://cdn.example.com/tour.mp4'))
+        self.assertEqual(rows[1]['amenities'], '')
+    
+    def test_updated_since_includes_unpublished_changes(self):
+        """Test an incremental export returns changed listings of any status"""
+        Property.objects.update(updated_at=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc))
+        sold = Property.objects.get(title='Hill house')
+        sold.status = 'SOLD'
+        sold.save()
+        
+        _, body = self.export(updated_since='2025-01-01T00:00:00Z')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([(row['title'], row['status']) for row in rows], [('Hill house', 'SOLD')])
+        
+        response = self.client.get(reverse('export-properties'), {'updated_since': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_queries_grow_with_chunks_not_rows(self):
+        """Test each chunk costs a fixed number of queries"""
+        with CaptureQueriesContext(connection) as queries:
+            lines = ''.join(export.stream_export(export.export_queryset(), 'ndjson', chunk_size=3)).splitlines()
+        self.assertEqual(len(lines), 4)
+        # Two chunks (3 + 1 rows): properties, media and amenities each
+        self.assertEqual(len(queries), 6)
+    
+    def test_export_requires_admin_or_system_role(self):
+        """Test sellers cannot export the catalogue"""
+        self.client.force_authenticate(user=self.owner)
+        response = self.client.get(reverse('export-properties'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+    
+    def test_export_command(self):
+        """Test the management command writes the same export"""
+        out = io.StringIO()
+        call_command('export_properties', '--format', 'csv', stdout=out, stderr=io.StringIO())
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(out.getvalue())))), 4)
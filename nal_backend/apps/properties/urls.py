@@ -4,7 +4,12 @@ from . import views
 urlpatterns = [
     path('', views.list_properties, name='list-properties'),
     path('create/', views.create_property, name='create-property'),
+    path('facets/', views.property_facets, name='property-facets'),
+    path('export/', views.export_properties, name='export-properties'),
+    path('imports/', views.create_property_import, name='create-property-import'),
+    path('imports/<uuid:job_id>/', views.get_property_import, name='get-property-import'),
     path('<uuid:property_id>/', views.get_property, name='get-property'),
+    path('<uuid:property_id>/similar/', views.similar_properties, name='similar-properties'),
     path('<uuid:property_id>/update/', views.update_property, name='update-property'),
     path('<uuid:property_id>/media/', views.upload_property_media, name='upload-property-media'),
 ]
\ No newline at end of file
@@ -1,99 +1,312 @@
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from django.db.models import Q
-from django.core.paginator import Paginator
-from .models import Property, PropertyMedia
+from . import export, facets
+from .cache import (
+    DETAIL_CACHE_TIMEOUT, ListingCache, cached_listing, detail_cache_key,
+    property_etag, property_last_modified, property_version
+)
+from .fieldsets import InvalidFields, parse_fields
+from .filters import InvalidFilter, active_filters, filter_properties
+from .importer import detect_format
+from .media import DEFAULT_FORMAT, FORMATS, VARIANTS
+from .models import Property, PropertyImportJob, PropertyMedia
+from .pagination import (
+    COUNT_MODES, DEFAULT_ORDERING, MAX_PAGE_SIZE, ORDERINGS, CachedCountPaginator,
+    CountlessPage, InvalidCursor, KeysetPage, count_results, filter_signature
+)
 from .serializers import (
-    PropertyListSerializer, PropertyDetailSerializer, 
-    PropertyCreateSerializer, PropertyMediaSerializer
+    FastPropertyListSerializer, PropertyListSerializer, PropertyDetailSerializer, 
+    PropertyCreateSerializer, PropertyMediaSerializer, PropertyImportJobSerializer
 )
+from .similarity import MAX_SIMILAR, SIMILAR_SLACK, get_similarity_index
+from .tasks import import_properties
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cached_listing
 def list_properties(request):
-    queryset = Property.objects.filter(status='PUBLISHED').select_related('owner__profile')
+    queryset = Property.objects.filter(status='PUBLISHED')
+    
+    try:
+        queryset = filter_properties(queryset, request.GET)
+        fields = parse_fields(request.GET.get('fields'), PropertyListSerializer)
+    except (InvalidFilter, InvalidFields) as exc:
+        return Response({
+            'success': False,
+            'errors': [str(exc)]
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    image_size = request.GET.get('image_size')
+    image_format = request.GET.get('image_format', DEFAULT_FORMAT)
+    if (image_size and image_size not in VARIANTS) or image_format not in FORMATS:
+        return Response({
+            'success': False,
+            'errors': [f'image_size must be one of: {", ".join(VARIANTS)}; image_format one of: {", ".join(FORMATS)}']
+        }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Filters
     q = request.GET.get('q')
-    if q:
-        queryset = queryset.filter(
-            Q(title__icontains=q) | Q(description__icontains=q) | Q(city__icontains=q)
-        )
-    
-    property_type = request.GET.get('property_type')
-    if property_type:
-        queryset = queryset.filter(property_type=property_type)
-    
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    if min_price:
-        queryset = queryset.filter(price__gte=min_price)
-    if max_price:
-        queryset = queryset.filter(price__lte=max_price)
-    
-    city = request.GET.get('city')
-    if city:
-        queryset = queryset.filter(city__icontains=city)
-    
-    bedrooms = request.GET.get('bedrooms')
-    if bedrooms:
-        queryset = queryset.filter(bedrooms__gte=bedrooms)
-    
-    # Location-based search
     lat = request.GET.get('lat')
     lng = request.GET.get('lng')
-    radius = request.GET.get('radius', 10)  # km
     
-    if lat and lng:
-        # Simple bounding box search (for production, use PostGIS)
-        lat_range = float(radius) / 111.0  # Rough conversion
-        lng_range = float(radius) / (111.0 * abs(float(lat)))
-        
-        queryset = queryset.filter(
-            latitude__range=[float(lat) - lat_range, float(lat) + lat_range],
-            longitude__range=[float(lng) - lng_range, float(lng) + lng_range]
-        )
+    sort = request.GET.get('sort')
+    if sort == 'distance':
+        if not (lat and lng):
+            return Response({
+                'success': False,
+                'errors': ['sort=distance requires lat and lng']
+            }, status=status.HTTP_400_BAD_REQUEST)
+        queryset = queryset.order_by('distance_km', 'id')
+    elif q and sort in (None, 'relevance'):
+        queryset = queryset.order_by('-relevance', '-id')
+    else:
+        sort = sort or DEFAULT_ORDERING
+        if sort not in ORDERINGS:
+            return Response({
+                'success': False,
+                'errors': [f'sort must be one of: distance, relevance, {", ".join(ORDERINGS)}']
+            }, status=status.HTTP_400_BAD_REQUEST)
+        queryset = queryset.order_by(*ORDERINGS[sort])
+    
+    # The fast path pages over values() rows instead of model instances
+    fast_serializer = settings.PROPERTY_LIST_FAST_SERIALIZER
+    if fast_serializer:
+        queryset = FastPropertyListSerializer.setup_values(queryset, fields)
+    else:
+        queryset = PropertyListSerializer.setup_eager_loading(queryset, fields)
     
     # Pagination
-    page = int(request.GET.get('page', 1))
-    page_size = int(request.GET.get('page_size', 20))
+    try:
+        page_size = int(request.GET.get('page_size', 20))
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        return Response({
+            'success': False,
+            'errors': ['page and page_size must be integers']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    keyset = 'cursor' in request.GET
+    count_mode = request.GET.get('count', 'none' if keyset else 'cached')
+    if count_mode not in COUNT_MODES:
+        return Response({
+            'success': False,
+            'errors': [f'count must be one of: {", ".join(COUNT_MODES)}']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    count_key = None
+    if count_mode == 'cached':
+        count_key = ListingCache.for_request(request).key('count', filter_signature(request.GET))
     
-    paginator = Paginator(queryset, page_size)
-    properties = paginator.get_page(page)
+    if keyset:
+        # Opaque cursor over a stable ordering; never counts unless asked to
+        if sort not in ORDERINGS:
+            return Response({
+                'success': False,
+                'errors': [f'cursor pagination requires sort to be one of: {", ".join(ORDERINGS)}']
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            properties = KeysetPage(queryset, sort, page_size, request.GET['cursor'])
+        except InvalidCursor:
+            return Response({
+                'success': False,
+                'errors': ['Invalid cursor']
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        pagination = {
+            'next_cursor': properties.next_cursor,
+            'has_next': properties.has_next,
+            'page_size': page_size
+        }
+        if count_mode != 'none':
+            pagination['count'] = count_results(queryset, count_key)
+    else:
+        if count_mode == 'none':
+            properties = CountlessPage(queryset, max(page, 1), page_size)
+            pages = count = None
+        else:
+            paginator = CachedCountPaginator(queryset, page_size, cache_key=count_key)
+            properties = paginator.get_page(page)
+            pages, count = paginator.num_pages, paginator.count
+        
+        pagination = {
+            'page': page,
+            'pages': pages,
+            'count': count,
+            'has_next': properties.has_next(),
+            'has_previous': properties.has_previous()
+        }
     
-    serializer = PropertyListSerializer(properties, many=True)
+    context = {'image_size': image_size, 'image_format': image_format, 'fields': fields}
+    if fast_serializer:
+        serializer = FastPropertyListSerializer(properties.object_list, context=context)
+    else:
+        serializer = PropertyListSerializer(properties.object_list, many=True, context=context)
     
     return Response({
         'success': True,
         'data': {
             'properties': serializer.data,
-            'pagination': {
-                'page': page,
-                'pages': paginator.num_pages,
-                'count': paginator.count,
-                'has_next': properties.has_next(),
-                'has_previous': properties.has_previous()
+            'pagination': pagination
+        }
+    })
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def property_facets(request):
+    filters = active_filters(request.GET)
+    
+    # Unfiltered and single property_type/city requests read the count tables
+    if not filters or (len(filters) == 1 and filters <= set(facets.PRECOMPUTED_FILTERS)):
+        filter_field = next(iter(filters), '')
+        return Response({
+            'success': True,
+            'data': {
+                'facets': facets.precomputed_counts(filter_field, request.GET.get(filter_field, '')),
+                'source': 'precomputed'
             }
+        })
+    
+    try:
+        queryset = filter_properties(Property.objects.filter(status='PUBLISHED'), request.GET)
+    except InvalidFilter as exc:
+        return Response({
+            'success': False,
+            'errors': [str(exc)]
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'success': True,
+        'data': {
+            'facets': facets.aggregate_counts(queryset),
+            'source': 'aggregate'
         }
     })
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_properties(request):
+    """Stream the catalogue as NDJSON or CSV, optionally only rows changed since a timestamp"""
+    if request.user.role not in export.EXPORT_ROLES:
+        return Response({
+            'success': False,
+            'errors': ['Only admin and system accounts can export the catalogue']
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    # Not ``format``, which DRF reserves for renderer selection
+    export_format = request.GET.get('file_format', 'ndjson').lower()
+    if export_format not in export.FORMATS:
+        return Response({
+            'success': False,
+            'errors': [f'file_format must be one of: {", ".join(export.FORMATS)}']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    updated_since = request.GET.get('updated_since')
+    if updated_since:
+        updated_since = parse_datetime(updated_since)
+        if updated_since is None:
+            return Response({
+                'success': False,
+                'errors': ['updated_since must be an ISO 8601 timestamp']
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(updated_since):
+            updated_since = timezone.make_aware(updated_since)
+    
+    try:
+        queryset = filter_properties(export.export_queryset(updated_since or None), request.GET)
+    except InvalidFilter as exc:
+        return Response({
+            'success': False,
+            'errors': [str(exc)]
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Clients pass this back as updated_since for the next incremental export
+    started_at = timezone.now()
+    response = StreamingHttpResponse(
+        export.stream_export(queryset, export_format),
+        content_type=export.FORMATS[export_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="properties.{export_format}"'
+    response['X-Export-Started-At'] = started_at.isoformat()
+    return response
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@condition(etag_func=property_etag, last_modified_func=property_last_modified)
 def get_property(request, property_id):
+    # Conditional requests are answered with 304 from the version check alone
     try:
-        property_obj = Property.objects.select_related('owner__profile', 'agent__profile').get(uuid=property_id)
-        serializer = PropertyDetailSerializer(property_obj)
+        updated_at = property_version(request, property_id)
+        if updated_at is None:
+            raise Property.DoesNotExist
+        fields = parse_fields(request.GET.get('fields'), PropertyDetailSerializer)
+        
+        cache_key = detail_cache_key(property_id, updated_at, fields)
+        data = cache.get(cache_key)
+        if data is None:
+            queryset = PropertyDetailSerializer.setup_eager_loading(Property.objects.all(), fields)
+            data = PropertyDetailSerializer(queryset.get(uuid=property_id), context={'fields': fields}).data
+            cache.set(cache_key, data, DETAIL_CACHE_TIMEOUT)
+        
         return Response({
             'success': True,
-            'data': serializer.data
+            'data': data
         })
+    except InvalidFields as exc:
+        return Response({
+            'success': False,
+            'errors': [str(exc)]
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Property.DoesNotExist:
+        return Response({
+            'success': False,
+            'errors': ['Property not found']
+        }, status=status.HTTP_404_NOT_FOUND)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def similar_properties(request, property_id):
+    try:
+        property_obj = Property.objects.get(uuid=property_id)
     except Property.DoesNotExist:
         return Response({
             'success': False,
             'errors': ['Property not found']
         }, status=status.HTTP_404_NOT_FOUND)
+    
+    try:
+        k = int(request.GET.get('k', 10))
+    except ValueError:
+        k = 0
+    if not 1 <= k <= MAX_SIMILAR:
+        return Response({
+            'success': False,
+            'errors': [f'k must be between 1 and {MAX_SIMILAR}']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Over-fetch so listings unpublished or deleted since the last index
+    # refresh can be dropped without returning a short page
+    neighbours = get_similarity_index().similar_to(property_obj, k + SIMILAR_SLACK)
+    distances = dict(neighbours)
+    queryset = PropertyListSerializer.setup_eager_loading(
+        Property.objects.filter(id__in=distances, status='PUBLISHED')
+    )
+    similar = sorted(queryset, key=lambda obj: distances[obj.id])[:k]
+    serializer = PropertyListSerializer(similar, many=True)
+    
+    return Response({
+        'success': True,
+        'data': {
+            'properties': serializer.data
+        }
+    })
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -150,12 +363,10 @@ def upload_property_media(request, property_id):
     try:
         property_obj = Property.objects.get(uuid=property_id, owner=request.user)
         
-        media_data = request.data.copy()
-        media_data['property'] = property_obj.id
-        
-        serializer = PropertyMediaSerializer(data=media_data)
+        serializer = PropertyMediaSerializer(data=request.data)
         if serializer.is_valid():
-            media = serializer.save()
+            # Images get their derivatives generated once the upload commits
+            serializer.save(property=property_obj)
             return Response({
                 'success': True,
                 'data': serializer.data
@@ -170,4 +381,58 @@ def upload_property_media(request, property_id):
         return Response({
             'success': False,
             'errors': ['Property not found or access denied']
-        }, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        }, status=status.HTTP_404_NOT_FOUND)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_property_import(request):
+    """Upload a CSV/NDJSON file of properties to import in the background"""
+    if request.user.role not in ['SELLER', 'AGENT']:
+        return Response({
+            'success': False,
+            'errors': ['Only sellers and agents can import properties']
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({
+            'success': False,
+            'errors': ['file is required']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    file_format = request.data.get('format', detect_format(upload.name)).upper()
+    if file_format not in dict(PropertyImportJob.FORMAT_CHOICES):
+        return Response({
+            'success': False,
+            'errors': ['format must be CSV or NDJSON']
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    storage_key = default_storage.save(f"imports/{request.user.uuid}/{uuid.uuid4()}.{file_format.lower()}", upload)
+    job = PropertyImportJob.objects.create(
+        owner=request.user,
+        file_format=file_format,
+        storage_key=storage_key,
+        total_bytes=upload.size
+    )
+    import_properties.delay(job.id)
+    job.refresh_from_db()
+    
+    return Response({
+        'success': True,
+        'data': PropertyImportJobSerializer(job).data
+    }, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_property_import(request, job_id):
+    try:
+        job = PropertyImportJob.objects.get(uuid=job_id, owner=request.user)
+        return Response({
+            'success': True,
+            'data': PropertyImportJobSerializer(job).data
+        })
+    except PropertyImportJob.DoesNotExist:
+        return Response({
+            'success': False,
+            'errors': ['Import job not found']
+        }, status=status.HTTP_404_NOT_FOUND)
@@ -1,8 +1,11 @@
 import os
+import sys
 from pathlib import Path
+from celery.schedules import crontab
 from decouple import config
 
 BASE_DIR = Path(__file__).resolve().parent.parent
+TESTING = 'pytest' in sys.modules or (len(sys.argv) > 1 and sys.argv[1] == 'test')
 
 # Security
 SECRET_KEY = config('SECRET_KEY', default='your-secret-key-change-in-production')
@@ -112,6 +115,16 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Property media derivatives (S3 via django-storages, or LocalMediaStorage under MEDIA_ROOT)
+PROPERTY_MEDIA_STORAGE = config(
+    'PROPERTY_MEDIA_STORAGE',
+    default='storages.backends.s3boto3.S3Boto3Storage'
+)
+PROPERTY_MEDIA_BASE_URL = config('PROPERTY_MEDIA_BASE_URL', default='http://localhost:8000/media/')
+PROPERTY_MEDIA_WORKERS = config('PROPERTY_MEDIA_WORKERS', default=2, cast=int)
+if TESTING:
+    PROPERTY_MEDIA_STORAGE = 'nal_backend.apps.properties.storage.LocalMediaStorage'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -140,6 +153,32 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# Cache (Redis, with local memory when running the test suite)
+if TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'availability': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'availability',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': config('CACHE_REDIS_URL', default='redis://localhost:6379/1'),
+            'KEY_PREFIX': 'nal',
+        },
+        # Booking slot occupancy (see bookings.occupancy)
+        'availability': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': config('CACHE_REDIS_URL', default='redis://localhost:6379/1'),
+            'KEY_PREFIX': 'nal',
+        }
+    }
+
 # Celery Configuration
 CELERY_BROKER_URL = config('REDIS_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://localhost:6379/0')
@@ -147,6 +186,37 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ALWAYS_EAGER = TESTING  # run tasks inline under the test suite
+CELERY_BEAT_SCHEDULE = {
+    'value-changed-properties': {
+        'task': 'nal_backend.apps.properties.tasks.run_property_valuation',
+        'schedule': crontab(minute='*/15'),
+    },
+    'value-all-properties': {
+        'task': 'nal_backend.apps.properties.tasks.run_property_valuation',
+        'schedule': crontab(hour=2, minute=30),
+        'kwargs': {'full': True},
+    },
+    'materialize-booking-slots': {
+        'task': 'nal_backend.apps.bookings.tasks.materialize_booking_slots',
+        'schedule': crontab(hour=1, minute=0),
+    },
+    'process-webhook-events': {
+        'task': 'nal_backend.apps.payments.tasks.process_webhook_events',
+        'schedule': 5.0,
+    },
+    'prune-idempotency-keys': {
+        'task': 'nal_backend.apps.payments.tasks.prune_idempotency_keys',
+        'schedule': crontab(hour=3, minute=15),
+    },
+}
+
+# Payment gateway; payments are simulated until PAYMENT_GATEWAY_ENABLED is set
+PAYMENT_GATEWAY_ENABLED = config('PAYMENT_GATEWAY_ENABLED', default=False, cast=bool)
+RAZORPAY_API_URL = config('RAZORPAY_API_URL', default='https://api.razorpay.com/v1')
+RAZORPAY_KEY_ID = config('RAZORPAY_KEY_ID', default='')
+RAZORPAY_KEY_SECRET = config('RAZORPAY_KEY_SECRET', default='')
+RAZORPAY_WEBHOOK_SECRET = config('RAZORPAY_WEBHOOK_SECRET', default='')
 
 # AWS S3 Configuration
 AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID', default='')
@@ -163,6 +233,17 @@ ELASTICSEARCH_DSL = {
     },
 }
 
+# Property search backend: the bundled database inverted index, or
+# 'nal_backend.apps.properties.search.elastic.ElasticsearchSearchBackend'
+PROPERTY_SEARCH_BACKEND = config(
+    'PROPERTY_SEARCH_BACKEND',
+    default='nal_backend.apps.properties.search.database.DatabaseSearchBackend'
+)
+PROPERTY_SEARCH_INDEX = config('PROPERTY_SEARCH_INDEX', default='properties')
+
+# Serialize listing pages from values() rows instead of model instances
+PROPERTY_LIST_FAST_SERIALIZER = config('PROPERTY_LIST_FAST_SERIALIZER', default=False, cast=bool)
+
 # API Documentation
 SPECTACULAR_SETTINGS = {
     'TITLE': 'NAL India API',